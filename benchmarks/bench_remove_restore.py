@@ -0,0 +1,201 @@
+"""
+Benchmarks of each stage of the remove-restore pipeline
+"""
+
+import os
+import sys
+import tempfile
+
+from pygmt import blockmedian, grdtrack
+
+from pycascadia import kernels
+from pycascadia.grid import Grid
+from pycascadia.remove_restore import (
+    apply_diff_grid,
+    calc_diff_grid,
+    load_base_grid,
+    main,
+    nearneighbour,
+    update_footprint,
+)
+from pycascadia.utility import min_regions
+
+from .synthetic import grid_sizes, write_synthetic_grids
+
+NODATA_VAL = 9999
+WINDOW_WIDTH = 0.01
+
+
+def synthetic_grid_directory() -> str:
+    """Directory in which synthetic grids are cached between benchmarks."""
+    directory = os.path.abspath("synthetic_grids")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+class DiffGridStages:
+    """Times each stage of calc_diff_grid for a single update grid."""
+
+    params = grid_sizes()
+    param_names = ["n_cells"]
+    timeout = 3600
+
+    def setup_cache(self):
+        directory = synthetic_grid_directory()
+        for n_cells in grid_sizes():
+            write_synthetic_grids(directory, n_cells)
+        return directory
+
+    def setup(self, directory, n_cells):
+        self.base_fname, (self.update_fname,) = write_synthetic_grids(
+            directory, n_cells
+        )
+        self.base_grid = load_base_grid(self.base_fname)
+        self.update_grid = Grid(self.update_fname, convert_to_xyz=True)
+
+        # Inputs of each stage, as calculated by calc_diff_grid
+        self.max_spacing = max(self.update_grid.spacing, self.base_grid.spacing)
+        self.minimal_region = min_regions(self.update_grid.region, self.base_grid.region)
+        self.region = update_footprint(
+            self.base_grid, self.minimal_region, self.max_spacing, WINDOW_WIDTH
+        )
+        self.bmd = blockmedian(
+            self.update_grid.xyz, spacing=self.max_spacing, region=self.minimal_region
+        )
+        base_pts = grdtrack(self.bmd, self.base_grid.grid, "base_z", interpolation="l")
+        self.diff = base_pts[["x", "y"]].copy()
+        self.diff["z"] = base_pts["z"] - base_pts["base_z"]
+        self.diff_grid = self.nearneighbour()
+        self.final_diff_grid = calc_diff_grid(
+            self.base_grid, self.update_grid, window_width=WINDOW_WIDTH
+        )
+
+    def nearneighbour(self):
+        return nearneighbour(
+            self.diff,
+            region=self.region,
+            spacing=self.base_grid.spacing,
+            S=2 * self.max_spacing,
+            N=4,
+            E=NODATA_VAL,
+        )
+
+    def time_load(self, directory, n_cells):
+        Grid(self.update_fname)
+
+    def time_as_xyz(self, directory, n_cells):
+        self.update_grid.as_xyz()
+
+    def time_blockmedian(self, directory, n_cells):
+        blockmedian(
+            self.update_grid.xyz, spacing=self.max_spacing, region=self.minimal_region
+        )
+
+    def time_grdtrack(self, directory, n_cells):
+        grdtrack(self.bmd, self.base_grid.grid, "base_z", interpolation="l")
+
+    def time_nearneighbour(self, directory, n_cells):
+        self.nearneighbour()
+
+    def time_native_blockmedian(self, directory, n_cells):
+        kernels.blockmedian(
+            self.update_grid.xyz, spacing=self.max_spacing, region=self.minimal_region
+        )
+
+    def time_blockmedian_grid(self, directory, n_cells):
+        kernels.blockmedian_grid(
+            self.update_grid.grid,
+            self.update_grid.spacing,
+            spacing=self.max_spacing,
+            region=self.minimal_region,
+        )
+
+    def time_native_grdtrack(self, directory, n_cells):
+        kernels.grdtrack(self.bmd, self.base_grid.grid, "base_z")
+
+    def time_native_nearneighbour(self, directory, n_cells):
+        kernels.nearneighbour(
+            self.diff,
+            region=self.region,
+            spacing=self.base_grid.spacing,
+            radius=2 * self.max_spacing,
+            nodata=NODATA_VAL,
+        )
+
+    def time_window_filter(self, directory, n_cells):
+        # Tapered in place, so each run tapers a fresh copy
+        kernels.taper(
+            self.diff_grid.values.copy(),
+            NODATA_VAL,
+            WINDOW_WIDTH,
+            self.base_grid.spacing,
+            self.base_grid.spacing,
+        )
+
+    def time_apply(self, directory, n_cells):
+        apply_diff_grid(self.base_grid, self.final_diff_grid)
+
+    def time_calc_diff_grid(self, directory, n_cells):
+        calc_diff_grid(self.base_grid, self.update_grid, window_width=WINDOW_WIDTH)
+
+    def peakmem_calc_diff_grid(self, directory, n_cells):
+        calc_diff_grid(self.base_grid, self.update_grid, window_width=WINDOW_WIDTH)
+
+    def time_calc_diff_grid_native(self, directory, n_cells):
+        calc_diff_grid(
+            self.base_grid,
+            self.update_grid,
+            window_width=WINDOW_WIDTH,
+            backend="native",
+        )
+
+    def peakmem_calc_diff_grid_native(self, directory, n_cells):
+        calc_diff_grid(
+            self.base_grid,
+            self.update_grid,
+            window_width=WINDOW_WIDTH,
+            backend="native",
+        )
+
+
+class RemoveRestore:
+    """Times the full remove-restore command line tool as the number of update grids grows."""
+
+    params = (grid_sizes(), [1, 10, 100])
+    param_names = ["n_cells", "n_sources"]
+    timeout = 7200
+
+    def setup_cache(self):
+        directory = synthetic_grid_directory()
+        for n_cells in grid_sizes():
+            for n_sources in self.params[1]:
+                write_synthetic_grids(directory, n_cells, n_sources)
+        return directory
+
+    def setup(self, directory, n_cells, n_sources):
+        self.base_fname, self.update_fnames = write_synthetic_grids(
+            directory, n_cells, n_sources
+        )
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def teardown(self, directory, n_cells, n_sources):
+        self.output_dir.cleanup()
+
+    def run_main(self):
+        output_fname = os.path.join(self.output_dir.name, "output.nc")
+        sys.argv = [
+            "remove-restore",
+            "--base",
+            self.base_fname,
+            "--output",
+            output_fname,
+            "--window_width",
+            str(WINDOW_WIDTH),
+        ] + self.update_fnames
+        main()
+
+    def time_main(self, directory, n_cells, n_sources):
+        self.run_main()
+
+    def peakmem_main(self, directory, n_cells, n_sources):
+        self.run_main()
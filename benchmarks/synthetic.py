@@ -0,0 +1,95 @@
+"""
+Generation of synthetic base and update grids for benchmarking
+"""
+
+import math
+import os
+
+import numpy as np
+import xarray as xr
+
+# Grid sizes (number of nodes in the base grid) to benchmark
+GRID_SIZES = [10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+
+# Sizes above this (set through the environment) are skipped, e.g. for quick local runs
+MAX_GRID_SIZE = int(float(os.environ.get("PYCASCADIA_BENCH_MAX_CELLS", 10 ** 8)))
+
+BASE_SPACING = 1e-3
+
+
+def grid_sizes() -> list:
+    """Grid sizes to benchmark, limited by `PYCASCADIA_BENCH_MAX_CELLS`."""
+    return [size for size in GRID_SIZES if size <= MAX_GRID_SIZE]
+
+
+def synthetic_grid(region: list, spacing: float, seed: int = 0) -> xr.DataArray:
+    """Creates a smooth bathymetry-like surface with some noise.
+
+    Args:
+        region: Bounding box in format [xmin, xmax, ymin, ymax].
+        spacing: Grid spacing.
+        seed: Seed of the noise.
+
+    Returns:
+        Grid as xarray array.
+    """
+    x = region[0] + spacing * np.arange(round((region[1] - region[0]) / spacing) + 1)
+    y = region[2] + spacing * np.arange(round((region[3] - region[2]) / spacing) + 1)
+    rng = np.random.default_rng(seed)
+
+    z = -1000.0 + 500.0 * np.sin(10.0 * y)[:, np.newaxis] * np.cos(10.0 * x)
+    z = z.astype("float32")
+    z += rng.normal(scale=5.0, size=z.shape).astype("float32")
+
+    return xr.DataArray(z, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+
+
+def base_region(n_cells: int) -> list:
+    """Square region holding roughly `n_cells` base grid nodes."""
+    width = (int(math.sqrt(n_cells)) - 1) * BASE_SPACING
+    return [0.0, width, 0.0, width]
+
+
+def update_regions(n_cells: int, n_sources: int) -> list:
+    """Regions of `n_sources` update grids along the diagonal of the base grid.
+
+    Together the update grids cover a quarter of the base grid, at half its spacing,
+    so they hold roughly as many nodes as the base grid.
+    """
+    width = base_region(n_cells)[1]
+    source_width = width / (2 * n_sources)
+    regions = []
+    for i in range(n_sources):
+        offset = width / 4 + i * source_width
+        regions.append(
+            [offset, offset + source_width, offset, offset + source_width]
+        )
+    return regions
+
+
+def write_synthetic_grids(directory: str, n_cells: int, n_sources: int = 1) -> tuple:
+    """Writes a synthetic base grid and update grids to netcdf files.
+
+    Args:
+        directory: Directory in which to write the grids.
+        n_cells: Approximate number of nodes in the base grid.
+        n_sources: Number of update grids.
+
+    Returns:
+        - Filename of the base grid.
+        - Filenames of the update grids.
+    """
+    base_fname = os.path.join(directory, f"base_{n_cells}.nc")
+    if not os.path.exists(base_fname):
+        synthetic_grid(base_region(n_cells), BASE_SPACING).to_netcdf(base_fname)
+
+    update_fnames = []
+    for i, region in enumerate(update_regions(n_cells, n_sources)):
+        fname = os.path.join(directory, f"update_{n_cells}_{n_sources}_{i}.nc")
+        if not os.path.exists(fname):
+            update_grid = synthetic_grid(region, BASE_SPACING / 2, seed=i + 1)
+            # Shift the update grid so there is a difference to apply
+            (update_grid + 10.0).to_netcdf(fname)
+        update_fnames.append(fname)
+
+    return base_fname, update_fnames
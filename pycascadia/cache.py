@@ -0,0 +1,206 @@
+"""
+On-disk cache of difference grids, allowing remove-restore to be rerun incrementally
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import xarray as xr
+from typing import Tuple
+
+from pycascadia.grid import Grid
+from pycascadia.index import FootprintIndex
+from pycascadia.utility import (
+    expand_region,
+    min_regions,
+    is_region_valid,
+    region_to_slices,
+)
+
+# Incremented whenever the calculation of difference grids changes, invalidating old entries
+CACHE_VERSION = 3
+
+
+def base_read_region(
+    base_grid: Grid, source_region: list, block_region: list = None
+) -> list:
+    """Finds the region of the base grid whose values calc_diff_grid reads for an update grid.
+
+    Only the base grid nodes surrounding the block medians of the update grid are read;
+    the rest of the difference grid depends only on the base grid's coordinates.
+
+    Args:
+        base_grid: Base grid.
+        source_region: Region of the update grid.
+        block_region: Region in which the update grid is blockmedianed, if not the
+            intersection of the update and base grid regions.
+
+    Returns:
+        Region of the base grid which is read.
+    """
+    if block_region is None:
+        block_region = min_regions(source_region, base_grid.region)
+    return expand_region(block_region, base_grid.spacing)
+
+
+class DiffCache:
+    """DiffCache stores the difference grid calculated for each update grid.
+
+    Each difference grid is stored under a key hashing everything it depends on:
+
+    - the contents of the update grid file,
+    - the values and coordinates of the part of the base grid it was calculated from,
+    - the region and spacing of the base grid,
+    - the parameters of the calculation.
+
+    A rerun in which the base grid and most update grids are unchanged can therefore
+    reuse their difference grids. As the key covers the base grid as already updated by
+    earlier update grids, only the update grids affected by a changed one are recalculated.
+
+    The cache is bounded in size. Once it is full, the least recently used entries are removed.
+    """
+
+    def __init__(
+        self, cache_dir: str, max_size: float = None, index: FootprintIndex = None
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            cache_dir: Directory in which difference grids are stored. Created if it does not exist.
+            max_size: Optional maximum total size of the stored difference grids, in bytes.
+            index: Optional index in which the hashes of update grid files are kept.
+                Defaults to an index persisted in the cache directory.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if index is None:
+            index = FootprintIndex(os.path.join(cache_dir, "index.json"))
+        self.index = index
+
+    def hash_sources(self, fnames: list) -> None:
+        """Calculates the hashes of update grid files in advance, e.g. before starting worker processes.
+
+        Args:
+            fnames: Filenames of update grids.
+        """
+        for fname in fnames:
+            self.index.content_hash(fname)
+
+    def key(self, base_grid: Grid, fname: str, **params) -> str:
+        """Calculates the key of the difference grid of an update grid.
+
+        Args:
+            base_grid: Base grid the difference grid is calculated from.
+            fname: Filename of update grid.
+            params: Parameters of calc_diff_grid.
+
+        Returns:
+            Key of the difference grid.
+        """
+        source = self.index.extent(fname)
+        description = {
+            "version": CACHE_VERSION,
+            "source": self.index.content_hash(fname),
+            "base_region": base_grid.region,
+            "base_spacing": base_grid.spacing,
+            "params": params,
+        }
+        digest = hashlib.blake2b(
+            json.dumps(description, sort_keys=True, default=float).encode(),
+            digest_size=20,
+        )
+
+        read_region = min_regions(
+            base_read_region(base_grid, source.region, params.get("block_region")),
+            base_grid.region,
+        )
+        if is_region_valid(read_region):
+            window = base_grid.grid[region_to_slices(base_grid.grid, read_region)]
+            window = window.transpose("y", "x")
+            for array in [window.x.values, window.y.values, window.values]:
+                digest.update(np.ascontiguousarray(array).tobytes())
+
+        return digest.hexdigest()
+
+    def _fname(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str) -> Tuple[bool, xr.DataArray]:
+        """Finds a difference grid in the cache.
+
+        Args:
+            key: Key of the difference grid.
+
+        Returns:
+            - Whether the difference grid was found.
+            - The difference grid (None if the update grid changes nothing).
+        """
+        fname = self._fname(key)
+        try:
+            with np.load(fname) as data:
+                if "z" not in data:
+                    diff_grid = None
+                else:
+                    diff_grid = xr.DataArray(
+                        data["z"],
+                        coords={"y": data["y"], "x": data["x"]},
+                        dims=("y", "x"),
+                        name="z",
+                    )
+        except (FileNotFoundError, ValueError, OSError):
+            return False, None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(fname)
+        except FileNotFoundError:
+            pass
+        return True, diff_grid
+
+    def put(self, key: str, diff_grid: xr.DataArray) -> None:
+        """Stores a difference grid in the cache, then removes old entries if the cache is full.
+
+        Args:
+            key: Key of the difference grid.
+            diff_grid: Difference grid (None if the update grid changes nothing).
+        """
+        fname = self._fname(key)
+        # Write to a temporary file first, so concurrent readers never see partial entries
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp_fname, "wb") as fp:
+            if diff_grid is None:
+                np.savez(fp)
+            else:
+                diff_grid = diff_grid.transpose("y", "x")
+                np.savez(fp, x=diff_grid.x.values, y=diff_grid.y.values, z=diff_grid.values)
+        os.replace(tmp_fname, fname)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is within its maximum size."""
+        if self.max_size is None:
+            return
+
+        entries = []
+        for fname in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, fname))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(fname)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -1,11 +1,62 @@
 """Grid contains a grid of data in xarray format"""
 
-import os
+import logging
+
+import numpy as np
 import pandas
-from pygmt import grdcut
+import xarray as xr
+from pygmt.clib import Session
+from pygmt.helpers import (
+    GMTTempFile,
+    build_arg_string,
+    kwargs_to_strings,
+    use_alias,
+)
+
+from pycascadia.loaders import (
+    load_source,
+    extract_region,
+    extract_spacing,
+    standardise_names,
+)
+from pycascadia.nodata import nodata_values
+from pycascadia.tiling import plan_tiles
+from pycascadia.utility import xr_to_xyz, region_to_slices
+from pycascadia.writers import open_grid_writer
+
+logger = logging.getLogger(__name__)
+
+# Number of nodes along each side of the tiles in which grids are written to file
+SAVE_TILE_SIZE = 4096
+
+
+@use_alias(
+    I="spacing",
+    R="region",
+    V="verbose",
+)
+@kwargs_to_strings(R="sequence")
+def grdsample(grid: xr.DataArray, **kwargs) -> xr.DataArray:
+    """Uses pyGMT's clib to call GMT's grdsample command on an in-memory grid
 
-from pycascadia.loaders import load_source, extract_region
-from pycascadia.utility import region_to_str, xr_to_xyz, filter_nodata
+    The input grid is passed to GMT as a virtual file, so no copy of it is written to disk.
+    The output is written to a temporary file in the system's temporary directory.
+
+    Adapted from pyGMT's [grdcut implementation](https://github.com/GenericMappingTools/pygmt/blob/v0.3.1/pygmt/src/grdcut.py)
+    """
+    with GMTTempFile(suffix=".nc") as tmpfile:
+        with Session() as lib:
+            file_context = lib.virtualfile_from_data(check_kind="raster", data=grid)
+            with file_context as infile:
+                kwargs.update({"G": tmpfile.name})
+                arg_str = " ".join([infile, build_arg_string(kwargs)])
+                lib.call_module("grdsample", arg_str)
+
+        with xr.open_dataarray(tmpfile.name) as dataarray:
+            result = dataarray.load()
+            _ = result.gmt  # load GMTDataArray accessor information
+
+    return result
 
 
 class Grid:
@@ -17,37 +68,113 @@ class Grid:
     - cropping to a given region
     - conversion to a list of xyz datapoints.
     - saved to file
+    - backed by a memory-mapped file, shared with other processes
 
     Coordinates will be labelled `x` and `y`, and (depth/elevation) values will be labelled `z`.
 
     The internal grid may also be manipulated and is exposed through Grid.grid or Grid.xyz (if the grid has already been converted).
     """
 
-    def __init__(self, fname: str, convert_to_xyz: bool = False) -> None:
+    def __init__(
+        self,
+        fname: str,
+        convert_to_xyz: bool = False,
+        region: list = None,
+        lazy: bool = False,
+        chunks: dict = None,
+        spacing: float = None,
+    ) -> None:
         """
         Constructor
 
         Args:
             fname: Input grid filename.
             convert_to_xyz: Whether the grid should be converted to xyz points.
+            region: Optional bounding box. Only the part of the grid within this region is loaded.
+            lazy: Whether to defer reading values from file until they are used.
+            chunks: Optional chunk sizes with which the grid is opened as a dask array.
+            spacing: Optional grid spacing the grid will later be resampled to, allowing
+                GeoTiffs to be read from a coarser internal overview.
         """
-        self.load(fname)
+        self.load(fname, region=region, lazy=lazy, chunks=chunks, spacing=spacing)
 
         if convert_to_xyz:
             self.xyz = self.as_xyz()
 
-    def load(self, fname: str) -> None:
+    @classmethod
+    def from_dataarray(cls, xr_data: xr.DataArray) -> "Grid":
+        """
+        Creates a grid from an existing xarray dataarray, without copying it.
+
+        Args:
+            xr_data: Grid with coordinates labelled `x` and `y`.
+
+        Returns:
+            Grid wrapping the dataarray.
+        """
+        grid = cls.__new__(cls)
+        grid.grid = xr_data
+        grid.region = extract_region(xr_data)
+        grid.spacing = extract_spacing(xr_data)
+        return grid
+
+    @classmethod
+    def from_memmap(
+        cls, fname: str, x: np.ndarray, y: np.ndarray, mode: str = "r"
+    ) -> "Grid":
+        """
+        Creates a grid backed by a memory-mapped file written by `Grid.to_memmap`.
+
+        Values are read from the file as they are used, and the pages of the file are
+        shared by every process which maps it, so several processes may open the same
+        grid while it is only held in memory once.
+
+        Args:
+            fname: Filename of memory-mapped `.npy` file.
+            x: Coordinates of the grid in the x direction.
+            y: Coordinates of the grid in the y direction.
+            mode: Mode in which the file is mapped: "r" to read only, or "r+" to write
+                changes to the values back to the file, e.g. to disjoint tiles from each process.
+
+        Returns:
+            Grid backed by the file.
+        """
+        values = np.load(fname, mmap_mode=mode)
+        return cls.from_dataarray(
+            xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+        )
+
+    def load(
+        self,
+        fname: str,
+        region: list = None,
+        lazy: bool = False,
+        chunks: dict = None,
+        spacing: float = None,
+    ) -> None:
         """
         Loads data from file. See loaders for supported file formats.
 
         Args:
             fname: Input grid filename.
+            region: Optional bounding box. Only the part of the grid within this region is loaded.
+            lazy: Whether to defer reading values from file until they are used.
+            chunks: Optional chunk sizes with which the grid is opened as a dask array.
+            spacing: Optional grid spacing the grid will later be resampled to, allowing
+                GeoTiffs to be read from a coarser internal overview.
         """
-        self.grid, self.region, self.spacing = load_source(fname)
+        self.grid, self.region, self.spacing = load_source(
+            fname, region=region, lazy=lazy, chunks=chunks, spacing=spacing
+        )
 
     def crop(self, region: list) -> None:
         """
-        Crops grid using grdcut.
+        Crops grid to the nodes within a region, by slicing its coordinates.
+
+        The nodes selected are the same as with GMT's grdcut: the bounds of the region
+        are rounded to the nearest nodes and clipped to the extent of the grid. The
+        cropped grid is a view of the original values rather than a copy, and lazily
+        loaded grids stay lazy, so only the window within the region is read from file.
 
         Args:
             region: Bounding box of region to crop to (in format [xmin, xmax, ymin, ymax]).
@@ -55,42 +182,82 @@ class Grid:
         if region == self.region:
             return
 
-        self.grid = grdcut(self.grid, region=region)
+        window = region_to_slices(self.grid, region)
+        if any(s.start == s.stop for s in window.values()):
+            raise ValueError(f"Region {region} does not overlap grid region {self.region}")
+        self.grid = self.grid.isel(window)
         self.region = extract_region(self.grid)
 
-    def resample(self, spacing: float) -> None:
+    def resample(self, spacing: float, region: list = None) -> None:
         """
-        Resamples the loaded grid using gdal's grdsample.
-        
+        Resamples the loaded grid using GMT's grdsample.
+
+        The grid is resampled in memory, no files are written to the current directory.
+
         Resampled grid may cover slightly expanded region (to East and North).
         This is in order to guarantee the specified spacing.
         See gmt grdsample `-I<increment>+e` flag for details.
 
         Args:
             spacing: Grid spacing of resampled grid.
+            region: Optional region of resampled grid. Defaults to the region of the current grid.
         """
         if spacing == self.spacing:
             return
 
-        print(f"Resampling from {self.spacing} to {spacing}")
-        in_fname = "original.nc"
-        self.save_grid(in_fname)
-        out_fname = "resampled.nc"
-        os.system(
-            f"gmt grdsample {in_fname} -G{out_fname} -R{region_to_str(self.region)} -I{spacing}+e -V"
+        if region is None:
+            region = self.region
+
+        logger.info(f"Resampling from {self.spacing} to {spacing}")
+        resampled = grdsample(
+            self.grid, region=region, spacing=f"{spacing}+e", verbose=True
         )
-        self.load(out_fname)
-        os.remove(in_fname)
-        os.remove(out_fname)
+        self.grid = standardise_names(resampled).astype("float32")
+        self.region = extract_region(self.grid)
+        self.spacing = extract_spacing(self.grid)
+
+    def to_memmap(self, fname: str) -> None:
+        """
+        Moves the values of the grid into a memory-mapped file.
 
-    def as_xyz(self) -> pandas.DataFrame:
+        Values are stored as float32 in a `.npy` file, with `y` as the first dimension. The
+        grid is copied one tile at a time, so lazily loaded grids are never held in memory
+        in full. Later changes to the values of the grid are written to the file, and are
+        seen by other processes which open it with `Grid.from_memmap`.
+
+        Args:
+            fname: Filename of memory-mapped `.npy` file. Any existing file is overwritten.
+        """
+        grid = self.grid.transpose("y", "x")
+        values = np.lib.format.open_memmap(
+            fname, mode="w+", dtype="float32", shape=grid.shape
+        )
+        for tile in plan_tiles(grid.sizes["x"], grid.sizes["y"], SAVE_TILE_SIZE):
+            values[tile["y"], tile["x"]] = grid[tile].values
+        self.grid = xr.DataArray(
+            values,
+            coords={"y": grid.y, "x": grid.x},
+            dims=("y", "x"),
+            name="z",
+            attrs=grid.attrs,
+        )
+
+    def to_memory(self) -> None:
+        """
+        Copies the values of the grid into memory, e.g. before its memory-mapped file is removed.
+        """
+        self.grid = self.grid.copy(data=np.array(self.grid.values))
+
+    def as_xyz(self, data: np.ndarray = None) -> pandas.DataFrame:
         """
         Returns pandas dataframe representation.
+
+        Points with nodata values (NaN, or those recorded in the grid's attributes) are excluded.
+
+        Args:
+            data: Optional mask of the nodes of the grid which hold data, if already known.
         """
-        xyz_data = xr_to_xyz(self.grid)
-        if hasattr(self.grid, "nodatavals"):
-            filter_nodata(xyz_data, self.grid.nodatavals)
-        return xyz_data
+        return xr_to_xyz(self.grid, nodata_values(self.grid), data=data)
 
     def plot(self, ax=None) -> None:
         """
@@ -101,11 +268,26 @@ class Grid:
         """
         self.grid.plot(ax=ax)
 
-    def save_grid(self, fname: str) -> None:
+    def save_grid(self, fname: str, tile_size: int = SAVE_TILE_SIZE, **kwargs) -> None:
         """
-        Saves grid to netcdf file.
+        Saves grid to netcdf file, to a Cloud-Optimized GeoTiff if the filename ends in `.tif` or `.tiff`,
+        or to a Zarr store if it ends in `.zarr`.
+
+        The grid is written one tile at a time, so lazily loaded grids are streamed from
+        their source file rather than loaded in full.
 
         Args:
             fname: Output filename.
+            tile_size: Number of nodes along each side of the tiles in which the grid is written.
+            kwargs: Options of the output format, e.g. chunk shape, compression and data type.
+                See pycascadia.writers.
         """
-        self.grid.to_netcdf(fname)
+        grid = self.grid.transpose("y", "x")
+        if grid.y.size > 1 and grid.y[0] > grid.y[-1]:
+            grid = grid.isel(y=slice(None, None, -1))
+        x = grid.x.values
+        y = grid.y.values
+
+        with open_grid_writer(fname, x, y, attrs=grid.attrs, **kwargs) as writer:
+            for tile in plan_tiles(len(x), len(y), tile_size):
+                writer.write(grid[tile].values, tile)
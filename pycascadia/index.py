@@ -0,0 +1,165 @@
+"""
+Index of the extents of update grids, used to skip grids outside a region without loading them
+"""
+
+import hashlib
+import json
+import os
+
+from pycascadia.loaders import read_extent
+from pycascadia.tiling import SourceExtent
+from pycascadia.utility import min_regions, is_region_valid
+
+
+def _stat(fname: str) -> tuple:
+    """Finds the latest modification time and total size of a grid file.
+
+    Directories, e.g. Zarr stores, are described by all of the files within them.
+
+    Args:
+        fname: Grid filename.
+
+    Returns:
+        - Modification time in nanoseconds.
+        - Size in bytes.
+    """
+    if not os.path.isdir(fname):
+        stat = os.stat(fname)
+        return stat.st_mtime_ns, stat.st_size
+
+    mtime, size = os.stat(fname).st_mtime_ns, 0
+    for path in _files(fname):
+        stat = os.stat(path)
+        mtime, size = max(mtime, stat.st_mtime_ns), size + stat.st_size
+    return mtime, size
+
+
+def _files(fname: str) -> list:
+    """Lists the files making up a grid, in a fixed order.
+
+    Args:
+        fname: Grid filename, or directory such as a Zarr store.
+
+    Returns:
+        Paths of the files.
+    """
+    if not os.path.isdir(fname):
+        return [fname]
+
+    paths = []
+    for root, dirs, files in os.walk(fname):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(files)]
+    return paths
+
+
+class FootprintIndex:
+    """FootprintIndex holds the bounding region and spacing of a set of grid files.
+
+    Extents are read from file headers only, and can be persisted to a JSON file so that
+    later runs do not need to open the grid files at all. Hashes of the file contents are
+    also stored, once they have been calculated. An entry is re-read whenever the size or
+    modification time of its file changes.
+    """
+
+    def __init__(self, index_fname: str = None) -> None:
+        """
+        Constructor
+
+        Args:
+            index_fname: Optional JSON file in which the index is persisted. It is read if it exists.
+        """
+        self.index_fname = index_fname
+        self.entries = {}
+        self.modified = False
+
+        if index_fname is not None and os.path.exists(index_fname):
+            with open(index_fname, "r") as fp:
+                self.entries = json.load(fp)
+
+    def _entry(self, fname: str) -> dict:
+        """Finds the entry of a grid file, reading its header if it is not already indexed.
+
+        Args:
+            fname: Grid filename.
+
+        Returns:
+            Entry of the grid.
+        """
+        key = os.path.abspath(fname)
+        mtime, size = _stat(fname)
+        entry = self.entries.get(key)
+        if entry is None or entry["mtime"] != mtime or entry["size"] != size:
+            region, spacing = read_extent(fname)
+            entry = {
+                "region": region,
+                "spacing": spacing,
+                "mtime": mtime,
+                "size": size,
+            }
+            self.entries[key] = entry
+            self.modified = True
+
+        return entry
+
+    def extent(self, fname: str) -> SourceExtent:
+        """Finds the extent of a grid file, reading its header if it is not already indexed.
+
+        Args:
+            fname: Grid filename.
+
+        Returns:
+            Extent of the grid.
+        """
+        entry = self._entry(fname)
+        return SourceExtent(fname, entry["region"], entry["spacing"])
+
+    def content_hash(self, fname: str) -> str:
+        """Finds the hash of the contents of a grid file, reading the file if it is not already indexed.
+
+        Args:
+            fname: Grid filename.
+
+        Returns:
+            Hexadecimal BLAKE2b digest of the file, or of the files within a directory.
+        """
+        entry = self._entry(fname)
+        if "hash" not in entry:
+            digest = hashlib.blake2b(digest_size=20)
+            for path in _files(fname):
+                if path != fname:
+                    digest.update(os.path.relpath(path, fname).encode())
+                with open(path, "rb") as fp:
+                    for block in iter(lambda: fp.read(2 ** 24), b""):
+                        digest.update(block)
+            entry["hash"] = digest.hexdigest()
+            self.modified = True
+
+        return entry["hash"]
+
+    def query(self, region: list, fnames: list) -> list:
+        """Finds the grid files which overlap a region.
+
+        Args:
+            region: Bounding box in format [xmin, xmax, ymin, ymax].
+            fnames: Grid filenames to search.
+
+        Returns:
+            Extents of the grids overlapping the region, in the order of `fnames`.
+        """
+        # Every file is checked against its entry in turn, as any of them may have changed
+        extents = [self.extent(fname) for fname in fnames]
+        return [
+            extent
+            for extent in extents
+            if is_region_valid(min_regions(extent.region, region))
+        ]
+
+    def save(self) -> None:
+        """Writes the index to its JSON file, if it has one and it has changed."""
+        if self.index_fname is None or not self.modified:
+            return
+
+        with open(self.index_fname, "w") as fp:
+            json.dump(self.entries, fp, indent=1)
+        self.modified = False
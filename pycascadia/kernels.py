@@ -0,0 +1,615 @@
+"""
+NumPy implementations of the GMT modules used by remove-restore
+
+These work directly on in-memory arrays, avoiding the cost of passing points to and from
+GMT through virtual files, text tables and temporary grid files. They follow the
+conventions of the GMT modules they replace (gridline registration, the lattice GMT
+derives from a region and spacing, and GMT's median and sector definitions), so their
+results match GMT's to within rounding.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typing import Tuple
+
+from pycascadia.nodata import valid_data_mask
+
+# Maximum number of (point, node) pairs considered at once by nearneighbour
+NEARNEIGHBOUR_CHUNK_SIZE = 2 ** 22
+
+# Approximate number of nodes tapered at once by taper, in strips of whole rows
+TAPER_CHUNK_SIZE = 2 ** 20
+
+# Approximate number of nodes padded into blocks at once by blockmedian_grid, in strips
+# of whole rows of blocks
+BLOCKMEDIAN_CHUNK_SIZE = 2 ** 20
+
+# Tolerance, as a fraction of the grid spacing, within which lattices are considered aligned
+ALIGNMENT_TOLERANCE = 1e-6
+
+
+def lattice(region: list, spacing: float) -> Tuple[int, int, float, float]:
+    """Finds the gridline-registered lattice GMT uses for a region and spacing.
+
+    As with `-R<region> -I<spacing>` in GMT, the number of nodes is rounded to fit the
+    region and the spacing is then adjusted so the nodes span the region exactly.
+
+    Args:
+        region: Region as [xmin, xmax, ymin, ymax].
+        spacing: Requested grid spacing.
+
+    Returns:
+        - Number of nodes in the x direction.
+        - Number of nodes in the y direction.
+        - Spacing in the x direction.
+        - Spacing in the y direction.
+    """
+    xmin, xmax, ymin, ymax = region
+    # GMT (gmt_M_get_n) rounds the number of nodes, not of intervals, with lrint. Both
+    # round half to even, so adding one after rounding would differ from GMT at exact
+    # ties, e.g. a width of 10.5 spacings gives 12 nodes (rint(11.5)) rather than 11
+    nx = int(np.rint((xmax - xmin) / spacing + 1))
+    ny = int(np.rint((ymax - ymin) / spacing + 1))
+    dx = (xmax - xmin) / (nx - 1) if nx > 1 else spacing
+    dy = (ymax - ymin) / (ny - 1) if ny > 1 else spacing
+    return nx, ny, dx, dy
+
+
+def _xyz_arrays(data_xyz: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Extracts the x, y and z columns of a table of points as float64 arrays."""
+    return tuple(
+        np.asarray(data_xyz[column], dtype=np.float64) for column in ["x", "y", "z"]
+    )
+
+
+def blockmedian(data_xyz: pd.DataFrame, spacing: float, region: list) -> pd.DataFrame:
+    """Calculates the median position and value of the points in each block.
+
+    Equivalent to `gmt blockmedian -R<region> -I<spacing>`: each block is centred on a node
+    of the lattice, points outside the region or with NaN values are ignored, and the
+    median x, y and z of each non-empty block are found independently. Blocks are output
+    row by row from the top of the region, as GMT does.
+
+    Args:
+        data_xyz: Points with x, y and z columns.
+        spacing: Width of the blocks.
+        region: Region as [xmin, xmax, ymin, ymax].
+
+    Returns:
+        Median points with x, y and z columns.
+    """
+    x, y, z = _xyz_arrays(data_xyz)
+    xmin, xmax, ymin, ymax = region
+    nx, ny, dx, dy = lattice(region, spacing)
+
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax) & ~np.isnan(z)
+    x, y, z = x[inside], y[inside], z[inside]
+    col = np.rint((x - xmin) / dx).astype(np.int64)
+    row = np.rint((ymax - y) / dy).astype(np.int64)
+    inside = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+    x, y, z = x[inside], y[inside], z[inside]
+    block = row[inside] * nx + col[inside]
+
+    # Sort by block and then by value, so each block's median lies midway through its segment
+    order = np.argsort(block, kind="stable")
+    block = block[order]
+    starts = np.flatnonzero(np.diff(block, prepend=-1))
+    counts = np.diff(np.append(starts, len(block)))
+    lower = starts + (counts - 1) // 2
+    upper = starts + counts // 2
+
+    def segment_median(values):
+        values = values[order]
+        values = values[np.lexsort((values, block))]
+        return 0.5 * (values[lower] + values[upper])
+
+    return pd.DataFrame(
+        {"x": segment_median(x), "y": segment_median(y), "z": segment_median(z)}
+    )
+
+
+def grid_blocks_aligned(
+    origin: list, grid_spacing: float, spacing: float, region: list
+) -> bool:
+    """Determines whether blockmedian_grid can calculate the block medians of a grid directly.
+
+    Args:
+        origin: Coordinates [x, y] of any node of the grid.
+        grid_spacing: Spacing of the grid.
+        spacing: Width of the blocks.
+        region: Region as [xmin, xmax, ymin, ymax].
+
+    Returns:
+        True if the block width is an odd multiple of the grid spacing and the blocks are
+        centred on nodes of the grid.
+    """
+    ratio = spacing / grid_spacing
+    k = int(round(ratio))
+    if abs(ratio - k) > ALIGNMENT_TOLERANCE or k % 2 == 0:
+        return False
+
+    _, _, dx, dy = lattice(region, spacing)
+    if max(abs(dx - spacing), abs(dy - spacing)) > ALIGNMENT_TOLERANCE * grid_spacing:
+        return False
+
+    fx = (region[0] - origin[0]) / grid_spacing
+    fy = (region[2] - origin[1]) / grid_spacing
+    return max(abs(fx - round(fx)), abs(fy - round(fy))) <= ALIGNMENT_TOLERANCE
+
+
+def blockmedian_grid(
+    grid: xr.DataArray,
+    grid_spacing: float,
+    spacing: float,
+    region: list,
+    nodatavals: list = None,
+    data: np.ndarray = None,
+) -> pd.DataFrame:
+    """Calculates the block medians of a grid directly, without converting it to points.
+
+    When the block width is an odd multiple of the grid spacing and the blocks are centred
+    on nodes of the grid, every block covers the same square of nodes (clipped to the
+    region). The grid can then be reshaped into blocks and reduced with a median, giving
+    the same result as `blockmedian` on the grid's xyz points.
+
+    Args:
+        grid: Grid with ascending x and y coordinates.
+        grid_spacing: Spacing of the grid.
+        spacing: Width of the blocks.
+        region: Region as [xmin, xmax, ymin, ymax].
+        nodatavals: Optional list of values representing a lack of data.
+        data: Optional mask of the nodes of `grid` which hold data, in the order of its
+            dimensions, if already known. `nodatavals` is then ignored.
+
+    Returns:
+        Median points with x, y and z columns, or None if the blocks and grid are not aligned.
+    """
+    if data is not None and grid.dims[0] == "x":
+        data = data.T
+    grid = grid.transpose("y", "x")
+    x = grid.x.values
+    y = grid.y.values
+    if not grid_blocks_aligned([x[0], y[0]], grid_spacing, spacing, region):
+        return None
+
+    k = int(round(spacing / grid_spacing))
+    nx, ny, _, _ = lattice(region, spacing)
+    # Nodes of the grid at the lower left corner of the region
+    i0 = int(round((region[0] - x[0]) / grid_spacing))
+    j0 = int(round((region[2] - y[0]) / grid_spacing))
+
+    # Nodes of the grid within the region, placed in complete blocks
+    half = (k - 1) // 2
+    col_start = max(i0, 0)
+    col_stop = min(i0 + (nx - 1) * k, len(x) - 1) + 1
+    row_start = max(j0, 0)
+    row_stop = min(j0 + (ny - 1) * k, len(y) - 1) + 1
+    if col_start >= col_stop or row_start >= row_stop:
+        return pd.DataFrame({"x": [], "y": [], "z": []})
+    block_cols = slice(col_start - i0 + half, col_stop - i0 + half)
+    block_x = np.full(nx * k, np.nan)
+    block_x[block_cols] = x[col_start:col_stop]
+    block_y = np.full(ny * k, np.nan)
+    block_y[row_start - j0 + half : row_stop - j0 + half] = y[row_start:row_stop]
+
+    # Rows of blocks are reduced a strip at a time, from the top of the region as
+    # blockmedian outputs them, so only one strip of the grid is padded at once
+    values = grid.values
+    rows_per_strip = max(BLOCKMEDIAN_CHUNK_SIZE // (nx * k * k), 1)
+    strips = []
+    for stop in range(ny, 0, -rows_per_strip):
+        start = max(stop - rows_per_strip, 0)
+        # Rows of the grid within the strip, counted from the bottom of its first block
+        first_row = start * k + j0 - half
+        strip_rows = slice(max(first_row, row_start), min(stop * k + j0 - half, row_stop))
+        if strip_rows.start >= strip_rows.stop:
+            continue
+
+        strip = np.full(((stop - start) * k, nx * k), np.nan)
+        window = strip[
+            strip_rows.start - first_row : strip_rows.stop - first_row, block_cols
+        ]
+        window[...] = values[strip_rows, col_start:col_stop]
+        if data is None:
+            window[~valid_data_mask(window, nodatavals)] = np.nan
+        else:
+            window[~data[strip_rows, col_start:col_stop]] = np.nan
+        strips.append(
+            _blockmedian_strip(
+                strip, block_x, block_y[start * k : stop * k], stop - start, nx, k
+            )
+        )
+
+    return pd.concat(strips, ignore_index=True)
+
+
+def _blockmedian_strip(
+    values: np.ndarray,
+    block_x: np.ndarray,
+    block_y: np.ndarray,
+    ny: int,
+    nx: int,
+    k: int,
+) -> pd.DataFrame:
+    """Calculates the block medians of a strip of complete blocks, for blockmedian_grid.
+
+    Args:
+        values: Values of the strip, NaN where there is no data or no node.
+        block_x: x coordinate of each column of the strip, NaN where there is no node.
+        block_y: y coordinate of each row of the strip, NaN where there is no node.
+        ny: Number of rows of blocks.
+        nx: Number of columns of blocks.
+        k: Number of nodes along each side of a block.
+
+    Returns:
+        Median points with x, y and z columns, ordered row by row from the top of the strip.
+    """
+
+    def blocks(array):
+        # Blocks ordered row by row from the top of the strip, as blockmedian outputs them
+        return array.reshape(ny, k, nx, k)[::-1].transpose(0, 2, 1, 3).reshape(-1, k * k)
+
+    z = blocks(values)
+    valid = ~np.isnan(z)
+    has_data = valid.any(axis=1)
+    z = z[has_data]
+    valid = valid[has_data]
+    x = blocks(np.broadcast_to(block_x, values.shape))[has_data]
+    y = blocks(np.broadcast_to(block_y[:, np.newaxis], values.shape))[has_data]
+
+    if k == 1:
+        return pd.DataFrame({"x": x[:, 0], "y": y[:, 0], "z": z[:, 0]})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return pd.DataFrame(
+            {
+                "x": np.nanmedian(np.where(valid, x, np.nan), axis=1),
+                "y": np.nanmedian(np.where(valid, y, np.nan), axis=1),
+                "z": np.nanmedian(z, axis=1),
+            }
+        )
+
+
+def grdtrack(
+    points: pd.DataFrame,
+    grid: xr.DataArray,
+    newcolname: str,
+    threshold: float = 0.5,
+) -> pd.DataFrame:
+    """Samples a grid at points by bilinear interpolation.
+
+    Equivalent to `gmt grdtrack -nl`. Where some of the four surrounding nodes are NaN,
+    the weights of the others are renormalised if they sum to at least `threshold`
+    (GMT's `-n+t` default), otherwise the result is NaN. Points outside the grid are NaN.
+
+    Args:
+        points: Points with x and y columns.
+        grid: Grid to sample, with ascending x and y coordinates.
+        newcolname: Name of the column of sampled values.
+        threshold: Minimum total weight of the non-NaN nodes.
+
+    Returns:
+        Copy of the points with the additional column of sampled values.
+    """
+    x = np.asarray(points["x"], dtype=np.float64)
+    y = np.asarray(points["y"], dtype=np.float64)
+    values = grid.transpose("y", "x").values
+    ny, nx = values.shape
+    grid_x = grid.x.values
+    grid_y = grid.y.values
+    dx = (grid_x[-1] - grid_x[0]) / (nx - 1) if nx > 1 else 1.0
+    dy = (grid_y[-1] - grid_y[0]) / (ny - 1) if ny > 1 else 1.0
+
+    # Fractional column and row of each point
+    fx = (x - grid_x[0]) / dx
+    fy = (y - grid_y[0]) / dy
+    outside = (fx < 0) | (fx > nx - 1) | (fy < 0) | (fy > ny - 1) | np.isnan(fx + fy)
+    fx[outside] = 0.0
+    fy[outside] = 0.0
+
+    col = np.minimum(np.floor(fx).astype(np.int64), max(nx - 2, 0))
+    row = np.minimum(np.floor(fy).astype(np.int64), max(ny - 2, 0))
+    tx = fx - col
+    ty = fy - row
+    col1 = np.minimum(col + 1, nx - 1)
+    row1 = np.minimum(row + 1, ny - 1)
+
+    total = np.zeros_like(x)
+    weight_sum = np.zeros_like(x)
+    for node_row, node_col, weight in [
+        (row, col, (1 - tx) * (1 - ty)),
+        (row, col1, tx * (1 - ty)),
+        (row1, col, (1 - tx) * ty),
+        (row1, col1, tx * ty),
+    ]:
+        node_values = values[node_row, node_col].astype(np.float64)
+        valid = ~np.isnan(node_values)
+        total += np.where(valid, node_values * weight, 0.0)
+        weight_sum += np.where(valid, weight, 0.0)
+
+    sampled = np.full_like(x, np.nan)
+    interpolated = ~outside & (weight_sum + 1e-8 - threshold > 0.0)
+    sampled[interpolated] = total[interpolated] / weight_sum[interpolated]
+
+    result = points.copy()
+    result[newcolname] = sampled
+    return result
+
+
+def nearneighbour(
+    data_xyz: pd.DataFrame,
+    region: list,
+    spacing: float,
+    radius: float,
+    sectors: int = 4,
+    min_sectors: int = None,
+    nodata: float = np.nan,
+) -> xr.DataArray:
+    """Grids points by a weighted average of the nearest point in each sector around each node.
+
+    Equivalent to `gmt nearneighbor -R<region> -I<spacing> -S<radius> -N<sectors>+m<min_sectors>
+    -E<nodata>`. The search circle around each node is divided into `sectors` equal
+    sectors, the nearest point within `radius` is found in each, and nodes with at least
+    `min_sectors` filled sectors are assigned the average of these points weighted by
+    `1 / (1 + 9 r^2 / radius^2)`. As in GMT, distances and values are held in single
+    precision, and the first of several equidistant points in a sector is kept unless
+    rounding its distance to single precision makes a later one appear nearer.
+
+    Args:
+        data_xyz: Points with x, y and z columns.
+        region: Region of the output grid as [xmin, xmax, ymin, ymax].
+        spacing: Spacing of the output grid.
+        radius: Search radius.
+        sectors: Number of sectors.
+        min_sectors: Minimum number of filled sectors. Defaults to all sectors.
+        nodata: Value of nodes with too few filled sectors.
+
+    Returns:
+        Output grid, with dimensions (y, x) and ascending coordinates.
+    """
+    if min_sectors is None:
+        min_sectors = sectors
+
+    x, y, z = _xyz_arrays(data_xyz)
+    valid = ~np.isnan(z)
+    x, y, z = x[valid], y[valid], z[valid].astype(np.float32)
+
+    xmin, xmax, ymin, ymax = region
+    nx, ny, dx, dy = lattice(region, spacing)
+    # Node coordinates, with rows counted down from the top of the region as in GMT
+    node_x = xmin + dx * np.arange(nx)
+    node_x[-1] = xmax
+    node_y = ymax - dy * np.arange(ny)
+    node_y[-1] = ymin
+
+    # Offsets from the nearest node of a point to all nodes which may lie within the radius
+    reach_x = int(np.ceil(radius / dx)) + 1
+    reach_y = int(np.ceil(radius / dy)) + 1
+    offset_col, offset_row = np.meshgrid(
+        np.arange(-reach_x, reach_x + 1), np.arange(-reach_y, reach_y + 1)
+    )
+    offset_col = offset_col.ravel()
+    offset_row = offset_row.ravel()
+
+    # Distance to, and value of, the nearest point in each sector of each node
+    best_distance = np.full(nx * ny * sectors, np.inf, dtype=np.float32)
+    best_z = np.zeros(nx * ny * sectors, dtype=np.float32)
+
+    chunk_size = max(NEARNEIGHBOUR_CHUNK_SIZE // len(offset_col), 1)
+    for start in range(0, len(x), chunk_size):
+        px = x[start : start + chunk_size, np.newaxis]
+        py = y[start : start + chunk_size, np.newaxis]
+        pz = z[start : start + chunk_size, np.newaxis]
+        col = np.rint((px - xmin) / dx).astype(np.int64) + offset_col
+        row = np.rint((ymax - py) / dy).astype(np.int64) + offset_row
+        candidate = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+
+        col = col[candidate]
+        row = row[candidate]
+        point = np.broadcast_to(np.arange(len(px))[:, np.newaxis], candidate.shape)
+        point = point[candidate]
+        delta_x = px[point, 0] - node_x[col]
+        delta_y = py[point, 0] - node_y[row]
+        distance = np.hypot(delta_x, delta_y)
+
+        near = distance <= radius
+        point = point[near]
+        distance = distance[near]
+        sector = np.floor(
+            (np.arctan2(delta_y[near], delta_x[near]) + np.pi) * sectors / (2 * np.pi)
+        ).astype(np.int64)
+        key = (row[near] * nx + col[near]) * sectors + sector % sectors
+
+        # Nearest point of this chunk in each sector, in input order for equal distances
+        order = np.lexsort((point, distance, key))
+        key = key[order]
+        distance = distance[order]
+        point = point[order]
+        first = np.flatnonzero(np.diff(key, prepend=-1))
+        # GMT keeps the nearest distance in single precision and replaces it with any point
+        # found to be nearer. If rounding made the stored distance larger, later points at
+        # exactly the same distance replace it, so the last of them is kept.
+        run_starts = np.flatnonzero(
+            (np.diff(key, prepend=-1) != 0) | (np.diff(distance, prepend=-1.0) != 0)
+        )
+        run_ends = np.append(run_starts[1:], len(key)) - 1
+        last_tied = run_ends[np.searchsorted(run_starts, first)]
+        chosen = np.where(
+            distance[first].astype(np.float32) > distance[first], last_tied, first
+        )
+
+        key = key[chosen]
+        distance = distance[chosen]
+        replace = best_distance[key] > distance
+        key = key[replace]
+        best_distance[key] = distance[replace]
+        best_z[key] = pz[point[chosen][replace], 0]
+
+    best_distance = best_distance.reshape(ny, nx, sectors)
+    best_z = best_z.reshape(ny, nx, sectors)
+    filled_sectors = np.isfinite(best_distance).sum(axis=2)
+    # Weights in double precision, calculated in place. Empty sectors are infinitely far
+    # away, so have zero weight
+    weight = best_distance.astype(np.float64)
+    del best_distance
+    weight *= weight
+    weight *= 9.0
+    weight /= radius ** 2
+    weight += 1.0
+    np.divide(1.0, weight, out=weight)
+    weight_sum = weight.sum(axis=2)
+    weight *= best_z
+    del best_z
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = weight.sum(axis=2)
+        values /= weight_sum
+    del weight
+    values[filled_sectors < min_sectors] = nodata
+
+    # Flip rows so the y coordinate ascends
+    return xr.DataArray(
+        values[::-1].astype(np.float32),
+        coords={"y": node_y[::-1], "x": node_x},
+        dims=("y", "x"),
+        name="z",
+    )
+
+
+def window_spans(radius: float, dx: float, dy: float) -> np.ndarray:
+    """Finds the extent of a circular window along each row.
+
+    Args:
+        radius: Radius of the window.
+        dx: Grid spacing in the x direction.
+        dy: Grid spacing in the y direction.
+
+    Returns:
+        Number of nodes either side of the centre within the window, for each row offset
+        from -n to n, where n is the number of rows either side of the centre.
+    """
+    n_rows = int(np.floor(radius / dy))
+    row_offsets = np.arange(-n_rows, n_rows + 1)
+    spans = np.floor(
+        np.sqrt(np.maximum(radius ** 2 - (row_offsets * dy) ** 2, 0.0)) / dx
+    ).astype(np.int64)
+    # Correct for rounding, so spans include exactly the nodes within the radius
+    spans += np.hypot((spans + 1) * dx, row_offsets * dy) <= radius
+    spans -= np.hypot(spans * dx, row_offsets * dy) > radius
+    return spans
+
+
+def _taper_strip(
+    values: np.ndarray, data: np.ndarray, spans: np.ndarray, start: int, stop: int
+) -> None:
+    """Tapers rows `start` to `stop` of a grid in place, see taper.
+
+    Only the strip and the `n` rows either side of it, where `n` is the number of rows
+    either side of the centre of the window, are read.
+
+    Args:
+        values: Grid values, with dimensions (y, x). Modified in place.
+        data: Mask of the nodes which hold data.
+        spans: Extent of the window along each row, see window_spans.
+        start: First row of the strip.
+        stop: Row after the last row of the strip.
+    """
+    ny, nx = data.shape
+    n_rows = (len(spans) - 1) // 2
+    n_cols = int(spans.max())
+    top = max(start - n_rows, 0)
+    bottom = min(stop + n_rows, ny)
+    halo = data[top:bottom]
+    strip_rows = np.arange(start, stop) - top
+
+    # Dilate the nodata mask over the square containing the window of each node, with
+    # running counts down the columns of the halo and then along the rows of the strip
+    counts = np.zeros((bottom - top + 1, nx), dtype=np.int32)
+    np.cumsum(~halo, axis=0, out=counts[1:])
+    near_nodata = counts[np.minimum(strip_rows + n_rows + 1, bottom - top)]
+    near_nodata -= counts[np.maximum(strip_rows - n_rows, 0)]
+    del counts
+    counts = np.zeros((stop - start, nx + 1), dtype=np.int32)
+    np.cumsum(near_nodata > 0, axis=1, out=counts[:, 1:])
+    del near_nodata
+    cols = np.arange(nx)
+    near_edge = counts[:, np.minimum(cols + n_cols + 1, nx)]
+    near_edge = near_edge > counts[:, np.maximum(cols - n_cols, 0)]
+    del counts
+    near_edge &= data[start:stop]
+    rows, cols = np.nonzero(near_edge)
+    del near_edge
+    rows += start
+
+    # Count data, and all nodes, within the window of each node near the edge of the data
+    row_sums = np.zeros((bottom - top, nx + 1), dtype=np.int32)
+    np.cumsum(halo, axis=1, out=row_sums[:, 1:])
+    n_data = np.zeros(len(rows), dtype=np.int64)
+    n_nodes = np.zeros(len(rows), dtype=np.int64)
+    for row_offset, span in zip(range(-n_rows, n_rows + 1), spans):
+        window_rows = rows + row_offset
+        inside = (window_rows >= 0) & (window_rows < ny)
+        window_rows = window_rows[inside] - top
+        lo = np.maximum(cols[inside] - span, 0)
+        hi = np.minimum(cols[inside] + span, nx - 1) + 1
+        n_data[inside] += row_sums[window_rows, hi] - row_sums[window_rows, lo]
+        n_nodes[inside] += hi - lo
+    del row_sums
+
+    weights = np.maximum((n_data / n_nodes - 0.5) * 2.0, 0.0)
+    strip = values[start:stop]
+    strip[~data[start:stop]] = 0.0
+    values[rows, cols] *= weights.astype(values.dtype)
+
+
+def taper(
+    values: np.ndarray,
+    nodata: float,
+    radius: float,
+    dx: float,
+    dy: float,
+    data: np.ndarray = None,
+) -> None:
+    """Tapers a grid to zero over a distance `radius` inside the edge of its data, in place.
+
+    Equivalent to multiplying the grid by its filtered data mask and setting nodata to
+    zero: the fraction `f` of nodes within `radius` of each node which hold data is
+    found as by `gmt grdfilter -Fb<2*radius> -D0` (a circular boxcar, which
+    only counts nodes inside the grid), and data is scaled by `max(2f - 1, 0)`.
+
+    Only the band of rows within `radius` of a row containing nodata can change. It is
+    processed in strips of about TAPER_CHUNK_SIZE nodes, so temporary arrays are the size
+    of a strip rather than the grid. Within each strip, the nodes with nodata within
+    `radius` are found by dilating the nodata mask with running counts, and only those
+    are filtered, using running sums along each row of the window, so the cost grows with
+    the radius rather than its square.
+
+    Args:
+        values: Grid values, with dimensions (y, x). Modified in place.
+        nodata: Value representing a lack of data.
+        radius: Radius of the taper.
+        dx: Grid spacing in the x direction.
+        dy: Grid spacing in the y direction.
+        data: Optional mask of the nodes which hold data, if already known.
+    """
+    ny, nx = values.shape
+    spans = window_spans(radius, dx, dy)
+    n_rows = (len(spans) - 1) // 2
+    if data is None:
+        data = valid_data_mask(values, [nodata])
+
+    # Rows within n_rows of a row containing nodata, outside which all nodes keep their values
+    rows_with_nodata = np.zeros(ny + 1, dtype=np.int64)
+    np.cumsum(~data.all(axis=1), out=rows_with_nodata[1:])
+    row_lo = np.clip(np.arange(ny) - n_rows, 0, ny)
+    row_hi = np.clip(np.arange(ny) + n_rows + 1, 0, ny)
+    in_band = rows_with_nodata[row_hi] > rows_with_nodata[row_lo]
+
+    strip_rows = max(TAPER_CHUNK_SIZE // max(nx, 1), 1)
+    for start in range(0, ny, strip_rows):
+        stop = min(start + strip_rows, ny)
+        if in_band[start:stop].any():
+            _taper_strip(values, data, spans, start, stop)
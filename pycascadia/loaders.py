@@ -2,37 +2,117 @@
 Helper functions for loading different types of data sources as xarray grids
 """
 
+import logging
+import math
+import re
+import netCDF4
+import numpy as np
+import rasterio
+from rasterio.windows import Window
 import xarray as xr
 from typing import Tuple
 import matplotlib.pyplot as plt
 
+from pycascadia.utility import region_to_slices
 
-def load_source(filepath: str, plot: bool = False) -> Tuple[xr.DataArray, list, float]:
+try:
+    import zarr
+except ImportError:  # Zarr stores are optional, see the `zarr` extra
+    zarr = None
+
+logger = logging.getLogger(__name__)
+
+# Groups of multiscale files holding overviews, see pycascadia.pyramid. Overview `i` has
+# 2**i times the spacing of the grid at the root of the file.
+OVERVIEW_GROUP = "overview_{}"
+
+
+def open_source(filepath: str, chunks: dict = None, group: str = None) -> xr.DataArray:
+    """Opens an xarray dataarray from file without reading its values.
+
+    Supported file formats are:
+        - GeoTiff
+        - NetCDF
+        - Zarr (requires zarr)
+
+    Args:
+        filepath: Name of file to open.
+        chunks: Optional chunk sizes (e.g. `{"x": 4096, "y": 4096}`) with which the grid is
+            opened as a dask array. Requires dask.
+        group: Optional group of a NetCDF file or Zarr store from which the grid is opened.
+
+    Returns:
+        Grid as lazily loaded xarray DataArray.
+    """
+    ext = filepath.rstrip("/").split(".")[-1]
+    if ext == "nc":
+        xr_data = load_netcdf(filepath, chunks=chunks, group=group)
+    elif ext == "tif" or ext == "tiff":
+        xr_data = load_geotiff(filepath, chunks=chunks)
+    elif ext == "zarr":
+        xr_data = load_zarr(filepath, chunks=chunks, group=group)
+    else:
+        raise RuntimeError(f"Error: filetype {ext} not recognised.")
+
+    return xr_data
+
+
+def load_source(
+    filepath: str,
+    plot: bool = False,
+    region: list = None,
+    lazy: bool = False,
+    chunks: dict = None,
+    spacing: float = None,
+) -> Tuple[xr.DataArray, list, float]:
     """Loads an xarray dataarray from file.
 
     Supported file formats are:
         - GeoTiff
         - NetCDF
+        - Zarr (requires zarr)
+
+    In lazy mode only the coordinates are read, so the region and spacing are available
+    straight away, and values are read from file when they are first used. Any later
+    selection, e.g. `Grid.crop`, then only reads the selected window. Without `chunks`
+    the values keep the data type of the file until they are read; with `chunks` they are
+    converted to float32 chunk by chunk.
 
     Args:
         filepath: Name of file to load.
         plot: Whether to plot loaded grid.
+        region: Optional bounding box (in format [xmin, xmax, ymin, ymax]). Only the grid nodes
+            within this region are read from file.
+        lazy: Whether to defer reading values from file until they are used.
+        chunks: Optional chunk sizes (e.g. `{"x": 4096, "y": 4096}`) with which the grid is
+            opened as a dask array. Requires dask.
+        spacing: Optional grid spacing the loaded grid will be resampled to. GeoTiffs are then
+            read from the coarsest internal overview which is no coarser than this spacing,
+            and multiscale NetCDF files and Zarr stores from the coarsest such overview group.
+            Other files ignore this argument.
 
     Returns:
         - Grid as xarray DataArray.
         - Bounding region of grid.
         - Grid spacing.
     """
-    print(f"Loading {filepath}")
+    logger.info(f"Loading {filepath}")
     ext = filepath.split(".")[-1]
-    if ext == "nc":
-        xr_data = load_netcdf(filepath)
-    elif ext == "tif" or ext == "tiff":
-        xr_data = load_geotiff(filepath)
+    if spacing is not None and (ext == "tif" or ext == "tiff"):
+        xr_data = load_geotiff_window(filepath, region=region, spacing=spacing)
     else:
-        raise RuntimeError(f"Error: filetype {ext} not recognised.")
+        group = None
+        if spacing is not None:
+            group = select_overview(filepath, spacing)
+        xr_data = open_source(filepath, chunks=chunks, group=group)
+
+        if region is not None:
+            xr_data = xr_data.isel(region_to_slices(xr_data, region))
 
-    xr_data = xr_data.astype("float32")
+    if chunks is not None or not lazy:
+        xr_data = xr_data.astype("float32")
+    if not lazy:
+        xr_data = xr_data.load()
 
     if plot:
         xr_data.plot()
@@ -41,12 +121,93 @@ def load_source(filepath: str, plot: bool = False) -> Tuple[xr.DataArray, list,
     region = extract_region(xr_data)
     spacing = extract_spacing(xr_data)
 
-    print(f"Input region: {region}")
-    print(f"Input spacing: {spacing}")
+    logger.info(f"Input region: {region}")
+    logger.info(f"Input spacing: {spacing}")
 
     return xr_data, region, spacing
 
 
+def read_extent(filepath: str) -> Tuple[list, float]:
+    """Reads the bounding region and spacing of a grid without loading its values.
+
+    Only the file header and coordinates are read.
+
+    Args:
+        filepath: Name of file to read.
+
+    Returns:
+        - Bounding region of grid.
+        - Grid spacing.
+    """
+    xr_data = open_source(filepath)
+    region = extract_region(xr_data)
+    spacing = extract_spacing(xr_data)
+    xr_data.close()
+
+    return region, spacing
+
+
+def overview_groups(filepath: str) -> list:
+    """Lists the overview groups of a multiscale NetCDF file or Zarr store.
+
+    Only the file's metadata is read.
+
+    Args:
+        filepath: Name of file to read.
+
+    Returns:
+        Names of the overview groups, from the finest to the coarsest. Empty for other files.
+    """
+    ext = filepath.rstrip("/").split(".")[-1]
+    if ext == "nc":
+        with netCDF4.Dataset(filepath) as dataset:
+            names = list(dataset.groups)
+    elif ext == "zarr" and zarr is not None:
+        names = list(zarr.open_group(filepath, mode="r").group_keys())
+    else:
+        return []
+
+    pattern = re.compile(OVERVIEW_GROUP.format(r"(\d+)") + "$")
+    levels = sorted(
+        int(match.group(1)) for match in map(pattern.match, names) if match
+    )
+    # Overviews are only usable up to the first missing level
+    groups = []
+    for i, level in enumerate(levels, start=1):
+        if level != i:
+            break
+        groups.append(OVERVIEW_GROUP.format(level))
+    return groups
+
+
+def select_overview(filepath: str, spacing: float) -> str:
+    """Selects the coarsest overview of a multiscale file whose spacing is no larger than `spacing`.
+
+    Args:
+        filepath: Name of multiscale NetCDF file or Zarr store.
+        spacing: Grid spacing which the grid will be resampled to.
+
+    Returns:
+        Name of the overview group, or None if the grid at the root of the file should be used.
+    """
+    groups = overview_groups(filepath)
+    if not groups:
+        return None
+
+    root = open_source(filepath)
+    root_spacing = extract_spacing(root)
+    root.close()
+
+    selected = None
+    for level, group in enumerate(groups, start=1):
+        # Allow for rounding of the coordinates, as with aligned lattices
+        if root_spacing * 2 ** level <= spacing * (1 + 1e-6):
+            selected = group
+    if selected is not None:
+        logger.info(f"Reading overview {selected} for spacing {spacing}")
+    return selected
+
+
 def extract_region(xr_data: xr.DataArray) -> list:
     """Extracts the bounding box from an xarray dataarray.
 
@@ -78,44 +239,200 @@ def extract_spacing(xr_data: xr.DataArray) -> float:
     return abs(float(xr_data.x[1] - xr_data.x[0]))
 
 
-def load_netcdf(filepath: str) -> xr.DataArray:
-    """Loads netcdf file.
+def standardise_names(xr_data: xr.DataArray) -> xr.DataArray:
+    """Renames grid values to `z` and coordinates to `x` and `y`.
 
     Args:
-        filepath: File to load.
+        xr_data: Array containing grid.
 
     Returns:
-        Grid as xarray array.
+        Grid with standardised names.
     """
-    xr_data = xr.open_dataarray(filepath)
     xr_data = xr_data.rename("z")
     if "lon" in xr_data.dims:
         # assume lat is also a dimension
         xr_data = xr_data.rename({"lon": "x", "lat": "y"})
 
-    print(f"Resolution: {xr_data.values.shape}")
+    return xr_data
+
+
+def load_netcdf(filepath: str, chunks: dict = None, group: str = None) -> xr.DataArray:
+    """Loads netcdf file.
+
+    Values are not read until they are used.
+
+    Args:
+        filepath: File to load.
+        chunks: Optional chunk sizes with which the grid is opened as a dask array.
+        group: Optional group of the file from which the grid is loaded.
+
+    Returns:
+        Grid as xarray array.
+    """
+    xr_data = xr.open_dataarray(filepath, chunks=chunks, group=group)
+    xr_data = standardise_names(xr_data)
+
+    logger.info(f"Resolution: {xr_data.shape}")
+
+    return xr_data
+
+
+def load_zarr(filepath: str, chunks: dict = None, group: str = None) -> xr.DataArray:
+    """Loads zarr store.
+
+    Values are not read until they are used, and only the chunks of the store which
+    overlap a selection are then read.
+
+    Args:
+        filepath: Store to load.
+        chunks: Optional chunk sizes with which the grid is opened as a dask array.
+        group: Optional group of the store from which the grid is loaded.
+
+    Returns:
+        Grid as xarray array.
+    """
+    xr_data = xr.open_dataarray(filepath, engine="zarr", chunks=chunks, group=group)
+    xr_data = standardise_names(xr_data)
+
+    logger.info(f"Resolution: {xr_data.shape}")
 
     return xr_data
 
 
-def load_geotiff(filepath: str) -> xr.DataArray:
+def load_geotiff(filepath: str, chunks: dict = None) -> xr.DataArray:
     """Loads geotiff file.
 
+    Values are not read until they are used.
+
     Args:
         filepath: File to load.
+        chunks: Optional chunk sizes with which the grid is opened as a dask array.
 
     Returns:
         Grid as xarray array.
     """
-    xr_data = xr.open_rasterio(filepath, parse_coordinates=True)
+    if chunks is not None:
+        chunks = dict(chunks, band=1)
+    xr_data = xr.open_rasterio(filepath, parse_coordinates=True, chunks=chunks)
     xr_data = xr_data.squeeze("band")  # Remove band if present
     del xr_data["band"]
     xr_data = xr_data.rename("z")
 
-    print(f"Resolution: ({xr_data.sizes['x']}, {xr_data.sizes['y']})")
-    print(f"CRS: {xr_data.crs}")
+    logger.info(f"Resolution: ({xr_data.sizes['x']}, {xr_data.sizes['y']})")
+    logger.info(f"CRS: {xr_data.crs}")
+
+    # Flip y coord because rasterio loads the file "upside down".
+    # Reversing with a slice keeps this a view rather than a sorted copy.
+    if xr_data.y.size > 1 and xr_data.y[0] > xr_data.y[-1]:
+        xr_data = xr_data.isel(y=slice(None, None, -1))
+
+    return xr_data
 
-    # Sort by y coord because rasterio loads the file "upside down"
-    xr_data = xr_data.sortby("y")
+
+def overview_pixels(n: int, size: int, factor: int) -> np.ndarray:
+    """Finds the full resolution pixel nearest the centre of each pixel of an overview.
+
+    Args:
+        n: Number of overview pixels.
+        size: Number of full resolution pixels they are read from.
+        factor: Decimation factor of the overview.
+
+    Returns:
+        Index of the full resolution pixel of each overview pixel, rounded down at ties.
+    """
+    start = factor * np.arange(n)
+    stop = np.minimum(start + factor, size)
+    return start + (stop - start - 1) // 2
+
+
+def load_geotiff_window(
+    filepath: str, region: list = None, spacing: float = None
+) -> xr.DataArray:
+    """Reads the part of a geotiff file within a region, at the coarsest suitable resolution.
+
+    If the file contains internal overviews, the coarsest overview whose spacing is no larger
+    than `spacing` is read, with its nodes on the lattice of the full resolution grid. Only
+    the pixels within the region are read.
+
+    Args:
+        filepath: File to load.
+        region: Optional bounding box (in format [xmin, xmax, ymin, ymax]). Defaults to the whole file.
+        spacing: Optional grid spacing which the grid will be resampled to.
+
+    Returns:
+        Grid as xarray array.
+    """
+    with rasterio.open(filepath) as src:
+        col_start, col_stop = 0, src.width
+        row_start, row_stop = 0, src.height
+        if region is not None:
+            # Pixel centres are grid nodes. As with region_to_slices, the bounds of the region
+            # are rounded to the nearest node.
+            xres, yres = src.res
+            left, top = src.transform.c, src.transform.f
+            col_start = max(round((region[0] - left) / xres - 0.5), 0)
+            col_stop = min(round((region[1] - left) / xres - 0.5) + 1, src.width)
+            row_start = max(round((top - region[3]) / yres - 0.5), 0)
+            row_stop = min(round((top - region[2]) / yres - 0.5) + 1, src.height)
+        window = Window(
+            col_start,
+            row_start,
+            max(col_stop - col_start, 0),
+            max(row_stop - row_start, 0),
+        )
+
+        factor = 1
+        if spacing is not None:
+            for overview in src.overviews(1):
+                if overview * max(src.res) <= spacing:
+                    factor = max(factor, overview)
+
+        # Align the window with the pixels of the overview
+        col_off = (window.col_off // factor) * factor
+        row_off = (window.row_off // factor) * factor
+        width = min(
+            math.ceil((window.col_off + window.width - col_off) / factor) * factor,
+            src.width - col_off,
+        )
+        height = min(
+            math.ceil((window.row_off + window.height - row_off) / factor) * factor,
+            src.height - row_off,
+        )
+        # Where the window is clipped at the edge of the raster, only whole overview pixels
+        # are read, so the spacing is that of the overview, as in every other window
+        out_shape = (max(height // factor, 1), max(width // factor, 1))
+        width = min(out_shape[1] * factor, width)
+        height = min(out_shape[0] * factor, height)
+        window = Window(col_off, row_off, width, height)
+        logger.info(f"Reading window {window} with decimation factor {factor}")
+
+        # GDAL reads decimated windows from the matching overview, if there is one
+        values = src.read(1, window=window, out_shape=out_shape)
+
+        # Each overview pixel is placed at the pixel centre of the full resolution grid
+        # nearest its own centre, so nodes lie on the same lattice whether or not the file
+        # has overviews. A single pixel read from fewer than `factor` pixels is placed at
+        # the centre of those.
+        cols = col_off + overview_pixels(out_shape[1], width, factor)
+        rows = row_off + overview_pixels(out_shape[0], height, factor)
+        xres, yres = src.res
+        x = src.transform.c + xres * (cols + 0.5)
+        y = src.transform.f - yres * (rows + 0.5)
+        transform = (
+            rasterio.Affine.translation(x[0], y[0])
+            * rasterio.Affine.scale(xres * factor, -yres * factor)
+            * rasterio.Affine.translation(-0.5, -0.5)
+        )
+
+        attrs = {"transform": tuple(transform)[:6], "nodatavals": src.nodatavals}
+        if src.crs is not None:
+            attrs["crs"] = src.crs.to_string()
+        xr_data = xr.DataArray(
+            values, coords={"y": y, "x": x}, dims=("y", "x"), name="z", attrs=attrs
+        )
+
+    # Flip y coord because rasterio loads the file "upside down"
+    if xr_data.y.size > 1 and xr_data.y[0] > xr_data.y[-1]:
+        xr_data = xr_data.isel(y=slice(None, None, -1))
 
     return xr_data
@@ -0,0 +1,87 @@
+"""
+Merging of difference grids calculated independently against the same base grid
+"""
+
+import numpy as np
+import xarray as xr
+
+from pycascadia.grid import Grid
+from pycascadia.loaders import extract_region
+from pycascadia.utility import region_to_slices
+
+
+class WeightedMerge:
+    """WeightedMerge accumulates the difference grids of many update grids, then applies them in one pass.
+
+    Every difference grid is calculated against the same, original base grid, so update
+    grids are independent of each other and of their order. Where they overlap, their
+    differences are averaged, weighted by the priority of each update grid and by its
+    coverage `c` (see calc_diff_grid): with tapered differences `d = c * r`, the merged
+    difference is
+
+        max(c_i) * sum(w_i * d_i) / sum(w_i * c_i)
+
+    i.e. the weighted average of the untapered differences `r_i`, tapered by the largest
+    coverage. Where only one update grid has data, this is its difference grid as applied
+    by sequential remove-restore. The edge of one update grid within another is blended
+    into the other, rather than tapered towards the base grid.
+
+    Three accumulation buffers the size of the base grid are held in memory.
+    """
+
+    def __init__(self, base_grid: Grid) -> None:
+        """
+        Constructor
+
+        Args:
+            base_grid: Base grid to update.
+        """
+        self.base_grid = base_grid
+        shape = base_grid.grid.transpose("y", "x").shape
+        self.weighted_diff = np.zeros(shape, dtype="float32")
+        self.weighted_coverage = np.zeros(shape, dtype="float32")
+        self.max_coverage = np.zeros(shape, dtype="float32")
+
+    def add(
+        self, diff_grid: xr.DataArray, coverage: xr.DataArray, weight: float = 1.0
+    ) -> None:
+        """Adds the difference grid of an update grid.
+
+        Args:
+            diff_grid: Difference grid, on the same lattice as the base grid and within its region.
+            coverage: Coverage of the difference grid, on the same nodes.
+            weight: Priority of the update grid, relative to those it overlaps.
+        """
+        if not weight > 0:
+            raise ValueError(f"Weights of update grids must be positive, not {weight}")
+
+        slices = region_to_slices(self.base_grid.grid, extract_region(diff_grid))
+        window = (slices["y"], slices["x"])
+        diff = diff_grid.transpose("y", "x").values
+        cover = coverage.transpose("y", "x").values
+
+        self.weighted_diff[window] += weight * diff
+        self.weighted_coverage[window] += weight * cover
+        np.maximum(self.max_coverage[window], cover, out=self.max_coverage[window])
+
+    def merged_diff(self) -> np.ndarray:
+        """Calculates the merged difference grid.
+
+        Returns:
+            Merged differences for every node of the base grid (in format (ny, nx)).
+        """
+        merged = np.zeros_like(self.weighted_diff)
+        np.divide(
+            self.weighted_diff,
+            self.weighted_coverage,
+            out=merged,
+            where=self.weighted_coverage > 0,
+        )
+        merged *= self.max_coverage
+        return merged
+
+    def apply(self) -> None:
+        """Adds the merged differences to the base grid in place, then releases the buffers."""
+        merged = self.merged_diff()
+        self.weighted_diff = self.weighted_coverage = self.max_coverage = None
+        self.base_grid.grid += xr.DataArray(merged, dims=("y", "x"))
@@ -0,0 +1,109 @@
+"""
+Handling of nodata, which GeoTiffs, NetCDF files and Zarr stores each mark differently
+"""
+
+import numpy as np
+import xarray as xr
+
+# Attributes in which loaders record values representing a lack of data: `nodatavals`
+# by rasterio for GeoTiffs, `_FillValue` and `missing_value` by NetCDF and Zarr when
+# they are not already decoded to NaN by xarray
+NODATA_ATTRS = ("nodatavals", "_FillValue", "missing_value")
+
+# Number of cells tested at once by all_values_are_nodata
+NODATA_CHUNK_CELLS = 2 ** 20
+
+
+def nodata_values(grid: xr.DataArray) -> list:
+    """Finds the values representing a lack of data in a grid, from its attributes.
+
+    NaN is always treated as nodata, so is not included.
+
+    Args:
+        grid: Xarray grid.
+
+    Returns:
+        List of distinct nodata values.
+    """
+    nodatavals = []
+    for attr in NODATA_ATTRS:
+        for value in np.atleast_1d(grid.attrs.get(attr, [])):
+            if value is None or np.isnan(value) or value in nodatavals:
+                continue
+            nodatavals.append(float(value))
+    return nodatavals
+
+
+def nodata_mask(values: np.ndarray, nodatavals: list = None) -> np.ndarray:
+    """Finds the cells of an array which lack data.
+
+    Args:
+        values: Array of values.
+        nodatavals: Optional list of values representing a lack of data. NaN is always treated as nodata.
+
+    Returns:
+        Boolean array which is True where there is no data.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        mask = np.isnan(values)
+    else:
+        mask = np.zeros(values.shape, dtype=bool)
+
+    if nodatavals is not None:
+        nodatavals = [val for val in np.atleast_1d(nodatavals) if not np.isnan(val)]
+        if len(nodatavals) == 1:
+            mask |= values == nodatavals[0]
+        elif nodatavals:
+            mask |= np.isin(values, nodatavals)
+    return mask
+
+
+def valid_data_mask(values: np.ndarray, nodatavals: list = None) -> np.ndarray:
+    """Finds the cells of an array which contain data.
+
+    Args:
+        values: Array of values.
+        nodatavals: Optional list of values representing a lack of data. NaN is always treated as nodata.
+
+    Returns:
+        Boolean array which is True where there is data.
+    """
+    mask = nodata_mask(values, nodatavals)
+    np.logical_not(mask, out=mask)
+    return mask
+
+
+def all_values_are_nodata(
+    grid: xr.DataArray,
+    nodatavals: list = None,
+    chunk_cells: int = NODATA_CHUNK_CELLS,
+) -> bool:
+    """Determines if all values in grid are nodata
+
+    The grid is tested a strip of rows at a time, stopping at the first strip containing
+    data, so grids with data are usually accepted after reading only a small part of them.
+    Lazily loaded grids are only read up to that strip.
+
+    Args:
+        grid: Xarray grid.
+        nodatavals: Optional list of values representing a lack of data. Defaults to those
+            recorded in the attributes of the grid. NaN is always treated as nodata.
+        chunk_cells: Approximate number of cells tested at once.
+
+    Returns:
+        True if all values in grid are nodata values, False otherwise.
+    """
+    if nodatavals is None:
+        nodatavals = nodata_values(grid)
+    if grid.ndim == 0:
+        return bool(nodata_mask(grid.values, nodatavals))
+
+    dim = grid.dims[0]
+    row_cells = max(grid.size // max(grid.sizes[dim], 1), 1)
+    rows = max(chunk_cells // row_cells, 1)
+    for start in range(0, grid.sizes[dim], rows):
+        values = grid.isel({dim: slice(start, start + rows)}).values
+        if not nodata_mask(values, nodatavals).all():
+            return False
+    return True
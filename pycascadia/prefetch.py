@@ -0,0 +1,129 @@
+"""
+Background loading of update grids, overlapping reads from disk with the processing of earlier grids
+"""
+
+import queue
+import threading
+from typing import Callable
+
+
+class Prefetcher:
+    """Prefetcher loads a sequence of files in a background thread, ahead of their use.
+
+    Files are loaded in order and passed through a bounded queue. At most `depth` files
+    are loaded ahead of the one in use and, given a memory budget, a file is only loaded
+    ahead once the estimated size of it, the files already waiting and the file in use
+    fits within the budget. The file in use is released when the next one is requested.
+
+    Errors raised while loading a file are raised when that file is reached.
+
+    Intended to be used as a context manager:
+
+        with Prefetcher(fnames, load, depth=2) as prefetcher:
+            for fname, result in prefetcher:
+                process(result)
+    """
+
+    def __init__(
+        self,
+        fnames: list,
+        load: Callable,
+        depth: int = 1,
+        memory_budget: float = None,
+        sizes: list = None,
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            fnames: Files to load, in order.
+            load: Function loading a file, given its filename.
+            depth: Maximum number of files loaded ahead of the one in use.
+            memory_budget: Optional memory available to loaded files, in bytes.
+            sizes: Estimated memory required by each loaded file, in bytes. Required with `memory_budget`.
+        """
+        if depth < 1:
+            raise ValueError(f"Prefetch depth must be at least 1, not {depth}")
+        if memory_budget is not None and sizes is None:
+            raise ValueError("Estimated sizes of files are required with a memory budget")
+
+        self.fnames = list(fnames)
+        self.load = load
+        self.depth = depth
+        self.memory_budget = memory_budget
+        self.sizes = list(sizes) if sizes is not None else [0] * len(self.fnames)
+
+        self.queue = queue.Queue(maxsize=depth)
+        self.condition = threading.Condition()
+        self.ahead = 0
+        self.bytes_in_use = 0
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _fits(self, size: float) -> bool:
+        if self.stopped:
+            return True
+        if self.ahead >= self.depth:
+            return False
+        # A file is always loaded if nothing else is held, however large it is
+        return (
+            self.memory_budget is None
+            or self.bytes_in_use == 0
+            or self.bytes_in_use + size <= self.memory_budget
+        )
+
+    def _run(self) -> None:
+        """Loads each file in turn, waiting whenever the queue or memory budget is full."""
+        for fname, size in zip(self.fnames, self.sizes):
+            with self.condition:
+                self.condition.wait_for(lambda: self._fits(size))
+                if self.stopped:
+                    return
+                self.ahead += 1
+                self.bytes_in_use += size
+
+            try:
+                item = (fname, self.load(fname), None)
+            except Exception as error:
+                item = (fname, None, error)
+            self.queue.put(item)
+
+    def __iter__(self):
+        previous_size = None
+        for size in self.sizes:
+            # The file in use is released first, as the next file may only fit once it is
+            if previous_size is not None:
+                with self.condition:
+                    self.bytes_in_use -= previous_size
+                    self.condition.notify_all()
+            previous_size = size
+
+            fname, result, error = self.queue.get()
+            with self.condition:
+                self.ahead -= 1
+                self.condition.notify_all()
+
+            if error is not None:
+                raise error
+            yield fname, result
+
+    def close(self) -> None:
+        """Stops loading files and waits for the background thread to finish."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        # Unblock the background thread if it is waiting to add a file to the full queue
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
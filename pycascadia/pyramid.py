@@ -0,0 +1,314 @@
+"""
+Multiscale pyramids of grids, in which each level halves the resolution of the one before
+"""
+
+import argparse
+import logging
+import sys
+
+import numpy as np
+
+from pycascadia.grid import Grid, SAVE_TILE_SIZE
+from pycascadia.loaders import OVERVIEW_GROUP
+from pycascadia.nodata import nodata_mask, nodata_values
+from pycascadia.writers import (
+    open_grid_writer,
+    output_format,
+    NetCDFGridWriter,
+    ZarrGridWriter,
+    COMPRESSIONS,
+    DTYPES,
+)
+
+# Overviews are added until the next would have fewer nodes than this along either side
+PYRAMID_MIN_SIZE = 256
+
+
+def _halve_columns(values: np.ndarray) -> tuple:
+    """Filters and decimates the rows of a strip of a grid, see Downsampler.
+
+    Args:
+        values: Values of the strip (in format (ny, nx)), with NaN marking nodes without data.
+
+    Returns:
+        - Weighted sums of the values around every other node.
+        - Sums of the weights of the nodes with data.
+    """
+    nx = values.shape[1]
+    n = (nx - 1) // 2 + 1
+    # A column of zero weight either side, so filters are truncated at the edges of the grid
+    weights = np.zeros((values.shape[0], nx + 2))
+    weights[:, 1:-1] = ~np.isnan(values)
+    sums = np.zeros((values.shape[0], nx + 2))
+    sums[:, 1:-1] = np.where(weights[:, 1:-1] > 0, values, 0.0)
+
+    def halve(array):
+        return (
+            array[:, 0 : 2 * n : 2]
+            + 2.0 * array[:, 1 : 2 * n + 1 : 2]
+            + array[:, 2 : 2 * n + 2 : 2]
+        )
+
+    return halve(sums), halve(weights)
+
+
+class Downsampler:
+    """Downsampler halves the resolution of a grid streamed to it as strips of rows.
+
+    Each node of the output is a node of the input: every other column and row, starting
+    from the first, so the output stays gridline-registered on the same origin. Its value
+    is a weighted average of the 3x3 input nodes around it, with weights 1-2-1 along each
+    axis. Nodes without data (NaN) are left out of the average, as are nodes outside the
+    grid, and output nodes with no data around them are NaN.
+
+    Only the last input row of each strip is kept between strips, so grids of any
+    height can be downsampled in bounded memory.
+    """
+
+    def __init__(self, nx: int, ny: int) -> None:
+        """
+        Constructor
+
+        Args:
+            nx: Number of nodes of the input grid in the x direction.
+            ny: Number of nodes of the input grid in the y direction.
+        """
+        self.ny = ny
+        self.shape = ((ny - 1) // 2 + 1, (nx - 1) // 2 + 1)
+        # Filtered input rows not yet used, starting from a row of zero weight above the grid
+        self.sums = np.zeros((1, self.shape[1]))
+        self.weights = np.zeros((1, self.shape[1]))
+        self.first_row = -1
+        self.rows_received = 0
+        self.rows_sent = 0
+
+    def push(self, values: np.ndarray) -> np.ndarray:
+        """Adds the next rows of the input grid.
+
+        Args:
+            values: Values of the rows (in format (ny, nx)), with NaN marking nodes without data.
+
+        Returns:
+            The next rows of the output grid which can be calculated (possibly none).
+        """
+        sums, weights = _halve_columns(values)
+        self.rows_received += len(values)
+        blocks = [self.sums, sums]
+        weight_blocks = [self.weights, weights]
+        if self.rows_received >= self.ny:
+            # A row of zero weight below the grid
+            blocks.append(np.zeros((1, self.shape[1])))
+            weight_blocks.append(np.zeros((1, self.shape[1])))
+        self.sums = np.concatenate(blocks)
+        self.weights = np.concatenate(weight_blocks)
+
+        # Output row j is centred on input row 2j, and needs input rows 2j - 1 to 2j + 1
+        last_row = self.first_row + len(self.sums) - 1
+        stop = min((last_row - 1) // 2 + 1, self.shape[0])
+        rows = 2 * np.arange(self.rows_sent, stop) - self.first_row
+        out_sums = self.sums[rows - 1] + 2.0 * self.sums[rows] + self.sums[rows + 1]
+        out_weights = (
+            self.weights[rows - 1] + 2.0 * self.weights[rows] + self.weights[rows + 1]
+        )
+        self.rows_sent = stop
+
+        # Keep the input rows from the one above the centre of the next output row
+        keep = 2 * stop - 1 - self.first_row
+        self.sums = self.sums[keep:]
+        self.weights = self.weights[keep:]
+        self.first_row += keep
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = out_sums / out_weights
+        out[out_weights == 0] = np.nan
+        return out.astype("float32")
+
+
+def pyramid_depth(nx: int, ny: int, min_size: int = PYRAMID_MIN_SIZE) -> int:
+    """Finds how many overviews of a grid have at least `min_size` nodes along each side.
+
+    Args:
+        nx: Number of nodes of the grid in the x direction.
+        ny: Number of nodes of the grid in the y direction.
+        min_size: Minimum number of nodes along each side of an overview.
+
+    Returns:
+        Number of overviews.
+    """
+    levels = 0
+    while min(nx, ny) > 1:
+        nx, ny = (nx - 1) // 2 + 1, (ny - 1) // 2 + 1
+        if min(nx, ny) < min_size:
+            break
+        levels += 1
+    return levels
+
+
+def build_pyramid(
+    grid: Grid,
+    fname: str,
+    levels: int = None,
+    min_size: int = PYRAMID_MIN_SIZE,
+    tile_size: int = SAVE_TILE_SIZE,
+    **kwargs,
+) -> int:
+    """Saves a grid with a chain of progressively coarser overviews, in a single pass.
+
+    The grid is written at the root of a NetCDF file or Zarr store, as by `Grid.save_grid`,
+    so the file can be used as any other grid. Overview `i`, with 2**i times the spacing
+    of the grid, is written to group `overview_<i>` (see pycascadia.loaders.OVERVIEW_GROUP)
+    and is downsampled from overview `i - 1` by a Downsampler. The grid is read strip by
+    strip, each strip is passed down the chain, and the rows of every level are written as
+    they are completed, so only a few rows of each level are ever held in memory.
+
+    `load_source` and `Grid` read the coarsest overview no coarser than a requested spacing.
+
+    Args:
+        grid: Grid to save, e.g. the merged grid output by remove-restore. May be lazily loaded.
+        fname: Output filename, ending in `.zarr` for a Zarr store or otherwise NetCDF.
+        levels: Number of overviews. Defaults to as many as have at least `min_size` nodes
+            along each side.
+        min_size: Minimum number of nodes along each side of an overview, if `levels` is not given.
+        tile_size: Approximate number of nodes along each side of the strips in which the
+            grid is read, i.e. the strips are `tile_size**2` nodes.
+        kwargs: Options of the output format, e.g. chunk shape, compression and data type.
+            See pycascadia.writers.
+
+    Returns:
+        Number of overviews written.
+    """
+    if output_format(fname) == "geotiff":
+        raise ValueError(
+            "GeoTiffs hold overviews internally, save them with Grid.save_grid instead"
+        )
+
+    xr_grid = grid.grid.transpose("y", "x")
+    if xr_grid.y.size > 1 and xr_grid.y[0] > xr_grid.y[-1]:
+        xr_grid = xr_grid.isel(y=slice(None, None, -1))
+    x = xr_grid.x.values
+    y = xr_grid.y.values
+    if levels is None:
+        levels = pyramid_depth(len(x), len(y), min_size=min_size)
+    nodatavals = nodata_values(xr_grid)
+
+    writers = [open_grid_writer(fname, x, y, attrs=xr_grid.attrs, **kwargs)]
+    downsamplers = []
+    rows_written = [0]
+    try:
+        for level in range(1, levels + 1):
+            downsamplers.append(Downsampler(len(x), len(y)))
+            x, y = x[::2], y[::2]
+            group = OVERVIEW_GROUP.format(level)
+            if output_format(fname) == "zarr":
+                writer = ZarrGridWriter(
+                    fname, x, y, attrs=xr_grid.attrs, group=group, **kwargs
+                )
+            else:
+                # Overviews are groups of the netcdf file the first writer has open
+                writer = NetCDFGridWriter(
+                    writers[0].dataset, x, y, attrs=xr_grid.attrs, group=group, **kwargs
+                )
+            writers.append(writer)
+            rows_written.append(0)
+
+        nx = xr_grid.sizes["x"]
+        strip_rows = max(tile_size ** 2 // max(nx, 1), 1)
+        for start in range(0, xr_grid.sizes["y"], strip_rows):
+            values = xr_grid[start : start + strip_rows].values.astype("float32")
+            values[nodata_mask(values, nodatavals)] = np.nan
+
+            for level, writer in enumerate(writers):
+                if level > 0:
+                    values = downsamplers[level - 1].push(values)
+                if len(values) == 0:
+                    break
+                rows = slice(rows_written[level], rows_written[level] + len(values))
+                writer.write(values, {"x": slice(None), "y": rows})
+                rows_written[level] = rows.stop
+    finally:
+        # Overviews first, as the first writer may own the file they are written to
+        for writer in writers[::-1]:
+            writer.close()
+
+    return levels
+
+
+def main():
+    """Main entry point for build-pyramid command line tool.
+
+    This handles arguments, then saves the input grid with its overviews as by build_pyramid.
+    """
+    # Handle arguments
+    parser = argparse.ArgumentParser(
+        description="Save a grid with progressively coarser overviews, e.g. to resample it to several resolutions"
+    )
+    parser.add_argument("--input", required=True, help="input grid file")
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="output multiscale file, a Zarr store if it ends in .zarr or otherwise netcdf",
+    )
+    parser.add_argument(
+        "--levels",
+        required=False,
+        type=int,
+        help="number of overviews, each with twice the spacing of the last. Defaults to as many as have at least --min_size nodes along each side",
+    )
+    parser.add_argument(
+        "--min_size",
+        default=PYRAMID_MIN_SIZE,
+        type=int,
+        help="minimum number of nodes along each side of the coarsest overview",
+    )
+    parser.add_argument(
+        "--output_chunks",
+        required=False,
+        metavar=("ny", "nx"),
+        nargs=2,
+        type=int,
+        help="chunk shape of each level",
+    )
+    parser.add_argument(
+        "--compression",
+        required=False,
+        choices=COMPRESSIONS,
+        help="compress the output",
+    )
+    parser.add_argument(
+        "--compression_level",
+        required=False,
+        type=int,
+        help="compression level. Defaults to the codec's default",
+    )
+    parser.add_argument(
+        "--output_dtype",
+        default="float32",
+        choices=DTYPES,
+        help="data type in which values are stored. int16 values are scaled by --scale_factor",
+    )
+    parser.add_argument(
+        "--scale_factor",
+        default=1.0,
+        type=float,
+        help="precision of int16 output values, in the units of the grid",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
+
+    grid = Grid(args.input, lazy=True)
+    levels = build_pyramid(
+        grid,
+        args.output,
+        levels=args.levels,
+        min_size=args.min_size,
+        chunks=args.output_chunks,
+        compression=args.compression,
+        complevel=args.compression_level,
+        dtype=args.output_dtype,
+        scale_factor=args.scale_factor,
+    )
+    print(f"Saved {args.output} with {levels} overviews")
+
+
+if __name__ == "__main__":
+    main()
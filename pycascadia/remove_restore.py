@@ -7,7 +7,7 @@ Note that the remove-restore algorithm consists of only "step D" described in
 the cookbook. Preprocessing steps A-C are not included here.
 """
 
-from pygmt import blockmedian, grdtrack, grdfilter
+from pygmt import blockmedian, grdtrack
 from pygmt.clib import Session
 from pygmt.helpers import (
     GMTTempFile,
@@ -17,18 +17,77 @@ from pygmt.helpers import (
 )
 
 import xarray as xr
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import argparse
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Tuple
 
+from pycascadia import kernels
+from pycascadia.cache import DiffCache, base_read_region
 from pycascadia.grid import Grid
+from pycascadia.index import FootprintIndex
+from pycascadia.merge import WeightedMerge
+from pycascadia.nodata import nodata_values, valid_data_mask
+from pycascadia.prefetch import Prefetcher
+from pycascadia.profiling import Profiler
+from pycascadia.loaders import (
+    open_source,
+    read_extent,
+    extract_region,
+    extract_spacing,
+)
+from pycascadia.tiling import (
+    extent_cells,
+    source_halo,
+    tile_size_from_memory,
+    plan_tiles_within_memory,
+    tile_region,
+    tile_window,
+)
 from pycascadia.utility import (
     min_regions,
     is_region_valid,
-    read_fnames,
-    all_values_are_nodata,
+    read_weighted_fnames,
+    expand_region,
+    snap_region,
+    region_to_slices,
+)
+from pycascadia.writers import (
+    open_grid_writer,
+    output_format,
+    ZarrGridWriter,
+    COMPRESSIONS,
+    DTYPES,
 )
 
+logger = logging.getLogger(__name__)
+
+# Implementations of blockmedian, grdtrack and nearneighbour used to calculate difference grids
+BACKENDS = ("gmt", "native")
+
+# Ways of combining update grids: applied in turn, each differenced against the base grid
+# as updated by those before, or differenced against the original base grid and merged
+MERGE_MODES = ("sequential", "weighted")
+
+# netCDF-C and HDF5 are usually built without thread safety, so netCDF files are never
+# read or written by two threads at once: update grids loaded in the prefetch thread, and
+# the grids GMT's nearneighbour writes, and which are read back, in the main thread
+NETCDF_LOCK = threading.Lock()
+
+# Approximate memory required per node of a loaded update grid, in bytes: the float32 value
+# and, if it is converted to xyz points, three float64 coordinates
+UPDATE_GRID_BYTES_PER_CELL = 28
+
 
 @use_alias(
     I="spacing",
@@ -61,36 +120,195 @@ def nearneighbour(data_xyz, **kwargs):
     return result
 
 
-def create_interpolation_grid(
-    diff_grid: xr.DataArray, nodata_val: int, window_width: int
+def update_footprint(
+    base_grid: Grid,
+    minimal_region: list,
+    max_spacing: float,
+    window_width: float = None,
+) -> list:
+    """Finds the region of the base grid which an update grid can change.
+
+    Differences extend up to the nearneighbour search radius beyond the update grid,
+    and the smoothing window looks a further `window_width` beyond that.
+
+    Args:
+        base_grid: Base grid.
+        minimal_region: Intersection of the update and base grid regions.
+        max_spacing: Larger of the update and base grid spacings.
+        window_width: Width of optional smoothing window around update grid.
+
+    Returns:
+        Region whose bounds lie on the nodes of the base grid.
+    """
+    padding = 2 * max_spacing + (window_width or 0.0) + base_grid.spacing
+    slices = region_to_slices(base_grid.grid, expand_region(minimal_region, padding))
+    return extract_region(base_grid.grid[slices])
+
+
+def _blockmedian_update_grid(
+    update_grid: Grid,
+    spacing: float,
+    region: list,
+    data: np.ndarray,
+    profiler: Profiler,
+    backend: str = "gmt",
+    fast_path: bool = True,
+) -> pd.DataFrame:
+    """Calculates the block medians of an update grid, for calc_diff_grid.
+
+    Block medians are calculated directly from the grid if its nodes tile the blocks
+    exactly (and `fast_path`), and otherwise from its xyz points, converting it if needed.
+
+    Args:
+        update_grid: Update grid.
+        spacing: Block width.
+        region: Region in which the update grid is blockmedianed.
+        data: Mask of the nodes of the update grid which hold data.
+        profiler: Profiler recording each stage.
+        backend: Implementation of blockmedian, either "gmt" or "native".
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+
+    Returns:
+        Block medians as a DataFrame with x, y and z columns.
+    """
+    if fast_path:
+        with profiler.stage("blockmedian_grid", cells=update_grid.grid.size) as record:
+            bmd = kernels.blockmedian_grid(
+                update_grid.grid,
+                update_grid.spacing,
+                spacing=spacing,
+                region=region,
+                data=data,
+            )
+            record["output_points"] = None if bmd is None else len(bmd)
+        if bmd is not None:
+            return bmd
+
+    if getattr(update_grid, "xyz", None) is None:
+        with profiler.stage("to_xyz", cells=update_grid.grid.size) as record:
+            update_grid.xyz = update_grid.as_xyz(data=data)
+            record["points"] = len(update_grid.xyz)
+
+    with profiler.stage("blockmedian", points=len(update_grid.xyz)) as record:
+        if update_grid.xyz.empty:
+            bmd = update_grid.xyz
+        elif backend == "native":
+            bmd = kernels.blockmedian(update_grid.xyz, spacing=spacing, region=region)
+        else:
+            bmd = blockmedian(update_grid.xyz, spacing=spacing, region=region)
+        record["output_points"] = len(bmd)
+    return bmd
+
+
+def _track_base_grid(
+    points: pd.DataFrame, base_grid: xr.DataArray, backend: str = "gmt"
+) -> pd.DataFrame:
+    """Interpolates the base grid at the block medians with grdtrack, for calc_diff_grid.
+
+    Args:
+        points: Block medians as a DataFrame with x, y and z columns.
+        base_grid: Base grid, or the part of it surrounding the points.
+        backend: Implementation of grdtrack, either "gmt" or "native".
+
+    Returns:
+        Points with the bilinearly interpolated base grid in an added `base_z` column.
+    """
+    if backend == "native":
+        return kernels.grdtrack(points, base_grid, "base_z")
+    return grdtrack(points, base_grid, "base_z", interpolation="l")
+
+
+def _grid_differences(
+    diff: pd.DataFrame,
+    region: list,
+    spacing: float,
+    max_spacing: float,
+    nodata: float,
+    backend: str = "gmt",
 ) -> xr.DataArray:
-    """Create filter to smooth hard edge of difference grid.
+    """Grids the differences at the block medians with nearneighbour, for calc_diff_grid.
+
+    Args:
+        diff: Differences as a DataFrame with x, y and z columns.
+        region: Region of the difference grid.
+        spacing: Spacing of the difference grid.
+        max_spacing: Larger of the update and base grid spacings, which sets the search radius.
+        nodata: Value of nodes with too few differences nearby.
+        backend: Implementation of nearneighbour, either "gmt" or "native".
+
+    Returns:
+        Difference grid.
+    """
+    if backend == "native":
+        return kernels.nearneighbour(
+            diff,
+            region=region,
+            spacing=spacing,
+            radius=2 * max_spacing,
+            sectors=4,
+            nodata=nodata,
+        )
+
+    with NETCDF_LOCK:
+        return nearneighbour(
+            diff,
+            region=region,
+            spacing=spacing,
+            S=2 * max_spacing,
+            N=4,
+            E=nodata,
+            verbose=True,
+        )
+
 
-    This works by creating a grid containing 1 where there is data in the input
-    grid and a 0 where there is none, then applying a filter to this grid to
-    smooth the boundary. This can be directly multiplied by the difference grid
-    to smooth its edges.
+def _taper_diff_grid(
+    diff_grid: xr.DataArray,
+    nodata: float,
+    window_width: float,
+    spacing: float,
+    profiler: Profiler,
+    return_coverage: bool = False,
+) -> np.ndarray:
+    """Removes nodata from a difference grid in place, tapering its edges if there is a window.
 
     Args:
-        diff_grid: Difference grid to calculate smoothing filter from.
-        nodata_val: Value in grid representing a lack of data.
-        window_width: Width of smoothing region at data boundary.
+        diff_grid: Difference grid from nearneighbour.
+        nodata: Value of nodes without data.
+        window_width: Width of optional smoothing window.
+        spacing: Spacing of the difference grid.
+        profiler: Profiler recording each stage.
+        return_coverage: Whether to return the coverage of the difference grid.
 
     Returns:
-        Grid which should be multiplied by input grid in order to smooth.
+        Coverage of the difference grid if `return_coverage`, otherwise None.
     """
-    # nodata_grid = xr.where(diff_grid == nodata_val, 1.0, 0.0) # This doesn't work, for reference
+    # Nodes of the difference grid with data, shared by the window filter and nodata removal
+    data = valid_data_mask(diff_grid.values, [nodata])
+    coverage = None
+    if return_coverage:
+        coverage = data.astype(diff_grid.dtype)
 
-    # Form grid of 0.0 where there's no data and 1.0 where there's data
-    nodata_grid = diff_grid.where(diff_grid == nodata_val, 1.0)
-    nodata_grid = nodata_grid.where(diff_grid != nodata_val, 0.0)
-    # Use boxcar filter to smooth hard boundary between data & no data
-    interp_grid = grdfilter(nodata_grid, filter=f"b{2*window_width}", distance=0)
-    # Rescale and keep only one side of window, that on the data side
-    interp_grid = (interp_grid - 0.5) * 2.0
-    interp_grid = interp_grid.where(interp_grid > 0.0, 0.0)
+    if not window_width:
+        # Filter out nodata in place
+        diff_grid.values[~data] = 0.0
+        return coverage
 
-    return interp_grid
+    # Interpolate between nodata and data regions in update grid. With either backend, the
+    # window is applied natively, as by GMT's grdfilter but without a GMT round-trip
+    with profiler.stage("window_filter", cells=diff_grid.size):
+        # Taper the difference grid in place, filtering only near the edge of its data
+        kernels.taper(
+            diff_grid.values if coverage is None else coverage,
+            nodata,
+            window_width,
+            spacing,
+            spacing,
+            data=data,
+        )
+        if coverage is not None:
+            # The difference grid is tapered by its coverage, which is zero at nodata
+            diff_grid.values[...] *= coverage
+    return coverage
 
 
 def calc_diff_grid(
@@ -98,72 +316,786 @@ def calc_diff_grid(
     update_grid: Grid,
     diff_threshold: float = 0.0,
     window_width: int = None,
+    region: list = None,
+    block_region: list = None,
+    profiler: Profiler = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    return_coverage: bool = False,
 ) -> xr.DataArray:
     """Calculates difference grid for use in remove-restore.
 
+    When the update grid's nodes tile the blockmedian blocks exactly (the block width is
+    an odd multiple of its spacing and the blocks are centred on its nodes), the block
+    medians are calculated directly from the grid. Otherwise the update grid is converted
+    to xyz points, if it has not been already, and passed to blockmedian.
+
     Args:
         base_grid: Base grid to be later updated using the calculated difference grid.
         update_grid: Differences will be calculated between this and the base grid.
         diff_threshold: Optional threshold above which a difference will be applied.
         window_width: Width of optional smoothing window around update grid.
+        region: Region of the difference grid. Defaults to the part of the base grid
+            which the update grid can change.
+        block_region: Region in which the update grid is blockmedianed. Defaults to the
+            intersection of the update and base grid regions.
+        profiler: Optional profiler recording each stage.
+        backend: Implementation of blockmedian, grdtrack and nearneighbour, either "gmt"
+            (pyGMT) or "native" (NumPy, working on in-memory arrays).
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        return_coverage: Whether to also return the coverage of the difference grid.
 
     Returns:
-        Difference grid for updating base grid.
+        Difference grid for updating base grid, covering only the nodes in `region`.
+        If `return_coverage`, a tuple of the difference grid and its coverage: the weight,
+        from 0 to 1, with which the update grid's data covers each node, i.e. the window
+        which tapers the differences (or 1 wherever there is data, without a window).
     """
-    print("Blockmedian update grid")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    # Returned when the update grid changes nothing
+    skipped = (None, None) if return_coverage else None
+
+    logger.info("Blockmedian update grid")
     max_spacing = max(update_grid.spacing, base_grid.spacing)
-    minimal_region = min_regions(update_grid.region, base_grid.region)
+    if block_region is None:
+        block_region = min_regions(update_grid.region, base_grid.region)
+    minimal_region = block_region
     if not is_region_valid(minimal_region):
-        print("Update grid is entirely outside region of interest. Skipping.")
-        return None
+        logger.info("Update grid is entirely outside region of interest. Skipping.")
+        return skipped
 
-    if all_values_are_nodata(update_grid.grid):
-        print("Update grid consists entirely of no_data_values. Skipping.")
-        return None
+    if region is None:
+        region = update_footprint(base_grid, minimal_region, max_spacing, window_width)
 
-    bmd = blockmedian(update_grid.xyz, spacing=max_spacing, region=minimal_region)
+    # Nodes of the update grid with data, shared by the blockmedian of the grid or the
+    # conversion to xyz points, whichever is used
+    data = valid_data_mask(update_grid.grid.values, nodata_values(update_grid.grid))
+    if not data.any():
+        logger.info("Update grid consists entirely of no_data_values. Skipping.")
+        return skipped
 
-    print("Find z in base grid")
-    base_pts = grdtrack(bmd, base_grid.grid, "base_z", interpolation="l")
+    bmd = _blockmedian_update_grid(
+        update_grid,
+        max_spacing,
+        minimal_region,
+        data,
+        profiler,
+        backend=backend,
+        fast_path=fast_path,
+    )
+    if bmd.empty:
+        logger.info("Update grid has no data within region of interest. Skipping.")
+        return skipped
+
+    logger.info("Find z in base grid")
+    with profiler.stage("grdtrack", points=len(bmd)):
+        # Only the base grid nodes surrounding the block medians are needed for interpolation
+        track_region = base_read_region(base_grid, update_grid.region, block_region)
+        track_grid = base_grid.grid[region_to_slices(base_grid.grid, track_region)]
+        base_pts = _track_base_grid(bmd, track_grid, backend=backend)
 
-    print("Create difference grid")
-    diff = pd.DataFrame()
-    diff["x"] = base_pts["x"]
-    diff["y"] = base_pts["y"]
-    diff["z"] = base_pts["z"] - base_pts["base_z"]
+    logger.info("Create difference grid")
+    # Coordinates are shared with the tracked points, and differences are held in single
+    # precision, as nearneighbour grids them
+    diff = pd.DataFrame(
+        {
+            "x": base_pts["x"],
+            "y": base_pts["y"],
+            "z": (base_pts["z"].values - base_pts["base_z"].values).astype("float32"),
+        },
+        copy=False,
+    )
+    del bmd, base_pts
 
-    diff[diff.z.abs() < diff_threshold]["z"] = 0.0  # Filter out small differences
+    if diff_threshold:
+        # Filter out small differences
+        diff.loc[diff["z"].abs() < diff_threshold, "z"] = 0.0
 
     NODATA_VAL = 9999
 
-    diff_grid = nearneighbour(
-        diff,
-        region=base_grid.region,
-        spacing=base_grid.spacing,
-        S=2 * max_spacing,
-        N=4,
-        E=NODATA_VAL,
-        verbose=True,
+    with profiler.stage("nearneighbour", points=len(diff)) as record:
+        diff_grid = _grid_differences(
+            diff, region, base_grid.spacing, max_spacing, NODATA_VAL, backend=backend
+        )
+        record["cells"] = diff_grid.size
+
+    coverage = _taper_diff_grid(
+        diff_grid,
+        NODATA_VAL,
+        window_width,
+        base_grid.spacing,
+        profiler,
+        return_coverage=return_coverage,
     )
 
-    # Interpolate between nodata and data regions in update grid
-    if window_width:
-        interp_grid = create_interpolation_grid(diff_grid, NODATA_VAL, window_width)
+    if return_coverage:
+        return diff_grid, diff_grid.copy(data=coverage)
+    return diff_grid
+
+
+def load_update_grid(
+    fname: str, region: list = None, profiler: Profiler = None
+) -> Grid:
+    """Load update grid from file.
+
+    The grid is only converted to xyz points by calc_diff_grid, if needed.
+
+    Args:
+        fname: Filename of update grid.
+        region: Optional region to load.
+        profiler: Optional profiler recording each stage.
+
+    Returns:
+        Grid containing update grid.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    logger.info("Loading update grid")
+    with profiler.stage("load") as record:
+        update_grid = Grid(fname, region=region)
+        record["cells"] = update_grid.grid.size
+
+    return update_grid
+
+
+def points_update_grid(xyz, spacing: float) -> Grid:
+    """Wraps scattered xyz points, e.g. a survey, as an update grid for calc_diff_grid.
+
+    Only the xyz points, region and spacing of the update grid are defined: it has no
+    lattice, so block medians are always calculated from its points (its `grid` holds the
+    z values of the points, along dimension `point`, so nodata is found as for grids).
+
+    Args:
+        xyz: Points as a DataFrame with x, y and z columns, or an array of shape (n, 3).
+        spacing: Resolution of the points, at which they are blockmedianed if it is coarser
+            than the spacing of the base grid.
 
-        # Filter out nodata
-        diff_grid = diff_grid.where(diff_grid != NODATA_VAL, 0.0)
-        # Filter the original difference grid using the interpolation grid
-        diff_grid = diff_grid * interp_grid
+    Returns:
+        Grid containing the points, without NaN values. Its region is NaN if there are none.
+    """
+    if isinstance(xyz, pd.DataFrame):
+        xyz = xyz[["x", "y", "z"]]
     else:
-        # Filter out nodata
-        diff_grid = diff_grid.where(diff_grid != NODATA_VAL, 0.0)
+        xyz = pd.DataFrame(np.asarray(xyz, dtype=np.float64), columns=["x", "y", "z"])
+    xyz = xyz[xyz["z"].notna()].reset_index(drop=True)
 
-    return diff_grid
+    update_grid = Grid.__new__(Grid)
+    update_grid.xyz = xyz
+    update_grid.grid = xr.DataArray(xyz["z"].values, dims="point", name="z")
+    update_grid.region = [
+        float(xyz["x"].min()),
+        float(xyz["x"].max()),
+        float(xyz["y"].min()),
+        float(xyz["y"].max()),
+    ]
+    update_grid.spacing = spacing
+    return update_grid
+
+
+def prefetch_update_grid(
+    base_grid: Grid, fname: str, fast_path: bool = True, profiler: Profiler = None
+) -> Grid:
+    """Loads an update grid ahead of calc_diff_grid, e.g. in a background thread.
+
+    The grid is also converted to xyz points if calc_diff_grid will need them, i.e. if its
+    block medians cannot be calculated directly from the grid. Only the coordinates of
+    the base grid are used, so its values may be updated meanwhile. The file is read
+    holding NETCDF_LOCK, so it is not read while GMT reads or writes netCDF files.
+
+    Args:
+        base_grid: Base grid the update grid will be differenced against.
+        fname: Filename of update grid.
+        fast_path: Whether block medians will be calculated directly from aligned update grids.
+        profiler: Optional profiler recording each stage.
+
+    Returns:
+        Grid containing update grid.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    with NETCDF_LOCK:
+        update_grid = load_update_grid(fname, profiler=profiler)
+    block_region = min_regions(update_grid.region, base_grid.region)
+    if update_grid.grid.size == 0 or not is_region_valid(block_region):
+        return update_grid
+
+    max_spacing = max(update_grid.spacing, base_grid.spacing)
+    origin = [float(update_grid.grid.x[0]), float(update_grid.grid.y[0])]
+    if not (
+        fast_path
+        and kernels.grid_blocks_aligned(
+            origin, update_grid.spacing, max_spacing, block_region
+        )
+    ):
+        with profiler.stage("to_xyz", cells=update_grid.grid.size) as record:
+            update_grid.xyz = update_grid.as_xyz()
+            record["points"] = len(update_grid.xyz)
+
+    return update_grid
+
+
+def apply_diff_grid(base_grid: Grid, diff_grid: xr.DataArray) -> None:
+    """Adds a difference grid to the matching part of the base grid.
+
+    Args:
+        base_grid: Base grid to update in place.
+        diff_grid: Difference grid, on the same lattice as the base grid and within its region.
+    """
+    slices = region_to_slices(base_grid.grid, extract_region(diff_grid))
+    dims = base_grid.grid.dims
+    diff = diff_grid.transpose(*dims).values
+    if isinstance(base_grid.grid.data, np.ndarray):
+        # Add to a view of the window in place, rather than to a copy which is written back
+        window = base_grid.grid.data[tuple(slices.get(dim, slice(None)) for dim in dims)]
+        window += diff
+    else:
+        base_grid.grid[slices] += diff
+
+
+def diff_grid_footprint(diff_grid: xr.DataArray) -> Tuple[list, xr.DataArray]:
+    """Crops a difference grid to the nodes it changes.
+
+    Args:
+        diff_grid: Difference grid (or None).
+
+    Returns:
+        - Region of the base grid changed by the difference grid (None if nothing changes).
+        - Difference grid cropped to this region (None if nothing changes).
+    """
+    if diff_grid is None:
+        return None, None
+
+    changed = diff_grid.values != 0.0
+    rows = np.flatnonzero(changed.any(axis=1))
+    cols = np.flatnonzero(changed.any(axis=0))
+    if len(rows) == 0:
+        return None, None
+
+    footprint = diff_grid.isel(
+        x=slice(cols[0], cols[-1] + 1), y=slice(rows[0], rows[-1] + 1)
+    )
+    return extract_region(footprint), footprint
+
+
+def cached_diff_grid(
+    base_grid: Grid,
+    fname: str,
+    cache: DiffCache = None,
+    profiler: Profiler = None,
+    load_region: list = None,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    region: list = None,
+    block_region: list = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    update_grid: Grid = None,
+) -> Tuple[list, list, xr.DataArray, str]:
+    """Calculates the difference grid of an update grid, unless it is found in the cache.
+
+    Newly calculated difference grids are not stored in the cache, as the caller may
+    find that the base grid changed during the calculation. They should be stored with
+    `cache.put(key, diff_grid)` once they are known to be valid.
+
+    Args:
+        base_grid: Base grid to be later updated using the difference grid.
+        fname: Filename of update grid.
+        cache: Optional cache of difference grids.
+        profiler: Optional profiler recording each stage.
+        load_region: Optional region of the update grid to load.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        region: Region of the difference grid. See calc_diff_grid.
+        block_region: Region in which the update grid is blockmedianed. See calc_diff_grid.
+        backend: Implementation of the GMT modules used to calculate the difference grid.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        update_grid: Optional update grid already loaded from `fname` (and `load_region`),
+            e.g. by prefetch_update_grid. Otherwise it is loaded if needed.
+
+    Returns:
+        - Region of the base grid read to calculate the differences (None if nothing changes).
+        - Region of the base grid changed by the differences (None if nothing changes).
+        - Difference grid cropped to the changed region (None if nothing changes).
+        - Key under which to cache the difference grid (None if it was found in the cache,
+          or there is no cache).
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    params = {
+        "diff_threshold": diff_threshold,
+        "window_width": window_width,
+        "region": region,
+        "block_region": block_region,
+        "backend": backend,
+        "fast_path": fast_path,
+    }
+
+    key = None
+    if cache is not None:
+        with profiler.stage("cache_get") as record:
+            key = cache.key(base_grid, fname, **params)
+            found, diff_grid = cache.get(key)
+            record["hit"] = found
+        if found:
+            logger.info(f"Using cached difference grid for {fname}")
+            if diff_grid is None:
+                return None, None, None, None
+            read_region = base_read_region(
+                base_grid, cache.index.extent(fname).region, block_region
+            )
+            return read_region, extract_region(diff_grid), diff_grid, None
+
+    if update_grid is None:
+        update_grid = load_update_grid(fname, region=load_region, profiler=profiler)
+    if update_grid.grid.size == 0:
+        return None, None, None, key
+
+    diff_grid = calc_diff_grid(base_grid, update_grid, profiler=profiler, **params)
+    if diff_grid is None:
+        return None, None, None, key
+
+    read_region = base_read_region(base_grid, update_grid.region, block_region)
+    return (read_region,) + diff_grid_footprint(diff_grid) + (key,)
+
+
+def apply_diff_grids(
+    base_grid: Grid,
+    filenames: list,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profiler: Profiler = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    cache: DiffCache = None,
+    prefetch: int = 0,
+    prefetch_memory: float = None,
+    index: FootprintIndex = None,
+) -> None:
+    """Updates the base grid with each update grid in turn.
+
+    Optionally, update grids are loaded (and converted to xyz points, if needed) in a
+    background thread while earlier ones are processed, so reading from disk overlaps
+    with the calculation of difference grids.
+
+    Args:
+        base_grid: Base grid to update in place.
+        filenames: Filenames of update grids, in the order they are applied.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        profiler: Optional profiler recording each stage. Cannot be enabled with `prefetch`,
+            see Profiler.
+        backend: Implementation of the GMT modules used to calculate difference grids.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        cache: Optional cache of difference grids.
+        prefetch: Number of update grids loaded ahead of the one being processed.
+        prefetch_memory: Optional memory available to loaded update grids, in bytes.
+        index: Optional index of update grid extents, used to estimate their memory.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if profiler.enabled and prefetch > 0:
+        raise ValueError("Stages cannot be profiled while update grids are prefetched")
+
+    def prefetch_task(fname):
+        return prefetch_update_grid(base_grid, fname, fast_path=fast_path)
+
+    update_grids = ((fname, None) for fname in filenames)
+    prefetcher = None
+    if prefetch > 0:
+        sizes = None
+        if prefetch_memory is not None:
+            if index is None:
+                index = FootprintIndex()
+            sizes = [
+                UPDATE_GRID_BYTES_PER_CELL * extent_cells(index.extent(fname))
+                for fname in filenames
+            ]
+        prefetcher = Prefetcher(
+            filenames,
+            prefetch_task,
+            depth=prefetch,
+            memory_budget=prefetch_memory,
+            sizes=sizes,
+        )
+        update_grids = prefetcher
+
+    try:
+        for fname, update_grid in update_grids:
+            profiler.source = fname
+            _, _, diff_grid, key = cached_diff_grid(
+                base_grid,
+                fname,
+                cache=cache,
+                profiler=profiler,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                backend=backend,
+                fast_path=fast_path,
+                update_grid=update_grid,
+            )
+            # Release the update grid before the next one is loaded
+            del update_grid
+
+            if key is not None:
+                cache.put(key, diff_grid)
+            if diff_grid is not None:
+                logger.info("Update base grid")
+                with profiler.stage("apply", cells=diff_grid.size):
+                    apply_diff_grid(base_grid, diff_grid)
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+
+
+# Base grid shared by the worker processes of apply_diff_grids_parallel and merge_diff_grids
+_shared_base_grid = None
+
+
+def _init_diff_grid_worker(base_fname: str, x: np.ndarray, y: np.ndarray) -> None:
+    """Opens the memory-mapped base grid in a worker process.
+
+    Args:
+        base_fname: Filename of memory-mapped base grid values.
+        x: Coordinates of the base grid in the x direction.
+        y: Coordinates of the base grid in the y direction.
+    """
+    global _shared_base_grid
+    _shared_base_grid = Grid.from_memmap(base_fname, x, y)
+
+
+def _calc_diff_grid_task(
+    fname: str,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profile: bool = False,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    cache: DiffCache = None,
+) -> Tuple[list, list, xr.DataArray, str, list]:
+    """Calculates the difference grid of a single update grid in a worker process.
+
+    Args:
+        fname: Filename of update grid.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        profile: Whether to profile each stage.
+        backend: Implementation of the GMT modules used to calculate the difference grid.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        cache: Optional cache of difference grids.
+
+    Returns:
+        - Region of the base grid read to calculate the differences (None if nothing changes).
+        - Region of the base grid changed by the differences (None if nothing changes).
+        - Difference grid cropped to the changed region (None if nothing changes).
+        - Key under which to cache the difference grid (None if not to be cached).
+        - Profiling records.
+    """
+    profiler = Profiler(enabled=profile)
+    profiler.source = fname
+
+    result = cached_diff_grid(
+        _shared_base_grid,
+        fname,
+        cache=cache,
+        profiler=profiler,
+        diff_threshold=diff_threshold,
+        window_width=window_width,
+        backend=backend,
+        fast_path=fast_path,
+    )
+    return result + (profiler.records,)
+
+
+def apply_diff_grids_parallel(
+    base_grid: Grid,
+    filenames: list,
+    jobs: int,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profiler: Profiler = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    cache: DiffCache = None,
+) -> None:
+    """Updates the base grid with each update grid, calculating difference grids in parallel.
+
+    The base grid is shared with the worker processes through a memory-mapped file, so it
+    is only held in memory once. Difference grids are applied in the order of `filenames`.
+    If an earlier update grid changed part of the base grid which a difference grid was
+    calculated from, after that calculation started, the difference grid is recalculated
+    against the updated base grid. The result is therefore identical to applying each
+    update grid in turn.
+
+    Args:
+        base_grid: Base grid to update in place.
+        filenames: Filenames of update grids, in the order they are applied.
+        jobs: Number of worker processes.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        profiler: Optional profiler recording each stage, including those run by workers.
+        backend: Implementation of the GMT modules used to calculate difference grids.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        cache: Optional cache of difference grids.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if cache is not None:
+        # Hash the update grids once, rather than in every worker process
+        cache.hash_sources(filenames)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shared_fname = os.path.join(tmpdir, "base_grid.npy")
+        base_grid.to_memmap(shared_fname)
+
+        task = partial(
+            _calc_diff_grid_task,
+            diff_threshold=diff_threshold,
+            window_width=window_width,
+            profile=profiler.enabled,
+            backend=backend,
+            fast_path=fast_path,
+            cache=cache,
+        )
+        changed_regions = []
+
+        def apply_result(fname, n_applied, future):
+            read_region, changed_region, diff_grid, key, records = future.result()
+            profiler.extend(records)
+            profiler.source = fname
+
+            # Recalculate if the base grid changed where it was read during the calculation
+            stale = read_region is not None and any(
+                region is not None and is_region_valid(min_regions(region, read_region))
+                for region in changed_regions[n_applied:]
+            )
+            if stale:
+                logger.info(f"Recalculating difference grid for {fname}")
+                _, changed_region, diff_grid, key = cached_diff_grid(
+                    base_grid,
+                    fname,
+                    cache=cache,
+                    profiler=profiler,
+                    diff_threshold=diff_threshold,
+                    window_width=window_width,
+                    backend=backend,
+                    fast_path=fast_path,
+                )
+
+            # Only difference grids calculated from the current base grid are cached
+            if key is not None:
+                cache.put(key, diff_grid)
+            if diff_grid is not None:
+                logger.info(f"Update base grid with {fname}")
+                with profiler.stage("apply", cells=diff_grid.size):
+                    apply_diff_grid(base_grid, diff_grid)
+            changed_regions.append(changed_region)
+
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_diff_grid_worker,
+            initargs=(shared_fname, base_grid.grid.x.values, base_grid.grid.y.values),
+        ) as executor:
+            # Limit the number of difference grids held in memory at once
+            pending = deque()
+            for fname in filenames:
+                # Record how many difference grids had been applied when the calculation started
+                pending.append((fname, len(changed_regions), executor.submit(task, fname)))
+                if len(pending) >= 2 * jobs:
+                    apply_result(*pending.popleft())
+            while pending:
+                apply_result(*pending.popleft())
+
+        # Move the updated base grid back into memory before the shared file is removed
+        base_grid.to_memory()
+
+
+def merge_diff_grid(
+    base_grid: Grid,
+    fname: str,
+    profiler: Profiler = None,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+) -> Tuple[xr.DataArray, xr.DataArray]:
+    """Calculates the difference grid of an update grid and its coverage, for a weighted merge.
+
+    Args:
+        base_grid: Original base grid.
+        fname: Filename of update grid.
+        profiler: Optional profiler recording each stage.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        backend: Implementation of the GMT modules used to calculate the difference grid.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+
+    Returns:
+        - Difference grid, cropped to the nodes the update grid covers (None if it covers none).
+        - Coverage of the difference grid, on the same nodes (None if it covers none).
+    """
+    update_grid = load_update_grid(fname, profiler=profiler)
+    if update_grid.grid.size == 0:
+        return None, None
+
+    diff_grid, coverage = calc_diff_grid(
+        base_grid,
+        update_grid,
+        diff_threshold=diff_threshold,
+        window_width=window_width,
+        profiler=profiler,
+        backend=backend,
+        fast_path=fast_path,
+        return_coverage=True,
+    )
+    region, coverage = diff_grid_footprint(coverage)
+    if region is None:
+        return None, None
+    return diff_grid[region_to_slices(diff_grid, region)], coverage
+
+
+def _merge_diff_grid_task(
+    fname: str,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profile: bool = False,
+    backend: str = "gmt",
+    fast_path: bool = True,
+) -> Tuple[xr.DataArray, xr.DataArray, list]:
+    """Calculates the difference grid of an update grid for a weighted merge, in a worker process.
+
+    Returns:
+        - Difference grid (None if the update grid covers no nodes).
+        - Coverage of the difference grid (None if the update grid covers no nodes).
+        - Profiling records.
+    """
+    profiler = Profiler(enabled=profile)
+    profiler.source = fname
+
+    result = merge_diff_grid(
+        _shared_base_grid,
+        fname,
+        profiler=profiler,
+        diff_threshold=diff_threshold,
+        window_width=window_width,
+        backend=backend,
+        fast_path=fast_path,
+    )
+    return result + (profiler.records,)
+
+
+def merge_diff_grids(
+    base_grid: Grid,
+    filenames: list,
+    weights: list = None,
+    jobs: int = 1,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profiler: Profiler = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+) -> None:
+    """Updates the base grid with the weighted merge of all update grids, see WeightedMerge.
+
+    The difference grid of every update grid is calculated against the original base
+    grid, so they can be calculated in any order and in parallel. They are accumulated
+    into weighted buffers, and the base grid is updated once they are all calculated.
+    The result does not depend on the order of `filenames`.
+
+    Args:
+        base_grid: Base grid to update in place.
+        filenames: Filenames of update grids.
+        weights: Optional priorities of the update grids, where they overlap. Default to 1.
+        jobs: Number of worker processes, which share the base grid through a memory-mapped file.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        profiler: Optional profiler recording each stage, including those run by workers.
+        backend: Implementation of the GMT modules used to calculate difference grids.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if weights is None:
+        weights = [1.0] * len(filenames)
+    if len(weights) != len(filenames):
+        raise ValueError(
+            f"Got {len(weights)} weights for {len(filenames)} update grids"
+        )
+
+    merge = WeightedMerge(base_grid)
+
+    def add_result(fname, weight, diff_grid, coverage):
+        if diff_grid is not None:
+            logger.info(f"Merge difference grid of {fname}")
+            with profiler.stage("merge", cells=diff_grid.size):
+                merge.add(diff_grid, coverage, weight)
+
+    if jobs <= 1:
+        for fname, weight in zip(filenames, weights):
+            profiler.source = fname
+            diff_grid, coverage = merge_diff_grid(
+                base_grid,
+                fname,
+                profiler=profiler,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                backend=backend,
+                fast_path=fast_path,
+            )
+            add_result(fname, weight, diff_grid, coverage)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shared_fname = os.path.join(tmpdir, "base_grid.npy")
+            base_grid.to_memmap(shared_fname)
+
+            task = partial(
+                _merge_diff_grid_task,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                profile=profiler.enabled,
+                backend=backend,
+                fast_path=fast_path,
+            )
+
+            def collect_result(fname, weight, future):
+                diff_grid, coverage, records = future.result()
+                profiler.extend(records)
+                profiler.source = fname
+                add_result(fname, weight, diff_grid, coverage)
+
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_diff_grid_worker,
+                initargs=(shared_fname, base_grid.grid.x.values, base_grid.grid.y.values),
+            ) as executor:
+                # Limit the number of difference grids held in memory at once
+                pending = deque()
+                for fname, weight in zip(filenames, weights):
+                    pending.append((fname, weight, executor.submit(task, fname)))
+                    if len(pending) >= 2 * jobs:
+                        collect_result(*pending.popleft())
+                while pending:
+                    collect_result(*pending.popleft())
+
+            # Move the base grid back into memory before the shared file is removed
+            base_grid.to_memory()
+
+    logger.info("Update base grid")
+    with profiler.stage("apply", cells=base_grid.grid.size):
+        merge.apply()
 
 
 def load_base_grid(fname: str, region: list = None, spacing: bool = None) -> Grid:
     """Load base grid from file optionally cropping and resampling.
 
+    Only the part of the file needed for the region is read. GeoTiffs with internal
+    overviews are read from the coarsest overview which is still finer than the spacing.
+
     Args:
         fname: Filename of input grid.
         region: Optional region to crop to.
@@ -172,15 +1104,468 @@ def load_base_grid(fname: str, region: list = None, spacing: bool = None) -> Gri
     Returns:
         Grid containing base grid.
     """
-    base_grid = Grid(fname, convert_to_xyz=False)
-    if region:
-        base_grid.crop(region)
-    if spacing:
-        base_grid.resample(spacing)
+    if region and spacing:
+        # Only read the pixels needed to crop and resample, from an overview if there is one
+        base_grid = Grid(fname, region=expand_region(region, spacing), spacing=spacing)
+
+        # The resampled grid starts from the node of the full resolution grid nearest the
+        # region, as it would if the file had no overviews. Overview nodes are at most half
+        # their spacing from this, so overviews are cropped with a margin to cover it.
+        full_grid = open_source(fname)
+        region = extract_region(full_grid[region_to_slices(full_grid, region)])
+        margin = base_grid.spacing - extract_spacing(full_grid)
+        full_grid.close()
+        base_grid.crop(expand_region(region, margin))
+        base_grid.resample(spacing, region=region)
+    else:
+        # When cropping, only the values within the region need to be read from file
+        base_grid = Grid(fname, convert_to_xyz=False, lazy=bool(region))
+        if region:
+            base_grid.crop(region)
+        if spacing:
+            base_grid.resample(spacing)
+    # Read any values not already read by cropping or resampling
+    base_grid.grid = base_grid.grid.astype("float32", copy=False).load()
 
     return base_grid
 
 
+def load_base_window(
+    fname: str, region: list, spacing: float, base_region: list
+) -> Grid:
+    """Load the part of the base grid within a region, resampling it if required.
+
+    Args:
+        fname: Filename of base grid.
+        region: Region to load, whose bounds lie on the nodes of the output lattice.
+        spacing: Grid spacing of the output lattice.
+        base_region: Region of the base grid which may be read (the region of interest).
+
+    Returns:
+        Grid containing the window of the base grid.
+    """
+    _, base_spacing = read_extent(fname)
+    if spacing == base_spacing:
+        return Grid(fname, region=region)
+
+    # Read a margin of nodes around the region so it is resampled exactly as the full grid would be
+    read_region = min_regions(expand_region(region, 2 * base_spacing), base_region)
+    base_grid = Grid(fname, region=read_region)
+    base_grid.resample(spacing, region=region)
+    return base_grid
+
+
+def process_tile(
+    tile: dict,
+    x: np.ndarray,
+    y: np.ndarray,
+    base_fname: str,
+    base_region: list,
+    sources: list,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    profile: bool = False,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    cache: DiffCache = None,
+    output_fname: str = None,
+) -> Tuple[dict, np.ndarray, list]:
+    """Applies remove-restore to a single tile of the output grid.
+
+    The base grid is loaded with enough padding around the tile that every update grid
+    affecting it is differenced exactly as it would be over the full grid.
+
+    Args:
+        tile: Tile, as slices for each coordinate of the output grid.
+        x: Coordinates of the output grid in the x direction.
+        y: Coordinates of the output grid in the y direction.
+        base_fname: Filename of base grid.
+        base_region: Region of the base grid which may be read (the region of interest).
+        sources: Extents of all update grids, in the order they are applied.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grid.
+        profile: Whether to profile each stage.
+        backend: Implementation of the GMT modules used to calculate difference grids.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        cache: Optional cache of difference grids.
+        output_fname: Optional Zarr store to which the tile is written directly. The tile
+            must be aligned with the chunks of the store.
+
+    Returns:
+        - The tile.
+        - Updated values of the output grid within the tile, or None if written to `output_fname`.
+        - Profiling records.
+    """
+    profiler = Profiler(enabled=profile)
+    spacing = float(x[1] - x[0])
+    origin = [x[0], y[0]]
+    full_region = [x[0], x[-1], y[0], y[-1]]
+    core_region = tile_region(x, y, tile)
+
+    sources, halos, window = tile_window(x, y, tile, sources, window_width)
+    base_grid = load_base_window(base_fname, window, spacing, base_region)
+
+    for i, (source, halo) in enumerate(zip(sources, halos)):
+        # Region which must be exact for the update grids still to be applied
+        exact_region = expand_region(core_region, sum(halos[i + 1 :]))
+        # Bounds are taken from the nodes of the base grid, as by update_footprint, since
+        # snapping them to the lattice may be off by rounding errors
+        diff_region = extract_region(
+            base_grid.grid[
+                region_to_slices(
+                    base_grid.grid,
+                    snap_region(
+                        expand_region(exact_region, window_width or 0.0), origin, spacing
+                    ),
+                )
+            ]
+        )
+
+        # Blocks must lie on the same lattice as when the full grid is processed
+        max_spacing = max(source.spacing, spacing)
+        full_block_region = min_regions(source.region, full_region)
+        block_region = min_regions(
+            snap_region(
+                expand_region(exact_region, halo),
+                full_block_region[0::2],
+                max_spacing,
+            ),
+            full_block_region,
+        )
+        if not is_region_valid(block_region):
+            continue
+
+        profiler.source = source.fname
+        _, _, diff_grid, key = cached_diff_grid(
+            base_grid,
+            source.fname,
+            cache=cache,
+            profiler=profiler,
+            load_region=expand_region(block_region, source.spacing),
+            diff_threshold=diff_threshold,
+            window_width=window_width,
+            region=diff_region,
+            block_region=block_region,
+            backend=backend,
+            fast_path=fast_path,
+        )
+
+        if key is not None:
+            cache.put(key, diff_grid)
+        if diff_grid is not None:
+            with profiler.stage("apply", cells=diff_grid.size):
+                apply_diff_grid(base_grid, diff_grid)
+
+    core = base_grid.grid.isel(region_to_slices(base_grid.grid, core_region))
+    if output_fname is not None:
+        profiler.source = output_fname
+        with profiler.stage("write", cells=core.size):
+            ZarrGridWriter.open_existing(output_fname).write(core.values, tile)
+        return tile, None, profiler.records
+
+    return tile, core.values, profiler.records
+
+
+def remove_restore_tiled(
+    base_fname: str,
+    filenames: list,
+    output_fname: str,
+    memory_budget: float,
+    region: list = None,
+    spacing: float = None,
+    diff_threshold: float = 0.0,
+    window_width: float = None,
+    jobs: int = 1,
+    index: FootprintIndex = None,
+    profiler: Profiler = None,
+    backend: str = "gmt",
+    fast_path: bool = True,
+    cache: DiffCache = None,
+    output_options: dict = None,
+) -> None:
+    """Applies remove-restore tile by tile, writing the output grid as each tile is completed.
+
+    The base grid is never loaded in full, so the output may be larger than the available memory.
+    The output is identical to that of applying remove-restore to the full grid.
+
+    Args:
+        base_fname: Filename of base grid.
+        filenames: Filenames of update grids, in the order they are applied.
+        output_fname: Filename of output grid, written as netcdf, as a Cloud-Optimized GeoTiff
+            or as a Zarr store, depending on its extension. Workers write directly to Zarr stores.
+        memory_budget: Memory available to process a single tile, in bytes.
+        region: Optional region of interest. Defaults to the extent of the base grid.
+        spacing: Optional grid spacing to which the base grid will be resampled.
+        diff_threshold: Optional threshold above which a difference will be applied.
+        window_width: Width of optional smoothing window around update grids.
+        jobs: Number of tiles to process in parallel.
+        index: Optional index of update grid extents.
+        profiler: Optional profiler recording each stage, including those run by workers.
+        backend: Implementation of the GMT modules used to calculate difference grids.
+        fast_path: Whether to calculate block medians directly from aligned update grids.
+        cache: Optional cache of difference grids.
+        output_options: Optional options of the output format, e.g. chunk shape, compression
+            and data type. See pycascadia.writers. Chunks default to the tile size.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    base = open_source(base_fname)
+    base_spacing = extract_spacing(base)
+    if region:
+        base = base.isel(region_to_slices(base, region))
+    base_region = extract_region(base)
+
+    if spacing and spacing != base_spacing:
+        # Expand the region to guarantee the spacing, as with `gmt grdsample -I<increment>+e`
+        nx = math.ceil((base_region[1] - base_region[0]) / spacing - 1e-6) + 1
+        ny = math.ceil((base_region[3] - base_region[2]) / spacing - 1e-6) + 1
+        x = base_region[0] + spacing * np.arange(nx)
+        y = base_region[2] + spacing * np.arange(ny)
+    else:
+        spacing = base_spacing
+        x = base.x.values
+        y = base.y.values
+
+    if index is None:
+        index = FootprintIndex()
+    sources = index.query([x[0], x[-1], y[0], y[-1]], filenames)
+    logger.info(f"{len(sources)} of {len(filenames)} update grids overlap the output grid")
+    if cache is not None:
+        # Hash the update grids once, rather than in every worker process
+        cache.hash_sources([source.fname for source in sources])
+
+    max_halo = max(
+        (source_halo(source.spacing, spacing, window_width) for source in sources),
+        default=source_halo(spacing, spacing, window_width),
+    )
+    tile_size = tile_size_from_memory(memory_budget, math.ceil(max_halo / spacing))
+    output_options = dict({"chunks": (tile_size, tile_size)}, **(output_options or {}))
+
+    # Workers write tiles straight to Zarr stores, which is safe if each tile covers whole chunks
+    direct_write = jobs > 1 and output_format(output_fname) == "zarr"
+    chunk_multiple = 1
+    if direct_write:
+        chunks = output_options["chunks"]
+        chunk_multiple = chunks[0] * chunks[1] // math.gcd(*chunks)
+        tile_size = (tile_size // chunk_multiple) * chunk_multiple
+        if tile_size == 0:
+            raise ValueError(
+                f"Output chunks {chunks} are too large for the tile memory, reduce the chunk shape"
+            )
+
+    # Tiles where several update grids overlap are padded by all their halos, so are split
+    # until their windows fit within the memory budget
+    tiles = plan_tiles_within_memory(
+        x,
+        y,
+        tile_size,
+        sources,
+        memory_budget,
+        window_width=window_width,
+        multiple=chunk_multiple,
+    )
+    logger.info(f"Processing {len(tiles)} tiles of up to {tile_size}x{tile_size} nodes")
+
+    tile_func = partial(
+        process_tile,
+        x=x,
+        y=y,
+        base_fname=base_fname,
+        base_region=base_region,
+        sources=sources,
+        diff_threshold=diff_threshold,
+        window_width=window_width,
+        profile=profiler.enabled,
+        backend=backend,
+        fast_path=fast_path,
+        cache=cache,
+        output_fname=output_fname if direct_write else None,
+    )
+
+    def write_tile(writer, tile, values, records):
+        profiler.extend(records)
+        if values is None:
+            # Already written by the worker
+            return
+        profiler.source = output_fname
+        with profiler.stage("write", cells=values.size):
+            writer.write(values, tile)
+
+    with open_grid_writer(output_fname, x, y, **output_options) as writer:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for result in executor.map(tile_func, tiles):
+                    write_tile(writer, *result)
+        else:
+            for result in map(tile_func, tiles):
+                write_tile(writer, *result)
+
+
+class RemoveRestore:
+    """RemoveRestore merges update grids into a base grid held in memory, for use by long-lived processes.
+
+    The base grid is loaded, cropped and resampled once, when the pipeline is created.
+    Update grids, given as filenames, xarray grids or xyz points, are then applied one at
+    a time, each against the base grid as updated by those before (as by apply_diff_grids),
+    and the merged grid, or any region of it, is returned without writing to disk. `reset`
+    restores the base grid as it was loaded, copying back only the nodes changed since,
+    so many independent merges can be served from a single pipeline, e.g.
+
+        pipeline = RemoveRestore("gebco_base_grid.nc", window_width=0.002, backend="native")
+        merged = pipeline.merge([survey_xyz, "higher_res_grid.tiff"], region=region)
+
+    A second copy of the base grid is held in memory to reset it. Merges are not thread
+    safe: each thread serving merges should have its own pipeline.
+    """
+
+    def __init__(
+        self,
+        base,
+        region: list = None,
+        spacing: float = None,
+        diff_threshold: float = 0.0,
+        window_width: float = None,
+        backend: str = "gmt",
+        fast_path: bool = True,
+        profiler: Profiler = None,
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            base: Base grid: filename, Grid, or xarray grid with coordinates labelled `x`
+                and `y`. Grids are copied, so are never modified.
+            region: Optional region to crop the base grid to.
+            spacing: Optional grid spacing to which the base grid will be resampled.
+            diff_threshold: Optional threshold above which a difference will be applied.
+            window_width: Width of optional smoothing window around update grids.
+            backend: Implementation of the GMT modules used to calculate difference grids.
+            fast_path: Whether to calculate block medians directly from aligned update grids.
+            profiler: Optional profiler recording each stage.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+        self.diff_threshold = diff_threshold
+        self.window_width = window_width
+        self.backend = backend
+        self.fast_path = fast_path
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+
+        self.profiler.source = base if isinstance(base, str) else None
+        with self.profiler.stage("load_base"):
+            if isinstance(base, str):
+                self.base_grid = load_base_grid(base, region=region, spacing=spacing)
+            else:
+                if isinstance(base, xr.DataArray):
+                    base = Grid.from_dataarray(base)
+                self.base_grid = Grid.from_dataarray(base.grid)
+                if region:
+                    self.base_grid.crop(region)
+                if spacing:
+                    self.base_grid.resample(spacing)
+                # Always a copy, so the grid passed in is left unchanged
+                self.base_grid.grid = self.base_grid.grid.astype("float32").load()
+
+        # Base grid as loaded, and the regions changed since
+        self._initial_grid = self.base_grid.grid.copy()
+        self._changed_regions = []
+
+    @property
+    def grid(self) -> xr.DataArray:
+        """Merged grid, updated in place as update grids are applied."""
+        return self.base_grid.grid
+
+    def apply(self, update, spacing: float = None) -> list:
+        """Applies an update grid to the merged grid.
+
+        Args:
+            update: Update grid: filename, Grid, xarray grid with coordinates labelled `x`
+                and `y`, or xyz points as a DataFrame with x, y and z columns or an array of
+                shape (n, 3).
+            spacing: Resolution of xyz points. Defaults to the spacing of the base grid.
+                See points_update_grid.
+
+        Returns:
+            Region of the merged grid changed by the update grid (None if nothing changes).
+        """
+        fast_path = self.fast_path
+        # Stages of update grids held in memory are recorded without a source
+        self.profiler.source = update if isinstance(update, str) else None
+        if isinstance(update, str):
+            update_grid = load_update_grid(update, profiler=self.profiler)
+        elif isinstance(update, Grid):
+            update_grid = update
+        elif isinstance(update, xr.DataArray):
+            update_grid = Grid.from_dataarray(update)
+        else:
+            if spacing is None:
+                spacing = self.base_grid.spacing
+            update_grid = points_update_grid(update, spacing)
+            # Points have no lattice to calculate block medians from
+            fast_path = False
+        if update_grid.grid.size == 0:
+            return None
+
+        diff_grid = calc_diff_grid(
+            self.base_grid,
+            update_grid,
+            diff_threshold=self.diff_threshold,
+            window_width=self.window_width,
+            profiler=self.profiler,
+            backend=self.backend,
+            fast_path=fast_path,
+        )
+        changed_region, diff_grid = diff_grid_footprint(diff_grid)
+        if diff_grid is None:
+            return None
+
+        logger.info("Update base grid")
+        with self.profiler.stage("apply", cells=diff_grid.size):
+            apply_diff_grid(self.base_grid, diff_grid)
+        self._changed_regions.append(changed_region)
+        return changed_region
+
+    def merged(self, region: list = None) -> xr.DataArray:
+        """Returns a copy of the merged grid.
+
+        Args:
+            region: Optional region to return, whose bounds are rounded to the nearest nodes.
+                Defaults to the whole grid.
+
+        Returns:
+            Copy of the merged grid, or of the nodes within the region.
+        """
+        if region is None:
+            return self.grid.copy()
+        return self.grid[region_to_slices(self.grid, region)].copy()
+
+    def reset(self) -> None:
+        """Restores the base grid as it was loaded, undoing every update grid applied."""
+        for changed_region in self._changed_regions:
+            slices = region_to_slices(self.grid, changed_region)
+            self.grid[slices] = self._initial_grid[slices].values
+        self._changed_regions = []
+
+    def merge(
+        self, updates: list, region: list = None, spacing: float = None
+    ) -> xr.DataArray:
+        """Merges update grids into the base grid as loaded, independently of previous merges.
+
+        Args:
+            updates: Update grids, in the order they are applied. See RemoveRestore.apply.
+            region: Optional region of the merged grid to return. Defaults to the whole grid.
+            spacing: Resolution of any xyz points. Defaults to the spacing of the base grid.
+
+        Returns:
+            Copy of the merged grid, or of the nodes within the region.
+        """
+        self.reset()
+        for update in updates:
+            self.apply(update, spacing=spacing)
+        return self.merged(region)
+
+
 def main():
     """Main entry point for remove-restore command line tool.
 
@@ -194,17 +1579,25 @@ def main():
         "filenames", nargs="*", help="sources to combine with the base grid"
     )
     parser.add_argument("--base", required=True, help="base grid")
-    parser.add_argument("--input_txt", help="text file containing list of input grids")
+    parser.add_argument(
+        "--input_txt",
+        help="text file containing list of input grids, each optionally followed by its weight for --merge weighted",
+    )
     parser.add_argument("--spacing", type=float, help="output grid spacing")
     parser.add_argument(
         "--diff_threshold",
         default=0.0,
+        type=float,
         help="value above which differences will be added to the base grid",
     )
     parser.add_argument(
         "--plot", action="store_true", help="plot final output before saving"
     )
-    parser.add_argument("--output", required=True, help="filename of final output")
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="filename of final output: NetCDF, Cloud-Optimized GeoTiff (.tif/.tiff) or Zarr store (.zarr)",
+    )
     parser.add_argument(
         "--window_width",
         required=False,
@@ -219,14 +1612,115 @@ def main():
         type=float,
         help="output region. Defaults to the extent of the base grid.",
     )
+    parser.add_argument(
+        "--tile_memory",
+        required=False,
+        type=float,
+        help="Enable tiled processing for grids larger than memory and specify the memory available to each tile in MB",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="number of worker processes, used to process tiles or update grids in parallel",
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        help="Enable profiling of each stage and specify the filename of the report (CSV if it ends in .csv, otherwise JSON)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="gmt",
+        choices=BACKENDS,
+        help="implementation of blockmedian, grdtrack and nearneighbour: GMT via pyGMT, or native NumPy working on in-memory arrays",
+    )
+    parser.add_argument(
+        "--point_pipeline",
+        action="store_true",
+        help="always convert update grids to xyz points for blockmedian, even when their block medians can be calculated directly from the grid",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        required=False,
+        help="Enable caching of difference grids, so unchanged sources are not recalculated when rerun, and specify the cache directory",
+    )
+    parser.add_argument(
+        "--cache_size",
+        default=10240,
+        type=float,
+        help="maximum size of the cache of difference grids in MB, beyond which the least recently used are removed",
+    )
+    parser.add_argument(
+        "--output_chunks",
+        metavar=("ny", "nx"),
+        required=False,
+        nargs=2,
+        type=int,
+        help="chunk shape of the output grid. Defaults to the tile size when tiling, otherwise unchunked (or chosen by netCDF if compressed)",
+    )
+    parser.add_argument(
+        "--compression",
+        required=False,
+        choices=COMPRESSIONS,
+        help="compression codec of the output grid",
+    )
+    parser.add_argument(
+        "--compression_level",
+        required=False,
+        type=int,
+        help="compression level of the output grid. Defaults to the codec's default",
+    )
+    parser.add_argument(
+        "--output_dtype",
+        default="float32",
+        choices=DTYPES,
+        help="data type of the output grid. int16 values are scaled by --scale_factor (NetCDF and Zarr only)",
+    )
+    parser.add_argument(
+        "--scale_factor",
+        default=1.0,
+        type=float,
+        help="precision of int16 output values, in the units of the grid",
+    )
+    parser.add_argument(
+        "--prefetch",
+        default=0,
+        type=int,
+        help="number of source grids loaded (and converted to xyz points) in a background thread ahead of the one being processed. Cannot be used with --jobs, --tile_memory or --merge weighted",
+    )
+    parser.add_argument(
+        "--prefetch_memory",
+        required=False,
+        type=float,
+        help="memory available to prefetched source grids in MB, beyond which fewer are loaded ahead",
+    )
+    parser.add_argument(
+        "--merge",
+        default="sequential",
+        choices=MERGE_MODES,
+        help="apply sources in turn, each against the base grid updated by those before, or calculate every source's differences against the original base grid (in parallel with --jobs) and average them where sources overlap, weighted by the weights in --input_txt",
+    )
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
+
+    if args.merge == "weighted" and (args.tile_memory or args.cache_dir):
+        parser.error("--merge weighted cannot be used with --tile_memory or --cache_dir")
+    if args.prefetch and (args.jobs > 1 or args.tile_memory or args.merge == "weighted"):
+        parser.error(
+            "--prefetch cannot be used with --jobs, --tile_memory or --merge weighted"
+        )
+    if args.prefetch and args.profile:
+        parser.error("--prefetch cannot be used with --profile")
 
     filenames = []
+    weights = []
     if args.input_txt:
-        # Read filenames from file
-        filenames += read_fnames(args.input_txt)
+        # Read filenames, and their weights, from file
+        filenames, weights = read_weighted_fnames(args.input_txt)
     # Add filenames from command line
     filenames += args.filenames
+    weights += [1.0] * len(args.filenames)
 
     assert filenames != [], "No filenames given"
 
@@ -236,28 +1730,121 @@ def main():
     region_of_interest = args.region_of_interest
     window_width = args.window_width
 
-    # Create base grid
-    base_grid = load_base_grid(
-        base_fname, region=region_of_interest, spacing=args.spacing
-    )
+    # Extents of update grids are persisted alongside the list of input grids, or in the cache
+    if args.input_txt:
+        index = FootprintIndex(f"{args.input_txt}.index.json")
+    elif args.cache_dir:
+        index = FootprintIndex(os.path.join(args.cache_dir, "index.json"))
+    else:
+        index = FootprintIndex()
 
-    # Update base grid
-    for fname in filenames:
-        print("Loading update grid")
-        update_grid = Grid(fname, convert_to_xyz=True)
+    cache = None
+    if args.cache_dir:
+        cache = DiffCache(
+            args.cache_dir, max_size=args.cache_size * 1024 ** 2, index=index
+        )
 
-        diff_grid = calc_diff_grid(
-            base_grid,
-            update_grid,
+    profiler = Profiler(enabled=bool(args.profile))
+
+    output_options = {
+        "compression": args.compression,
+        "complevel": args.compression_level,
+        "dtype": args.output_dtype,
+    }
+    if args.output_dtype == "int16":
+        output_options["scale_factor"] = args.scale_factor
+    if args.output_chunks:
+        output_options["chunks"] = tuple(args.output_chunks)
+
+    if args.tile_memory:
+        remove_restore_tiled(
+            base_fname,
+            filenames,
+            output_fname,
+            memory_budget=args.tile_memory * 1024 ** 2,
+            region=region_of_interest,
+            spacing=args.spacing,
             diff_threshold=diff_threshold,
             window_width=window_width,
+            jobs=args.jobs,
+            index=index,
+            profiler=profiler,
+            backend=args.backend,
+            fast_path=not args.point_pipeline,
+            cache=cache,
+            output_options=output_options,
+        )
+        if args.plot:
+            base_grid = Grid(output_fname)
+    else:
+        # Create base grid
+        base_grid = load_base_grid(
+            base_fname, region=region_of_interest, spacing=args.spacing
         )
 
-        if diff_grid is not None:
-            print("Update base grid")
-            base_grid.grid.values += diff_grid.values
+        # Skip update grids outside the base grid without loading them
+        sources = index.query(base_grid.region, filenames)
+        print(f"{len(sources)} of {len(filenames)} update grids overlap the base grid")
+        # Weights are kept parallel to the filenames, as a file may be listed more than once
+        overlapping = {source.fname for source in sources}
+        weights = [
+            weight
+            for fname, weight in zip(filenames, weights)
+            if fname in overlapping
+        ]
+        filenames = [source.fname for source in sources]
+
+        # Update base grid
+        if args.merge == "weighted":
+            merge_diff_grids(
+                base_grid,
+                filenames,
+                weights=weights,
+                jobs=args.jobs,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                profiler=profiler,
+                backend=args.backend,
+                fast_path=not args.point_pipeline,
+            )
+        elif args.jobs > 1:
+            apply_diff_grids_parallel(
+                base_grid,
+                filenames,
+                args.jobs,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                profiler=profiler,
+                backend=args.backend,
+                fast_path=not args.point_pipeline,
+                cache=cache,
+            )
+        else:
+            apply_diff_grids(
+                base_grid,
+                filenames,
+                diff_threshold=diff_threshold,
+                window_width=window_width,
+                profiler=profiler,
+                backend=args.backend,
+                fast_path=not args.point_pipeline,
+                cache=cache,
+                prefetch=args.prefetch,
+                prefetch_memory=args.prefetch_memory * 1024 ** 2
+                if args.prefetch_memory
+                else None,
+                index=index,
+            )
+
+        profiler.source = output_fname
+        with profiler.stage("save", cells=base_grid.grid.size):
+            base_grid.save_grid(output_fname, **output_options)
+
+    index.save()
 
-    base_grid.save_grid(output_fname)
+    if args.profile:
+        profiler.summary()
+        profiler.save(args.profile)
 
     if args.plot:
         fig, axes = plt.subplots(2, 2)
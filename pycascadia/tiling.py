@@ -0,0 +1,266 @@
+"""
+Helper functions for splitting remove-restore into independent, overlapping tiles
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+from typing import Tuple
+
+from pycascadia.utility import expand_region, min_regions, is_region_valid, snap_region
+
+# Approximate memory required per node of a tile, in bytes. This covers the base grid,
+# the difference and interpolation grids and the xyz points of an update grid at the same spacing.
+BYTES_PER_CELL = 64
+
+SourceExtent = namedtuple("SourceExtent", ["fname", "region", "spacing"])
+SourceExtent.__doc__ = """Bounding region and grid spacing of an update grid."""
+
+
+def extent_cells(extent: SourceExtent) -> int:
+    """Calculates the number of nodes of a grid from its extent.
+
+    Args:
+        extent: Extent of the grid.
+
+    Returns:
+        Number of nodes.
+    """
+    xmin, xmax, ymin, ymax = extent.region
+    nx = round((xmax - xmin) / extent.spacing) + 1
+    ny = round((ymax - ymin) / extent.spacing) + 1
+    return nx * ny
+
+
+def source_halo(
+    source_spacing: float, spacing: float, window_width: float = None
+) -> float:
+    """Calculates how far the influence of an update grid extends beyond a region.
+
+    A node of the difference grid depends on:
+
+    - all nodes within `window_width` (smoothing window),
+    - block medians within the nearneighbour search radius of `2 * max_spacing`,
+    - all points in the blocks containing those medians (one further block width),
+    - the base grid nodes surrounding each block median (one base grid spacing).
+
+    A further block width is added so that the blocks at the edge of a tile, which
+    may be incomplete, never contribute.
+
+    Args:
+        source_spacing: Grid spacing of the update grid.
+        spacing: Grid spacing of the base grid.
+        window_width: Width of optional smoothing window around update grid.
+
+    Returns:
+        Distance beyond a region within which data is needed to update that region exactly.
+    """
+    max_spacing = max(source_spacing, spacing)
+    return (window_width or 0.0) + 4 * max_spacing + spacing
+
+
+def tile_size_from_memory(memory_budget: float, padding: int) -> int:
+    """Calculates the number of nodes along each side of a square tile.
+
+    Args:
+        memory_budget: Memory available to process a single tile, in bytes.
+        padding: Number of nodes by which each side of the tile is padded.
+
+    Returns:
+        Number of nodes along each side of the tile, excluding padding.
+    """
+    padded_size = int(math.sqrt(memory_budget / BYTES_PER_CELL))
+    tile_size = padded_size - 2 * padding
+    if tile_size < 1:
+        raise ValueError(
+            f"Memory budget of {memory_budget} bytes is too small for tiles padded by {padding} nodes"
+        )
+    return tile_size
+
+
+def plan_tiles(nx: int, ny: int, tile_size: int) -> list:
+    """Splits a grid into non-overlapping square tiles.
+
+    Args:
+        nx: Number of nodes in the x direction.
+        ny: Number of nodes in the y direction.
+        tile_size: Number of nodes along each side of a tile.
+
+    Returns:
+        List of tiles, each as slices for each coordinate.
+    """
+    return [
+        {"x": slice(i, min(i + tile_size, nx)), "y": slice(j, min(j + tile_size, ny))}
+        for j in range(0, ny, tile_size)
+        for i in range(0, nx, tile_size)
+    ]
+
+
+def split_tile(tile: dict, multiple: int = 1) -> list:
+    """Splits a tile in half along each side, at multiples of a number of nodes.
+
+    Args:
+        tile: Tile as slices for each coordinate.
+        multiple: Number of nodes which the sides of the new tiles (other than at the end of
+            the original tile) must be multiples of, e.g. to keep them aligned with chunks.
+
+    Returns:
+        List of tiles covering the original tile. Only the original tile if no side is longer
+        than `multiple`, so it cannot be split.
+    """
+    bounds = {}
+    for dim in ["x", "y"]:
+        start, stop = tile[dim].start, tile[dim].stop
+        half = math.ceil((stop - start) / (2 * multiple)) * multiple
+        if start + half < stop:
+            bounds[dim] = [(start, start + half), (start + half, stop)]
+        else:
+            bounds[dim] = [(start, stop)]
+
+    return [
+        {"x": slice(*x_bounds), "y": slice(*y_bounds)}
+        for y_bounds in bounds["y"]
+        for x_bounds in bounds["x"]
+    ]
+
+
+def tile_region(x: np.ndarray, y: np.ndarray, tile: dict) -> list:
+    """Finds the bounding region of a tile.
+
+    Args:
+        x: Coordinates of the full grid in the x direction.
+        y: Coordinates of the full grid in the y direction.
+        tile: Tile as slices for each coordinate.
+
+    Returns:
+        Bounding region of the tile.
+    """
+    tile_x = x[tile["x"]]
+    tile_y = y[tile["y"]]
+    return [float(tile_x[0]), float(tile_x[-1]), float(tile_y[0]), float(tile_y[-1])]
+
+
+def overlapping_sources(
+    region: list, sources: list, spacing: float, window_width: float = None
+) -> Tuple[list, list]:
+    """Finds the update grids which can affect a region, and how far each one's influence extends.
+
+    Each update grid is differenced against the base grid as already updated by the
+    previous update grids, so the padding required around a region is the sum of the
+    halos of every update grid which affects it. As a larger padding may bring more update
+    grids into play, this is iterated until the set of update grids no longer changes.
+
+    Args:
+        region: Region to be updated.
+        sources: Extents of all update grids, in the order they are applied.
+        spacing: Grid spacing of the base grid.
+        window_width: Width of optional smoothing window around update grids.
+
+    Returns:
+        - Extents of the update grids affecting the region, in the order they are applied.
+        - Halo of each of these update grids.
+    """
+    padding = 0.0
+    while True:
+        overlapping = []
+        halos = []
+        for source in sources:
+            halo = source_halo(source.spacing, spacing, window_width)
+            padded = expand_region(region, padding + halo)
+            if is_region_valid(min_regions(source.region, padded)):
+                overlapping.append(source)
+                halos.append(halo)
+
+        if sum(halos) <= padding:
+            return overlapping, halos
+        padding = sum(halos)
+
+
+def tile_window(
+    x: np.ndarray,
+    y: np.ndarray,
+    tile: dict,
+    sources: list,
+    window_width: float = None,
+) -> Tuple[list, list, list]:
+    """Finds the window of the base grid needed to update a tile exactly.
+
+    The tile is padded by the sum of the halos of the update grids affecting it, see
+    overlapping_sources.
+
+    Args:
+        x: Coordinates of the full grid in the x direction.
+        y: Coordinates of the full grid in the y direction.
+        tile: Tile as slices for each coordinate.
+        sources: Extents of all update grids, in the order they are applied.
+        window_width: Width of optional smoothing window around update grids.
+
+    Returns:
+        - Extents of the update grids affecting the tile, in the order they are applied.
+        - Halo of each of these update grids.
+        - Region of the window, whose bounds lie on the nodes of the full grid.
+    """
+    spacing = float(x[1] - x[0])
+    full_region = [x[0], x[-1], y[0], y[-1]]
+    core_region = tile_region(x, y, tile)
+
+    sources, halos = overlapping_sources(core_region, sources, spacing, window_width)
+    window = min_regions(
+        snap_region(expand_region(core_region, sum(halos)), [x[0], y[0]], spacing),
+        full_region,
+    )
+    return sources, halos, window
+
+
+def plan_tiles_within_memory(
+    x: np.ndarray,
+    y: np.ndarray,
+    tile_size: int,
+    sources: list,
+    memory_budget: float,
+    window_width: float = None,
+    multiple: int = 1,
+) -> list:
+    """Splits a grid into tiles whose padded windows each fit within a memory budget.
+
+    The grid is first split into square tiles, as by plan_tiles. Where several update grids
+    overlap, a tile's window is padded by all of their halos (see tile_window), so tiles
+    whose windows exceed the budget are split in turn until they fit.
+
+    Args:
+        x: Coordinates of the full grid in the x direction.
+        y: Coordinates of the full grid in the y direction.
+        tile_size: Number of nodes along each side of the initial tiles.
+        sources: Extents of all update grids, in the order they are applied.
+        memory_budget: Memory available to process a single tile, in bytes.
+        window_width: Width of optional smoothing window around update grids.
+        multiple: Number of nodes which the sides of split tiles must be multiples of,
+            see split_tile.
+
+    Returns:
+        List of tiles, each as slices for each coordinate.
+    """
+    spacing = float(x[1] - x[0])
+
+    def fit(tile):
+        _, _, window = tile_window(x, y, tile, sources, window_width)
+        window_cells = (round((window[1] - window[0]) / spacing) + 1) * (
+            round((window[3] - window[2]) / spacing) + 1
+        )
+        if BYTES_PER_CELL * window_cells <= memory_budget:
+            return [tile]
+
+        parts = split_tile(tile, multiple)
+        if len(parts) == 1:
+            raise ValueError(
+                f"Memory budget of {memory_budget} bytes is too small for the window of "
+                f"{window_cells} nodes around tile {tile}"
+            )
+        return [fitted for part in parts for fitted in fit(part)]
+
+    return [
+        fitted
+        for tile in plan_tiles(len(x), len(y), tile_size)
+        for fitted in fit(tile)
+    ]
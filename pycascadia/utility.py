@@ -2,8 +2,12 @@
 Misc utility functions
 """
 
+import numpy as np
 import xarray as xr
 import pandas
+from typing import Tuple
+
+from pycascadia.nodata import all_values_are_nodata, valid_data_mask
 
 
 def region_to_str(region: list) -> str:
@@ -52,16 +56,68 @@ def is_region_valid(region: list) -> bool:
         return True
 
 
-def all_values_are_nodata(grid: xr.DataArray) -> bool:
-    """Determines if all values in grid are nodata
+def expand_region(region: list, width: float) -> list:
+    """Expands a region by the same width in every direction.
 
     Args:
-        grid: Xarray grid.
+        region: Input region.
+        width: Distance by which each side of the region is moved outwards.
 
     Returns:
-        True if all values in grid are nodata values, False otherwise.
+        Expanded region.
     """
-    return (grid.nodatavals == grid.values).all()
+    return [region[0] - width, region[1] + width, region[2] - width, region[3] + width]
+
+
+def snap_region(region: list, origin: list, spacing: float) -> list:
+    """Expands a region outwards so its bounds lie on the nodes of a regular lattice.
+
+    Args:
+        region: Input region.
+        origin: Coordinates (x, y) of any node of the lattice.
+        spacing: Spacing of the lattice.
+
+    Returns:
+        Smallest region on the lattice which contains the input region.
+    """
+    tol = 1e-6  # Tolerance (in units of spacing) for bounds which already lie on the lattice
+
+    def snap(value, offset, rounding):
+        return offset + rounding((value - offset) / spacing) * spacing
+
+    return [
+        snap(region[0], origin[0], lambda n: np.floor(n + tol)),
+        snap(region[1], origin[0], lambda n: np.ceil(n - tol)),
+        snap(region[2], origin[1], lambda n: np.floor(n + tol)),
+        snap(region[3], origin[1], lambda n: np.ceil(n - tol)),
+    ]
+
+
+def region_to_slices(xr_data: xr.DataArray, region: list) -> dict:
+    """Finds the index slices selecting the nodes of a grid within a region.
+
+    As with GMT's grdcut, the bounds of the region are rounded to the nearest grid nodes
+    and clipped to the extent of the grid. Coordinates are assumed to be regularly spaced
+    and sorted in ascending order.
+
+    Args:
+        xr_data: Xarray grid.
+        region: Bounding box in format [xmin, xmax, ymin, ymax].
+
+    Returns:
+        Dictionary of slices for each coordinate, suitable for `DataArray.isel`.
+        Slices are empty if the region does not overlap the grid.
+    """
+    slices = {}
+    for dim, (lower, upper) in (("x", region[0:2]), ("y", region[2:4])):
+        coords = xr_data[dim].values
+        n = len(coords)
+        spacing = (coords[-1] - coords[0]) / (n - 1) if n > 1 else 1.0
+        start = max(int(np.round((lower - coords[0]) / spacing)), 0)
+        stop = min(int(np.round((upper - coords[0]) / spacing)) + 1, n)
+        slices[dim] = slice(start, max(start, stop))
+
+    return slices
 
 
 def read_fnames(input_txt: str) -> list:
@@ -80,21 +136,70 @@ def read_fnames(input_txt: str) -> list:
     return lines
 
 
-def xr_to_xyz(xr_data: xr.DataArray) -> pandas.DataFrame:
+def read_weighted_fnames(input_txt: str) -> Tuple[list, list]:
+    """Reads filenames from text file, each optionally followed by a weight.
+
+    Each line holds a filename and, separated by whitespace, an optional weight
+    (priority) used by the weighted merge of remove-restore. Weights default to 1.
+
+    Args:
+        input_txt: File from which filenames will be read.
+
+    Returns:
+        - List of filenames.
+        - List of weights of the files.
+    """
+    fnames = []
+    weights = []
+    for line in read_fnames(input_txt):
+        if not line:
+            continue
+        parts = line.rsplit(maxsplit=1)
+        weight = 1.0
+        if len(parts) == 2:
+            try:
+                weight = float(parts[1])
+            except ValueError:
+                # Not a weight, but part of a filename containing whitespace
+                parts = [line]
+        fnames.append(parts[0])
+        weights.append(weight)
+
+    return fnames, weights
+
+
+def xr_to_xyz(
+    xr_data: xr.DataArray, nodatavals: list = None, data: np.ndarray = None
+) -> pandas.DataFrame:
     """Converts an xarray dataarray into a pandas dataframe.
 
     This requires the input coordinates to be named (x,y) and the
-    elevation to be named z.
+    elevation to be named z. Points are ordered with x varying fastest.
+
+    The coordinate columns are built by broadcasting the 1D coordinates,
+    so only the points which contain data are ever materialised.
 
     Args:
         xr_data: Xarray grid.
+        nodatavals: Optional list of values which will be excluded from the output. NaN values are always excluded.
+        data: Optional mask of the nodes of `xr_data` which hold data, in the order of its
+            dimensions, if already known. `nodatavals` is then ignored.
 
     Returns:
         Pandas dataframe of xyz points.
     """
-    xyz_data = xr_data.to_dataframe()
-    xyz_data = xyz_data.reset_index()
-    xyz_data = xyz_data[["x", "y", "z"]]
+    if data is not None and xr_data.dims[0] == "x":
+        data = data.T
+    xr_data = xr_data.transpose("y", "x")
+    values = xr_data.values
+    mask = valid_data_mask(values, nodatavals) if data is None else data
+
+    x = np.broadcast_to(xr_data.x.values[np.newaxis, :], values.shape)
+    y = np.broadcast_to(xr_data.y.values[:, np.newaxis], values.shape)
+
+    xyz_data = pandas.DataFrame(
+        {"x": x[mask], "y": y[mask], "z": values[mask]}, copy=False
+    )
     return xyz_data
 
 
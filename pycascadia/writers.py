@@ -0,0 +1,550 @@
+"""
+Writers which stream grids to file one tile at a time
+"""
+
+import json
+import os
+
+import netCDF4
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+try:
+    import numcodecs
+    import zarr
+except ImportError:  # Zarr stores are optional, see the `zarr` extra
+    zarr = None
+
+# Compression codecs supported by the writers
+COMPRESSIONS = ("zlib", "zstd")
+
+# Data types in which values can be stored. int16 values are scaled, see NetCDFGridWriter
+DTYPES = ("float32", "int16")
+
+# Fill value of int16 grids, marking nodes without data
+INT16_FILL_VALUE = np.iinfo(np.int16).min
+
+# Attributes set by the writers themselves, which are not copied from the grid
+RESERVED_ATTRS = ("_FillValue", "scale_factor", "add_offset", "missing_value")
+
+# Names of the compression codecs in GDAL's COG driver
+COG_COMPRESSIONS = {None: "NONE", "zlib": "DEFLATE", "zstd": "ZSTD"}
+
+# Default number of nodes along each side of the chunks of Zarr stores
+ZARR_CHUNK_SIZE = 1024
+
+
+def output_format(fname: str) -> str:
+    """Finds the format in which a grid is written, from the filename's extension.
+
+    Args:
+        fname: Output filename.
+
+    Returns:
+        One of "geotiff" (`.tif` or `.tiff`), "zarr" (`.zarr`) or "netcdf" (anything else).
+    """
+    ext = fname.rstrip("/").split(".")[-1]
+    if ext == "tif" or ext == "tiff":
+        return "geotiff"
+    if ext == "zarr":
+        return "zarr"
+    return "netcdf"
+
+
+def _int16_limits(scale_factor: float, add_offset: float) -> tuple:
+    """Finds the range of values which can be stored as scaled int16 values.
+
+    The smallest int16 value is excluded, as it is the fill value.
+
+    Args:
+        scale_factor: Scale of int16 values.
+        add_offset: Offset of int16 values.
+
+    Returns:
+        Minimum and maximum values.
+    """
+    return (
+        (INT16_FILL_VALUE + 1) * scale_factor + add_offset,
+        np.iinfo(np.int16).max * scale_factor + add_offset,
+    )
+
+
+def _check_limits(values: np.ma.MaskedArray, limits: tuple) -> None:
+    """Raises ValueError if any values are outside the range which can be stored.
+
+    Args:
+        values: Values, with nodes without data masked.
+        limits: Minimum and maximum values which can be stored.
+    """
+    if values.count() and (values.min() < limits[0] or values.max() > limits[1]):
+        raise ValueError(
+            f"Values outside the range {limits} representable as int16, increase the scale factor"
+        )
+
+
+def _netcdf_attrs(attrs: dict) -> dict:
+    """Selects the attributes of a grid which can be stored in a netcdf file.
+
+    Args:
+        attrs: Attributes of the grid.
+
+    Returns:
+        Attributes with values which are strings, numbers or sequences of numbers.
+    """
+    netcdf_attrs = {}
+    for name, value in (attrs or {}).items():
+        if name in RESERVED_ATTRS:
+            continue
+        if isinstance(value, (list, tuple)) and not all(
+            isinstance(item, (int, float, np.number)) for item in value
+        ):
+            continue
+        if isinstance(value, (str, int, float, np.number, list, tuple, np.ndarray)):
+            netcdf_attrs[name] = value
+    return netcdf_attrs
+
+
+class NetCDFGridWriter:
+    """Writes a grid to a chunked netcdf file, one tile at a time.
+
+    The output has the same layout as files written by `Grid.save_grid`: a single
+    variable `z` with dimensions `y` and `x`. The grid may instead be written to a group
+    of an open file, e.g. to store several grids in the same file.
+
+    Values may be compressed with zlib or zstd, and may be stored as float32 or as
+    int16 scaled by `scale_factor` and offset by `add_offset`, following the CF conventions.
+    Readers such as xarray and GMT unpack scaled values automatically. Nodes without data
+    (NaN) are stored as the fill value.
+
+    Intended to be used as a context manager:
+
+        with NetCDFGridWriter("out.nc", x, y, chunks=(512, 512)) as writer:
+            writer.write(values, {"x": slice(0, 512), "y": slice(0, 512)})
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        x: np.ndarray,
+        y: np.ndarray,
+        chunks: tuple = None,
+        compression: str = None,
+        complevel: int = None,
+        dtype: str = "float32",
+        scale_factor: float = 1.0,
+        add_offset: float = 0.0,
+        attrs: dict = None,
+        group: str = None,
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            fname: Output filename, or an open dataset (e.g. `dataset` of another writer)
+                in which to create `group`.
+            x: Coordinates of the grid in the x direction.
+            y: Coordinates of the grid in the y direction.
+            chunks: Optional chunk shape (in format (ny, nx)) of the output variable.
+            compression: Optional compression codec, one of COMPRESSIONS.
+            complevel: Optional compression level. Defaults to the codec's default.
+            dtype: Data type in which values are stored, one of DTYPES.
+            scale_factor: Scale of int16 values, i.e. the precision to which values are stored.
+            add_offset: Offset of int16 values.
+            attrs: Optional attributes of the output variable.
+            group: Optional group in which the grid is written, rather than the root of the file.
+        """
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {compression}, must be one of {COMPRESSIONS}"
+            )
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown data type {dtype}, must be one of {DTYPES}")
+
+        if isinstance(fname, netCDF4.Dataset):
+            # The file belongs to another writer, which closes it
+            self.file = None
+            self.dataset = fname
+        else:
+            self.file = netCDF4.Dataset(fname, "w")
+            self.dataset = self.file
+        if group is not None:
+            self.dataset = self.dataset.createGroup(group)
+        self.dataset.createDimension("x", len(x))
+        self.dataset.createDimension("y", len(y))
+        self.dataset.createVariable("x", "f8", ("x",))[:] = x
+        self.dataset.createVariable("y", "f8", ("y",))[:] = y
+
+        if chunks is not None:
+            chunks = (min(chunks[0], len(y)), min(chunks[1], len(x)))
+
+        compression_kwargs = {}
+        if compression is not None:
+            compression_kwargs = {"compression": compression, "shuffle": True}
+            if complevel is not None:
+                compression_kwargs["complevel"] = complevel
+
+        if dtype == "int16":
+            self.z = self.dataset.createVariable(
+                "z",
+                "i2",
+                ("y", "x"),
+                chunksizes=chunks,
+                fill_value=INT16_FILL_VALUE,
+                **compression_kwargs,
+            )
+            # Setting these attributes makes netCDF4 pack values when they are written
+            self.z.scale_factor = np.float32(scale_factor)
+            self.z.add_offset = np.float32(add_offset)
+            self.add_offset = add_offset
+            self.limits = _int16_limits(scale_factor, add_offset)
+        else:
+            self.z = self.dataset.createVariable(
+                "z", "f4", ("y", "x"), chunksizes=chunks, **compression_kwargs
+            )
+            self.limits = None
+
+        self.z.setncatts(_netcdf_attrs(attrs))
+
+    def write(self, values: np.ndarray, slices: dict) -> None:
+        """Writes a tile of the grid.
+
+        Args:
+            values: Values of the tile (in format (ny, nx)).
+            slices: Position of the tile in the grid, as slices for each coordinate.
+        """
+        if self.limits is not None:
+            # Mask nodes without data, whose placeholder values are packed then replaced by the fill value
+            mask = np.isnan(values)
+            values = np.ma.masked_array(
+                np.where(mask, self.add_offset, values), mask=mask
+            )
+            _check_limits(values, self.limits)
+        self.z[slices["y"], slices["x"]] = values
+
+    def close(self) -> None:
+        """Closes the output file, unless it was opened by another writer."""
+        if self.file is not None and self.file.isopen():
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class GeoTiffGridWriter:
+    """Writes a grid to a Cloud-Optimized GeoTiff (COG), one tile at a time.
+
+    Tiles are first written to a tiled temporary GeoTiff next to the output. When the
+    writer is closed, GDAL's COG driver copies this to the output, adding internal
+    overviews (averages of blocks of 2, 4, 8, ... nodes) and ordering the file so that
+    windows of any overview can be read with few requests. Such overviews are read by
+    `Grid(fname, spacing=...)` when a coarser grid is needed.
+
+    Nodes of the grid are the centres of the pixels. Values are stored as float32, with
+    NaN marking nodes without data.
+
+    Intended to be used as a context manager:
+
+        with GeoTiffGridWriter("out.tif", x, y, chunks=(512, 512)) as writer:
+            writer.write(values, {"x": slice(0, 512), "y": slice(0, 512)})
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        x: np.ndarray,
+        y: np.ndarray,
+        chunks: tuple = None,
+        compression: str = None,
+        complevel: int = None,
+        dtype: str = "float32",
+        crs: str = None,
+        attrs: dict = None,
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            fname: Output filename.
+            x: Coordinates of the grid in the x direction.
+            y: Coordinates of the grid in the y direction.
+            chunks: Optional block shape (in format (ny, nx)) of the output. The COG driver
+                uses square blocks, of the larger size and at least 128. Defaults to 512x512.
+            compression: Optional compression codec, one of COMPRESSIONS.
+            complevel: Optional compression level. Defaults to the codec's default.
+            dtype: Data type in which values are stored. Only float32 is supported.
+            crs: Optional coordinate reference system of the grid, used if not given by
+                `attrs`. Grids with neither are written without a CRS.
+            attrs: Optional attributes of the grid.
+        """
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {compression}, must be one of {COMPRESSIONS}"
+            )
+        if dtype != "float32":
+            raise ValueError(
+                f"GeoTiff grids can only be written as float32, not {dtype}"
+            )
+
+        self.fname = fname
+        self.tmp_fname = f"{fname}.{os.getpid()}.tmp.tif"
+        self.ny = len(y)
+        self.profile = {"compress": COG_COMPRESSIONS[compression]}
+        if complevel is not None:
+            self.profile["level"] = complevel
+        if chunks is not None:
+            # GDAL requires block sizes which are multiples of 16, and recommends at least 128
+            self.profile["blocksize"] = max(128, -(-max(chunks) // 16) * 16)
+
+        dx = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 1.0
+        dy = (y[-1] - y[0]) / (len(y) - 1) if len(y) > 1 else dx
+        transform = from_origin(x[0] - dx / 2, y[-1] + dy / 2, dx, dy)
+        crs = (attrs or {}).get("crs", crs)
+
+        self.dataset = rasterio.open(
+            self.tmp_fname,
+            "w",
+            driver="GTiff",
+            width=len(x),
+            height=len(y),
+            count=1,
+            dtype="float32",
+            nodata=np.nan,
+            crs=crs,
+            transform=transform,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            BIGTIFF="IF_SAFER",
+        )
+
+    def write(self, values: np.ndarray, slices: dict) -> None:
+        """Writes a tile of the grid.
+
+        Args:
+            values: Values of the tile (in format (ny, nx)), with y increasing.
+            slices: Position of the tile in the grid, as slices for each coordinate.
+        """
+        x_start, x_stop, _ = slices["x"].indices(self.dataset.width)
+        y_start, y_stop, _ = slices["y"].indices(self.ny)
+        # Rows of a GeoTiff run from north to south
+        window = Window(
+            x_start, self.ny - y_stop, x_stop - x_start, y_stop - y_start
+        )
+        self.dataset.write(
+            np.asarray(values, dtype="float32")[::-1], 1, window=window
+        )
+
+    def close(self) -> None:
+        """Closes the temporary file and writes the Cloud-Optimized GeoTiff."""
+        if self.dataset.closed:
+            return
+        self.dataset.close()
+        try:
+            rasterio.shutil.copy(
+                self.tmp_fname,
+                self.fname,
+                driver="COG",
+                resampling="AVERAGE",
+                bigtiff="IF_SAFER",
+                **self.profile,
+            )
+        finally:
+            os.remove(self.tmp_fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class ZarrGridWriter:
+    """Writes a grid to a Zarr store, one tile at a time.
+
+    The store has the same layout as netcdf files written by NetCDFGridWriter (a single
+    variable `z` with dimensions `y` and `x`, following xarray's conventions, at the root
+    of the store or in a group) and supports the same compression and int16 encoding.
+
+    The metadata of the store is written when the writer is created. Afterwards, other
+    processes may open the store with `ZarrGridWriter.open_existing` and write tiles
+    concurrently, provided that no two processes write to the same chunk. Tiles which
+    are aligned with the chunks can therefore be written by the workers which computed
+    them, without gathering the grid in a single process.
+
+    Intended to be used as a context manager:
+
+        with ZarrGridWriter("out.zarr", x, y, chunks=(512, 512)) as writer:
+            writer.write(values, {"x": slice(0, 512), "y": slice(0, 512)})
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        x: np.ndarray,
+        y: np.ndarray,
+        chunks: tuple = None,
+        compression: str = None,
+        complevel: int = None,
+        dtype: str = "float32",
+        scale_factor: float = 1.0,
+        add_offset: float = 0.0,
+        attrs: dict = None,
+        group: str = None,
+    ) -> None:
+        """
+        Constructor
+
+        Args:
+            fname: Output store. Any existing store is overwritten, unless `group` is given.
+            x: Coordinates of the grid in the x direction.
+            y: Coordinates of the grid in the y direction.
+            chunks: Optional chunk shape (in format (ny, nx)). Defaults to ZARR_CHUNK_SIZE nodes square.
+            compression: Optional compression codec, one of COMPRESSIONS.
+            complevel: Optional compression level. Defaults to the codec's default.
+            dtype: Data type in which values are stored, one of DTYPES.
+            scale_factor: Scale of int16 values, i.e. the precision to which values are stored.
+            add_offset: Offset of int16 values.
+            attrs: Optional attributes of the output variable.
+            group: Optional group in which the grid is written, within an existing store
+                (e.g. one created by another writer) rather than in a new store.
+        """
+        if zarr is None:
+            raise ImportError("Writing Zarr stores requires zarr to be installed")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {compression}, must be one of {COMPRESSIONS}"
+            )
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown data type {dtype}, must be one of {DTYPES}")
+
+        compressor = None
+        if compression is not None:
+            codec = numcodecs.Zlib if compression == "zlib" else numcodecs.Zstd
+            compressor = codec() if complevel is None else codec(level=complevel)
+
+        if chunks is None:
+            chunks = (ZARR_CHUNK_SIZE, ZARR_CHUNK_SIZE)
+        chunks = (min(chunks[0], len(y)), min(chunks[1], len(x)))
+
+        if group is None:
+            group = zarr.open_group(fname, mode="w")
+        else:
+            group = zarr.open_group(fname, mode="a").create_group(group, overwrite=True)
+        for name, coord in [("x", x), ("y", y)]:
+            # Coordinates have no fill value, which xarray would decode as NaN
+            array = group.create_dataset(
+                name, data=np.asarray(coord, dtype="f8"), fill_value=None
+            )
+            array.attrs["_ARRAY_DIMENSIONS"] = [name]
+
+        if dtype == "int16":
+            z = group.create_dataset(
+                "z",
+                shape=(len(y), len(x)),
+                chunks=chunks,
+                dtype="i2",
+                fill_value=INT16_FILL_VALUE,
+                compressor=compressor,
+            )
+            z.attrs.update(scale_factor=float(scale_factor), add_offset=float(add_offset))
+        else:
+            z = group.create_dataset(
+                "z",
+                shape=(len(y), len(x)),
+                chunks=chunks,
+                dtype="f4",
+                fill_value=np.nan,
+                compressor=compressor,
+            )
+        # Attributes must be serialisable as JSON
+        attrs = json.loads(
+            json.dumps(_netcdf_attrs(attrs), default=lambda value: value.tolist())
+        )
+        z.attrs.update(attrs, _ARRAY_DIMENSIONS=["y", "x"])
+        zarr.consolidate_metadata(fname)
+
+        self._attach(z)
+
+    @classmethod
+    def open_existing(cls, fname: str, group: str = None) -> "ZarrGridWriter":
+        """
+        Opens a store created by another writer, e.g. in a different process, to write tiles to it.
+
+        Args:
+            fname: Output store.
+            group: Optional group in which the grid was written.
+
+        Returns:
+            Writer of the store.
+        """
+        if zarr is None:
+            raise ImportError("Writing Zarr stores requires zarr to be installed")
+        writer = cls.__new__(cls)
+        path = "z" if group is None else f"{group}/z"
+        writer._attach(zarr.open_group(fname, mode="r+")[path])
+        return writer
+
+    def _attach(self, z) -> None:
+        """Sets the array to which tiles are written, and how their values are encoded."""
+        self.z = z
+        self.chunks = z.chunks
+        if z.dtype == np.int16:
+            self.scale_factor = z.attrs["scale_factor"]
+            self.add_offset = z.attrs["add_offset"]
+            self.limits = _int16_limits(self.scale_factor, self.add_offset)
+        else:
+            self.limits = None
+
+    def write(self, values: np.ndarray, slices: dict) -> None:
+        """Writes a tile of the grid.
+
+        Args:
+            values: Values of the tile (in format (ny, nx)).
+            slices: Position of the tile in the grid, as slices for each coordinate.
+        """
+        if self.limits is not None:
+            mask = np.isnan(values)
+            _check_limits(np.ma.masked_array(values, mask=mask), self.limits)
+            packed = np.rint((values - self.add_offset) / self.scale_factor)
+            values = np.where(mask, INT16_FILL_VALUE, packed).astype("i2")
+        self.z[slices["y"], slices["x"]] = values
+
+    def close(self) -> None:
+        """Does nothing, as every tile is written to the store immediately."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def open_grid_writer(fname: str, x: np.ndarray, y: np.ndarray, **kwargs):
+    """Opens a writer for the format given by the filename's extension.
+
+    GeoTiffs (`.tif` or `.tiff`) are written as Cloud-Optimized GeoTiffs, `.zarr`
+    stores with Zarr and other files as netcdf.
+
+    Args:
+        fname: Output filename.
+        x: Coordinates of the grid in the x direction.
+        y: Coordinates of the grid in the y direction.
+        kwargs: Options of the writer, see NetCDFGridWriter, GeoTiffGridWriter and ZarrGridWriter.
+            Only netcdf and Zarr writers support `group` and int16 values (`scale_factor`,
+            `add_offset`), GeoTiffGridWriter rejects them.
+
+    Returns:
+        Writer of the output file.
+    """
+    fmt = output_format(fname)
+    if fmt == "geotiff":
+        return GeoTiffGridWriter(fname, x, y, **kwargs)
+    if fmt == "zarr":
+        return ZarrGridWriter(fname, x, y, **kwargs)
+    return NetCDFGridWriter(fname, x, y, **kwargs)
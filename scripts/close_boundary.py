@@ -1,16 +1,136 @@
 #!/usr/bin/env python3
 
+from pycascadia.grid import Grid
 from pycascadia.loaders import load_source
-from pygmt import grdcut
+from pycascadia.utility import region_to_slices
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import argparse
+import logging
+import sys
+import csv
+import os
+import tempfile
 
+# Source grid shared by the worker processes of close_regions
+_source_grid = None
 
-def clip_to_value(arr, test_arr=None, value=0.0):
-    if test_arr is None:
-        test_arr = arr
 
-    arr[test_arr > value] = value
+def close_boundary(values, value=0.0, offset=False):
+    """Clips the values on the four edges of a grid to at most `value`, in place.
+
+    Args:
+        values: Values of the grid.
+        value: Value to replace the boundary with, wherever it is larger.
+        offset: Whether to test the nodes one index inside the boundary, rather than the boundary itself.
+    """
+    for edge, inner in [(0, 1), (-1, -2)]:
+        test = values[inner if offset else edge, :]
+        values[edge, :][test > value] = value
+    for edge, inner in [(0, 1), (-1, -2)]:
+        test = values[:, inner if offset else edge]
+        values[:, edge][test > value] = value
+
+
+def read_manifest(fname, value=0.0, offset=False):
+    """Reads the jobs of a batch from a CSV manifest.
+
+    The manifest has a header and one row per job, with columns `output`, `xmin`, `xmax`,
+    `ymin` and `ymax`, and optionally `value` and `offset` (true/false). Missing values
+    and offsets default to those given on the command line.
+
+    Args:
+        fname: Manifest filename.
+        value: Default value to replace boundaries with.
+        offset: Default for whether to use one index from the true boundary as boundary.
+
+    Returns:
+        List of jobs, each as a dictionary with keys `output`, `region`, `value` and `offset`.
+    """
+    jobs = []
+    with open(fname, newline="") as fp:
+        for row in csv.DictReader(fp):
+            jobs.append(
+                {
+                    "output": row["output"],
+                    "region": [float(row[key]) for key in ["xmin", "xmax", "ymin", "ymax"]],
+                    "value": float(row["value"]) if row.get("value") else value,
+                    "offset": row["offset"].strip().lower() in ["true", "1", "yes"]
+                    if row.get("offset")
+                    else offset,
+                }
+            )
+    return jobs
+
+
+def close_region(grid, job):
+    """Closes the boundary of a region of a grid and saves it.
+
+    The region is cut from the grid as a view, and its edges are clipped in place,
+    then restored once the region has been saved. The grid is therefore unchanged,
+    and regions may overlap or be nested.
+
+    Args:
+        grid: Source grid.
+        job: Job, with keys `output`, `region`, `value` and `offset`.
+    """
+    region = grid.grid.isel(region_to_slices(grid.grid, job["region"]))
+    values = region.values
+    if values.size == 0:
+        print(f"Region {job['region']} of {job['output']} does not overlap the grid")
+        return
+
+    rows = values[[0, -1], :].copy()
+    cols = values[:, [0, -1]].copy()
+    close_boundary(values, value=job["value"], offset=job["offset"])
+    try:
+        Grid.from_dataarray(region).save_grid(job["output"])
+    finally:
+        values[[0, -1], :] = rows
+        values[:, [0, -1]] = cols
+
+
+def _init_worker(fname, x, y):
+    """Maps the shared source grid in a worker process.
+
+    The grid is mapped copy-on-write, so edges clipped in place are never seen by other processes.
+    """
+    global _source_grid
+    _source_grid = Grid.from_memmap(fname, x, y, mode="c")
+
+
+def _close_region_task(job):
+    close_region(_source_grid, job)
+    return job["output"]
+
+
+def close_regions(in_fname, jobs, n_jobs=1):
+    """Closes the boundaries of many regions of the same grid, which is only loaded once.
+
+    Args:
+        in_fname: Input grid filename.
+        jobs: Jobs, see read_manifest.
+        n_jobs: Number of worker processes, which share the loaded grid through a memory-mapped file.
+    """
+    grid = Grid(in_fname)
+
+    if n_jobs <= 1:
+        for job in jobs:
+            close_region(grid, job)
+            print(f"Saved {job['output']}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shared_fname = os.path.join(tmpdir, "source_grid.npy")
+        grid.to_memmap(shared_fname)
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=(shared_fname, grid.grid.x.values, grid.grid.y.values),
+        ) as executor:
+            for output in executor.map(_close_region_task, jobs):
+                print(f"Saved {output}")
+        del grid
 
 
 def main():
@@ -19,7 +139,7 @@ def main():
         description="Add piecewise halo surrounding given netcdf file"
     )
     parser.add_argument("--input", required=True, help="input file")
-    parser.add_argument("--output", required=True, help="output file")
+    parser.add_argument("--output", help="output file (required without --manifest)")
     parser.add_argument(
         "--value", type=float, default=0.0, help="value to replace boundary with"
     )
@@ -43,24 +163,36 @@ def main():
         type=float,
         help="output region. Defaults to the extent of the input grid.",
     )
+    parser.add_argument(
+        "--manifest",
+        required=False,
+        help="CSV file of jobs (columns output, xmin, xmax, ymin, ymax and optionally value, offset) to run on the same input grid, which is only loaded once",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="number of worker processes saving the outputs of a manifest in parallel",
+    )
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
+
+    if args.manifest:
+        jobs = read_manifest(args.manifest, value=args.value, offset=args.offset)
+        close_regions(args.input, jobs, n_jobs=args.jobs)
+        return
+
+    if not args.output:
+        parser.error("--output is required without --manifest")
 
     in_fname = args.input
     input_grid, _, _ = load_source(in_fname, plot=False)
 
     if args.region:
-        input_grid = grdcut(input_grid, region=args.region)
-
-    if args.offset:
-        clip_to_value(input_grid[0, :], input_grid[1, :], value=args.value)
-        clip_to_value(input_grid[-1, :], input_grid[-2, :], value=args.value)
-        clip_to_value(input_grid[:, 0], input_grid[:, 1], value=args.value)
-        clip_to_value(input_grid[:, -1], input_grid[:, -2], value=args.value)
-    else:
-        clip_to_value(input_grid[0, :], value=args.value)
-        clip_to_value(input_grid[-1, :], value=args.value)
-        clip_to_value(input_grid[:, 0], value=args.value)
-        clip_to_value(input_grid[:, -1], value=args.value)
+        # Select the same nodes as grdcut, as a view rather than a copy
+        input_grid = input_grid.isel(region_to_slices(input_grid, args.region))
+
+    close_boundary(input_grid.values, value=args.value, offset=args.offset)
 
     if args.plot:
         # Plot bath & contour on top
@@ -88,7 +220,8 @@ def main():
 
         plt.show()
 
-    input_grid.to_netcdf(args.output)
+    # Saved as the outputs of a manifest are, so both give the same file
+    Grid.from_dataarray(input_grid).save_grid(args.output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import numpy as np
+import xarray as xr
+from xarray.testing import assert_equal
+
+from pycascadia.cache import DiffCache
+from pycascadia.grid import Grid
+
+
+def create_diff_grid(n, value=1.0):
+    return xr.DataArray(
+        np.full((n, n), value, dtype=np.float32),
+        coords={"y": np.arange(n, dtype=float), "x": np.arange(n, dtype=float)},
+        dims=("y", "x"),
+        name="z",
+    )
+
+
+def test_diff_cache_get_put():
+    cache_dir = "./test_data/cache_temp"
+    cache = DiffCache(cache_dir)
+
+    assert cache.get("missing") == (False, None)
+
+    diff_grid = create_diff_grid(3)
+    cache.put("diff", diff_grid)
+    found, cached_grid = cache.get("diff")
+    assert found
+    assert_equal(cached_grid, diff_grid)
+
+    # Update grids which change nothing are cached too
+    cache.put("nothing", None)
+    assert cache.get("nothing") == (True, None)
+
+    shutil.rmtree(cache_dir)
+
+
+def test_diff_cache_eviction():
+    cache_dir = "./test_data/cache_temp"
+    cache = DiffCache(cache_dir)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, create_diff_grid(10))
+        os.utime(cache._fname(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    entry_size = os.path.getsize(cache._fname("a"))
+
+    # Using "a" makes "b" the least recently used
+    cache.get("a")
+    cache.max_size = 2.5 * entry_size
+    cache.evict()
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a")[0]
+    assert cache.get("c")[0]
+
+    shutil.rmtree(cache_dir)
+
+
+def test_diff_cache_key():
+    cache_dir = "./test_data/cache_temp"
+    base_fname = "./test_data/small_sample.nc"
+    update_fname = "./test_data/small_sample_update_temp.nc"
+
+    base_grid = Grid(base_fname)
+    x0, x1, y0, y1 = base_grid.region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0, (x0 + x1) / 2, y0, (y0 + y1) / 2])
+    update_grid.save_grid(update_fname)
+
+    cache = DiffCache(cache_dir)
+    key = cache.key(base_grid, update_fname, window_width=None)
+    assert cache.key(base_grid, update_fname, window_width=None) == key
+
+    # Parameters are part of the key
+    assert cache.key(base_grid, update_fname, window_width=0.01) != key
+
+    # Changes to the base grid far from the update grid do not affect the key
+    base_grid.grid[-1, -1] += 1.0
+    assert cache.key(base_grid, update_fname, window_width=None) == key
+
+    # Changes to the base grid beneath the update grid do
+    base_grid.grid[0, 0] += 1.0
+    assert cache.key(base_grid, update_fname, window_width=None) != key
+    base_grid.grid[0, 0] -= 1.0
+
+    # Changes to the update grid do
+    update_grid.grid += 1.0
+    update_grid.save_grid(update_fname)
+    assert cache.key(base_grid, update_fname, window_width=None) != key
+
+    os.remove(update_fname)
+    shutil.rmtree(cache_dir)
@@ -1,8 +1,11 @@
 import pytest
 import os
+import numpy as np
+from pygmt import grdcut
 from xarray.testing import assert_equal, assert_allclose
 
 from pycascadia.grid import Grid
+from pycascadia.utility import region_to_str
 
 
 def test_grid_loading():
@@ -30,3 +33,129 @@ def test_grid_saving():
     assert_equal(grid_og.grid, grid_saved.grid)
 
     os.remove(nc_fname_save)
+
+
+@pytest.mark.parametrize(
+    "fname_save, options",
+    [
+        ("./test_data/small_sample_temp.nc", {"chunks": (32, 32), "compression": "zlib"}),
+        ("./test_data/small_sample_temp.tif", {"compression": "zstd"}),
+    ],
+)
+def test_grid_saving_tiled(fname_save, options):
+    nc_fname = "./test_data/small_sample.nc"
+
+    grid_og = Grid(nc_fname)
+    grid_og.save_grid(fname_save, tile_size=50, **options)
+
+    grid_saved = Grid(fname_save)
+
+    assert grid_saved.region == grid_og.region
+    assert_allclose(grid_og.grid, grid_saved.grid.astype(grid_og.grid.dtype))
+
+    os.remove(fname_save)
+
+
+def test_grid_memmap():
+    nc_fname = "./test_data/small_sample.nc"
+    memmap_fname = "./test_data/small_sample_temp.npy"
+
+    grid = Grid(nc_fname)
+    expected = grid.grid.copy()
+    grid.to_memmap(memmap_fname)
+    assert_equal(grid.grid, expected)
+
+    # Changes made through one mapping of the file are seen by the others
+    shared = Grid.from_memmap(memmap_fname, grid.grid.x, grid.grid.y, mode="r+")
+    assert shared.region == grid.region
+    shared.grid[:10, :10] += 1.0
+    assert_equal(grid.grid[:10, :10], expected[:10, :10] + 1.0)
+
+    grid.to_memory()
+    del shared
+    os.remove(memmap_fname)
+    assert_equal(grid.grid[10:, 10:], expected[10:, 10:])
+
+
+def test_grid_resampling():
+    nc_fname = "./test_data/small_sample.nc"
+    resampled_fname = "./test_data/small_sample_resampled_temp.nc"
+    spacing = 0.01
+
+    cwd_contents = set(os.listdir("."))
+
+    grid = Grid(nc_fname)
+    region = grid.region
+    grid.resample(spacing)
+
+    # Resampling should not leave files in the current directory
+    assert set(os.listdir(".")) == cwd_contents
+
+    # Compare against a manual call to gmt
+    os.system(
+        f"gmt grdsample {nc_fname} -G{resampled_fname} -R{region_to_str(region)} -I{spacing}+e"
+    )
+    manual_grid = Grid(resampled_fname)
+    os.remove(resampled_fname)
+
+    assert grid.spacing == manual_grid.spacing
+    assert grid.region == manual_grid.region
+    assert_allclose(grid.grid, manual_grid.grid)
+
+
+@pytest.mark.parametrize(
+    "offsets",
+    [
+        [35.7, -71.4, 17.9, -35.7],  # Bounds rounded up and down to the nearest nodes
+        [5.3, -7.7, 3.7, -4.3],
+        [0.0, 0.0, 0.0, 0.0],  # Bounds on the edges of the grid
+        [-10.0, 10.0, -10.0, 10.0],  # Bounds beyond the edges of the grid
+    ],
+)
+def test_grid_cropping(offsets):
+    nc_fname = "./test_data/small_sample.nc"
+
+    grid = Grid(nc_fname)
+    # Offsets of the bounds of the region are in units of the grid spacing
+    region = [bound + offset * grid.spacing for bound, offset in zip(grid.region, offsets)]
+    # grdcut does not accept regions beyond the edges of the grid
+    x0, x1, y0, y1 = grid.region
+    gmt_region = [
+        max(region[0], x0),
+        min(region[1], x1),
+        max(region[2], y0),
+        min(region[3], y1),
+    ]
+    expected = grdcut(grid.grid, region=gmt_region)
+
+    original_values = grid.grid.values
+    grid.crop(region)
+
+    assert np.shares_memory(grid.grid.values, original_values)
+    assert grid.grid.shape == expected.shape
+    assert_allclose(grid.grid.x, expected.x)
+    assert_allclose(grid.grid.y, expected.y)
+    np.testing.assert_array_equal(grid.grid.values, expected.values)
+
+
+def test_grid_cropping_outside():
+    grid = Grid("./test_data/small_sample.nc")
+    x0, x1, y0, y1 = grid.region
+
+    with pytest.raises(ValueError):
+        grid.crop([x1 + 1.0, x1 + 2.0, y0, y1])
+
+
+def test_lazy_grid_cropping():
+    nc_fname = "./test_data/small_sample.nc"
+
+    grid_eager = Grid(nc_fname)
+    grid_lazy = Grid(nc_fname, lazy=True)
+
+    x0, x1, y0, y1 = grid_eager.region
+    region = [x0 + 0.01, x1 - 0.02, y0 + 0.005, y1 - 0.01]
+    grid_eager.crop(region)
+    grid_lazy.crop(region)
+
+    assert grid_lazy.region == grid_eager.region
+    assert_allclose(grid_lazy.grid, grid_eager.grid)
@@ -0,0 +1,69 @@
+import pytest
+import os
+import shutil
+
+from pycascadia.index import FootprintIndex
+from pycascadia.loaders import load_source, read_extent
+from pycascadia.writers import ZarrGridWriter
+
+
+def test_read_extent():
+    for fname in ["./test_data/small_sample.nc", "./test_data/small_sample.tif"]:
+        _, true_region, true_spacing = load_source(fname)
+        region, spacing = read_extent(fname)
+
+        assert region == true_region
+        assert spacing == true_spacing
+
+
+def test_footprint_index_query():
+    fname = "./test_data/small_sample.nc"
+    index = FootprintIndex()
+    region, _ = read_extent(fname)
+
+    # Overlapping region
+    assert [extent.fname for extent in index.query(region, [fname])] == [fname]
+
+    # Region to the right of the grid
+    outside = [region[1] + 1.0, region[1] + 2.0, region[2], region[3]]
+    assert index.query(outside, [fname]) == []
+
+    # Region above the grid
+    outside = [region[0], region[1], region[3] + 1.0, region[3] + 2.0]
+    assert index.query(outside, [fname]) == []
+
+
+def test_footprint_index_persistence():
+    fname = "./test_data/small_sample.nc"
+    index_fname = "./test_data/index_temp.json"
+
+    index = FootprintIndex(index_fname)
+    extent = index.extent(fname)
+    index.save()
+
+    reloaded_index = FootprintIndex(index_fname)
+    assert not reloaded_index.modified
+    assert reloaded_index.extent(fname) == extent
+    assert not reloaded_index.modified
+
+    os.remove(index_fname)
+
+
+def test_footprint_index_directory_hash():
+    pytest.importorskip("zarr")
+    zarr_fname = "./test_data/small_sample_index_temp.zarr"
+    xr_data, region, spacing = load_source("./test_data/small_sample.nc")
+
+    def write(values):
+        with ZarrGridWriter(zarr_fname, xr_data.x, xr_data.y, chunks=(64, 64)) as writer:
+            writer.write(values, {"x": slice(None), "y": slice(None)})
+
+    write(xr_data.values)
+    index = FootprintIndex()
+    assert index.extent(zarr_fname).region == region
+    content_hash = index.content_hash(zarr_fname)
+
+    write(xr_data.values + 1.0)
+    assert index.content_hash(zarr_fname) != content_hash
+
+    shutil.rmtree(zarr_fname)
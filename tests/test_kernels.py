@@ -0,0 +1,236 @@
+import pytest
+import tracemalloc
+import numpy as np
+import pandas as pd
+import xarray as xr
+from numpy.testing import assert_allclose
+from pygmt import blockmedian, grdfilter, grdtrack
+
+from pycascadia import kernels
+from pycascadia.remove_restore import nearneighbour
+from pycascadia.utility import xr_to_xyz
+
+
+def random_points(n, region, seed=0):
+    """Creates random points, half of them on a lattice so that many lie on block edges."""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(region[0], region[1], n)
+    y = rng.uniform(region[2], region[3], n)
+    x[: n // 2] = np.round(x[: n // 2] * 8) / 8
+    y[: n // 2] = np.round(y[: n // 2] * 8) / 8
+    return pd.DataFrame({"x": x, "y": y, "z": rng.normal(size=n)})
+
+
+def sort_points(points):
+    return points.sort_values(["x", "y"]).reset_index(drop=True)
+
+
+def test_blockmedian():
+    region = [0, 4, 1, 3]
+    spacing = 0.5
+    data_xyz = random_points(2000, [-0.5, 4.5, 0.5, 3.5])
+
+    gmt_bmd = blockmedian(data_xyz, spacing=spacing, region=region)
+    native_bmd = kernels.blockmedian(data_xyz, spacing=spacing, region=region)
+
+    assert len(native_bmd) == len(gmt_bmd)
+    assert_allclose(sort_points(native_bmd), sort_points(gmt_bmd), rtol=1e-10)
+
+
+@pytest.mark.parametrize(
+    "ratio, region, aligned",
+    [
+        (1, [0.3, 2.7, 1.2, 3.0], True),
+        (3, [0.5, 3.5, 1.2, 3.0], True),
+        (3, [-1.0, 2.3, 0.7, 3.7], True),
+        (5, [0.2, 4.2, 1.0, 3.0], True),
+        (2, [0.5, 3.5, 1.2, 3.0], False),  # Even number of nodes per block
+        (3, [0.5, 3.6, 1.2, 3.0], False),  # Region is not a whole number of blocks
+        (3, [0.55, 3.55, 1.2, 3.0], False),  # Blocks are not centred on nodes
+    ],
+)
+def test_blockmedian_grid(ratio, region, aligned):
+    grid_spacing = 0.1
+    x = np.round(np.arange(0, 4.001, grid_spacing), 10)
+    y = np.round(np.arange(0.6, 3.6, grid_spacing), 10)
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=(len(y), len(x))).astype(np.float32)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[rng.random(values.shape) < 0.05] = -9999
+    grid = xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+
+    grid_bmd = kernels.blockmedian_grid(
+        grid, grid_spacing, ratio * grid_spacing, region, nodatavals=[-9999]
+    )
+    if not aligned:
+        assert grid_bmd is None
+        return
+
+    points_bmd = kernels.blockmedian(
+        xr_to_xyz(grid, [-9999]), ratio * grid_spacing, region
+    )
+    assert_allclose(grid_bmd, points_bmd)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 200, 2 ** 20])
+def test_blockmedian_grid_strips(chunk_size, monkeypatch):
+    grid_spacing = 0.1
+    x = np.round(np.arange(0, 4.001, grid_spacing), 10)
+    y = np.round(np.arange(0.6, 3.6, grid_spacing), 10)
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=(len(y), len(x))).astype(np.float32)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    grid = xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+    region = [-1.0, 2.3, 0.7, 3.7]
+
+    # Strips of one or more rows of blocks, or the whole grid at once
+    monkeypatch.setattr(kernels, "BLOCKMEDIAN_CHUNK_SIZE", chunk_size)
+    grid_bmd = kernels.blockmedian_grid(grid, grid_spacing, 3 * grid_spacing, region)
+
+    points_bmd = kernels.blockmedian(xr_to_xyz(grid, []), 3 * grid_spacing, region)
+    assert_allclose(grid_bmd, points_bmd)
+
+
+def test_blockmedian_grid_peak_memory(monkeypatch):
+    grid_spacing = 0.1
+    x = np.arange(700) * grid_spacing
+    y = np.arange(700) * grid_spacing
+    values = np.random.default_rng(4).normal(size=(700, 700)).astype(np.float32)
+    grid = xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+    # 100 x 100 blocks of 7 x 7 nodes
+    region = [x[3], x[696], y[3], y[696]]
+
+    monkeypatch.setattr(kernels, "BLOCKMEDIAN_CHUNK_SIZE", 2 ** 12)
+    tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        bmd = kernels.blockmedian_grid(grid, grid_spacing, 7 * grid_spacing, region)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Only a strip of the grid is padded into blocks at once, rather than the whole grid
+    assert len(bmd) == 100 ** 2
+    assert peak < values.nbytes
+
+
+def test_grdtrack():
+    x = np.linspace(0, 4, 9)
+    y = np.linspace(1, 3, 5)
+    values = np.random.default_rng(1).normal(size=(len(y), len(x))).astype(np.float32)
+    values[2, 3] = np.nan
+    grid = xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+    points = random_points(200, [0, 4, 1, 3])[["x", "y"]]
+
+    gmt_pts = grdtrack(points, grid, "base_z", interpolation="l")
+    native_pts = kernels.grdtrack(points, grid, "base_z")
+
+    assert_allclose(native_pts.base_z, gmt_pts.base_z, rtol=1e-6, atol=1e-6)
+
+
+def test_nearneighbour():
+    region = [0, 4, 1, 3]
+    spacing = 0.25
+    radius = 0.5
+    NODATA_VAL = 9999
+    data_xyz = random_points(300, [-0.5, 4.5, 0.5, 3.5])
+
+    gmt_grid = nearneighbour(
+        data_xyz, region=region, spacing=spacing, S=radius, N=4, E=NODATA_VAL
+    )
+    native_grid = kernels.nearneighbour(
+        data_xyz, region=region, spacing=spacing, radius=radius, nodata=NODATA_VAL
+    )
+
+    assert native_grid.shape == gmt_grid.shape
+    assert_allclose(native_grid.x, gmt_grid.x)
+    assert_allclose(native_grid.y, gmt_grid.y)
+    assert_allclose(native_grid, gmt_grid, rtol=1e-5, atol=1e-5)
+
+
+def test_lattice():
+    # Spacing is adjusted to fit the region, as GMT does without +e. The width is an exact
+    # tie of 10.5 spacings, which GMT rounds to 12 nodes
+    nx, ny, dx, dy = kernels.lattice([0, 1.05, 0, 2], 0.1)
+    assert (nx, ny) == (12, 21)
+    assert dx == 1.05 / 11
+    assert dy == 0.1
+
+
+def create_interpolation_grid(diff_grid, nodata_val, window_width):
+    """Creates the grid by which GMT's grdfilter tapers the edge of a difference grid.
+
+    The grid is 1.0 where there is data and 0.0 where there is none, smoothed by a boxcar
+    filter, and rescaled to keep only the side of the window inside the data.
+    """
+    nodata_grid = (diff_grid != nodata_val).astype(diff_grid.dtype)
+    interp_grid = grdfilter(nodata_grid, filter=f"b{2*window_width}", distance=0)
+    values = interp_grid.values
+    values -= 0.5
+    values *= 2.0
+    values[~(values > 0.0)] = 0.0
+    return interp_grid
+
+
+@pytest.mark.parametrize("window_width", [0.3, 0.75, 1.2])
+def test_taper(window_width):
+    NODATA_VAL = 9999
+    spacing = 0.1
+    x = np.arange(0, 6.001, spacing)
+    y = np.arange(1, 5.001, spacing)
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=(len(y), len(x))).astype(np.float32)
+    values[:, :10] = NODATA_VAL
+    values[25:, 30:] = NODATA_VAL
+    values[rng.random(values.shape) < 0.01] = NODATA_VAL
+    diff_grid = xr.DataArray(values, coords={"y": y, "x": x}, dims=("y", "x"), name="z")
+
+    interp_grid = create_interpolation_grid(diff_grid, NODATA_VAL, window_width)
+    gmt_values = diff_grid.where(diff_grid != NODATA_VAL, 0.0).values * interp_grid.values
+
+    native_values = values.copy()
+    kernels.taper(native_values, NODATA_VAL, window_width, spacing, spacing)
+
+    assert_allclose(native_values, gmt_values, rtol=1e-5, atol=1e-5)
+
+
+def reference_taper(values, nodata, radius, dx, dy):
+    """Tapers a grid by counting the data within the window of every node directly."""
+    data = values != nodata
+    ny, nx = values.shape
+    n_data = np.zeros((ny, nx))
+    n_nodes = np.zeros((ny, nx))
+    n_rows = int(radius / dy) + 1
+    n_cols = int(radius / dx) + 1
+    padded = np.pad(data, ((n_rows, n_rows), (n_cols, n_cols)))
+    inside = np.pad(np.ones((ny, nx)), ((n_rows, n_rows), (n_cols, n_cols)))
+    for i in range(-n_rows, n_rows + 1):
+        for j in range(-n_cols, n_cols + 1):
+            if np.hypot(i * dy, j * dx) <= radius:
+                window = (
+                    slice(n_rows + i, n_rows + i + ny),
+                    slice(n_cols + j, n_cols + j + nx),
+                )
+                n_data += padded[window]
+                n_nodes += inside[window]
+    weights = np.maximum((n_data / n_nodes - 0.5) * 2.0, 0.0)
+    return np.where(data, values * weights, 0.0)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 2 ** 20])
+def test_taper_strips(chunk_size, monkeypatch):
+    NODATA_VAL = 9999
+    spacing = 0.1
+    window_width = 0.45
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=(40, 23)).astype(np.float32)
+    # Nodata in a few rows only, so most strips lie outside the band which is tapered
+    values[3, 5:9] = NODATA_VAL
+    values[20:22, :4] = NODATA_VAL
+    values[39, 22] = NODATA_VAL
+    expected = reference_taper(values, NODATA_VAL, window_width, spacing, spacing)
+
+    monkeypatch.setattr(kernels, "TAPER_CHUNK_SIZE", chunk_size)
+    kernels.taper(values, NODATA_VAL, window_width, spacing, spacing)
+
+    assert_allclose(values, expected, rtol=1e-5, atol=1e-6)
@@ -1,7 +1,15 @@
 import pytest
-from xarray.testing import assert_equal, assert_allclose
+import os
+import shutil
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from xarray.testing import assert_allclose
 
-from pycascadia.loaders import load_source
+from pycascadia.loaders import load_source, load_geotiff_window
+from pycascadia.utility import region_to_slices
+from pycascadia.writers import ZarrGridWriter
 
 
 def test_loader_equivalence():
@@ -9,3 +17,147 @@ def test_loader_equivalence():
     xr_netcdf, _, _ = load_source("./test_data/small_sample.nc")
 
     assert_allclose(xr_geotiff, xr_netcdf)
+
+
+@pytest.mark.parametrize(
+    "fname", ["./test_data/small_sample.nc", "./test_data/small_sample.tif"]
+)
+def test_lazy_loading(fname):
+    xr_eager, region_eager, spacing_eager = load_source(fname)
+    xr_lazy, region_lazy, spacing_lazy = load_source(fname, lazy=True)
+
+    assert region_lazy == region_eager
+    assert spacing_lazy == spacing_eager
+    assert_allclose(xr_lazy.astype("float32"), xr_eager)
+
+
+@pytest.mark.parametrize(
+    "fname", ["./test_data/small_sample.nc", "./test_data/small_sample.tif"]
+)
+def test_chunked_loading(fname):
+    pytest.importorskip("dask")
+
+    xr_eager, _, _ = load_source(fname)
+    xr_chunked, _, _ = load_source(fname, lazy=True, chunks={"x": 64, "y": 64})
+
+    assert xr_chunked.chunks is not None
+    assert xr_chunked.dtype == "float32"
+    assert_allclose(xr_chunked.compute(), xr_eager)
+
+
+def test_zarr_loading():
+    pytest.importorskip("zarr")
+    zarr_fname = "./test_data/small_sample_temp.zarr"
+
+    xr_netcdf, region, _ = load_source("./test_data/small_sample.nc")
+    with ZarrGridWriter(zarr_fname, xr_netcdf.x, xr_netcdf.y, chunks=(64, 64)) as writer:
+        writer.write(xr_netcdf.values, {"x": slice(None), "y": slice(None)})
+
+    xr_zarr, _, _ = load_source(zarr_fname)
+    assert_allclose(xr_zarr, xr_netcdf)
+
+    # Only the window within the region is read
+    subregion = [region[0], (region[0] + region[1]) / 2, region[2], region[3]]
+    xr_lazy, _, _ = load_source(zarr_fname, region=subregion, lazy=True)
+    assert_allclose(xr_lazy, xr_netcdf.isel(region_to_slices(xr_netcdf, subregion)))
+
+    shutil.rmtree(zarr_fname)
+
+
+def test_geotiff_window():
+    tif_fname = "./test_data/small_sample.tif"
+    xr_full, region, spacing = load_source(tif_fname)
+
+    window_region = [region[0] + 0.01, region[1] - 0.02, region[2] + 0.005, region[3]]
+    xr_window = load_geotiff_window(tif_fname, region=window_region, spacing=spacing)
+
+    # Without overviews, the window is read at full resolution
+    assert_allclose(xr_window, xr_full.isel(region_to_slices(xr_full, window_region)))
+
+
+def test_geotiff_overview():
+    tif_fname = "./test_data/small_sample.tif"
+    overview_fname = "./test_data/small_sample_overviews_temp.tif"
+    shutil.copy(tif_fname, overview_fname)
+    with rasterio.open(overview_fname, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.average)
+
+    _, region, spacing = load_source(tif_fname)
+
+    xr_overview, _, overview_spacing = load_source(
+        overview_fname, region=region, spacing=2.5 * spacing
+    )
+    os.remove(overview_fname)
+
+    # The coarsest overview which is finer than the requested spacing is read
+    assert overview_spacing == pytest.approx(2 * spacing)
+    assert xr_overview.shape == (100, 100)
+
+
+def test_geotiff_overview_edge():
+    tif_fname = "./test_data/small_sample.tif"
+    overview_fname = "./test_data/small_sample_overviews_edge_temp.tif"
+    # Cut an odd number of pixels, so that windows at the edge end part way through an
+    # overview pixel
+    with rasterio.open(tif_fname) as src:
+        window = Window(0, 0, src.width - 1, src.height - 1)
+        profile = src.profile
+        profile.update(
+            width=window.width,
+            height=window.height,
+            transform=src.window_transform(window),
+        )
+        with rasterio.open(overview_fname, "w", **profile) as dst:
+            dst.write(src.read(1, window=window), 1)
+    with rasterio.open(overview_fname, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.average)
+        xres, yres = dst.res
+        left, bottom, right, top = dst.bounds
+
+    # Windows clipped at the edge of the raster and within it
+    xr_edge = load_geotiff_window(
+        overview_fname,
+        region=[right - 7.5 * xres, right, bottom, bottom + 8.5 * yres],
+        spacing=2.5 * xres,
+    )
+    xr_inner = load_geotiff_window(
+        overview_fname,
+        region=[left + 20 * xres, left + 40 * xres, bottom + 20 * yres, bottom + 40 * yres],
+        spacing=2.5 * xres,
+    )
+    os.remove(overview_fname)
+
+    # Both are read from the overview, at its spacing
+    for xr_window in [xr_edge, xr_inner]:
+        np.testing.assert_allclose(np.diff(xr_window.x), 2 * xres)
+        np.testing.assert_allclose(np.diff(xr_window.y), 2 * yres)
+    assert xr_edge.x.values.max() < right
+
+
+@pytest.mark.parametrize("factor", [2, 4])
+def test_geotiff_overview_lattice(factor):
+    tif_fname = "./test_data/small_sample.tif"
+    overview_fname = "./test_data/small_sample_overviews_lattice_temp.tif"
+    shutil.copy(tif_fname, overview_fname)
+    with rasterio.open(overview_fname, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.average)
+        xres, yres = dst.res
+        left, bottom, right, top = dst.bounds
+
+    # Windows within the raster, and narrower than an overview pixel at its edge
+    regions = [
+        [left + 21 * xres, left + 43 * xres, bottom + 17 * yres, bottom + 38 * yres],
+        [right - 0.5 * xres, right, top - 0.5 * yres, top],
+    ]
+    xr_full = load_geotiff_window(tif_fname)
+    for region in regions:
+        xr_overview = load_geotiff_window(
+            overview_fname, region=region, spacing=(factor + 0.5) * xres
+        )
+
+        # Overview nodes lie on the nodes of the full resolution grid
+        for dim, res in [("x", xres), ("y", yres)]:
+            full = xr_full[dim].values
+            nearest = np.abs(xr_overview[dim].values[:, np.newaxis] - full).min(axis=1)
+            assert nearest.max() < 1e-6 * res
+    os.remove(overview_fname)
@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import xarray as xr
+from numpy.testing import assert_allclose
+
+from pycascadia.grid import Grid
+from pycascadia.merge import WeightedMerge
+
+
+def make_grid(values, x0=0.0, y0=0.0):
+    values = np.asarray(values, dtype="float32")
+    ny, nx = values.shape
+    return xr.DataArray(
+        values,
+        coords={"y": y0 + np.arange(ny), "x": x0 + np.arange(nx)},
+        dims=("y", "x"),
+        name="z",
+    )
+
+
+def test_weighted_merge():
+    base_grid = Grid.from_dataarray(make_grid(np.zeros((4, 6))))
+    merge = WeightedMerge(base_grid)
+
+    # Two update grids overlapping in columns 2 and 3, the first tapered in column 3
+    merge.add(
+        make_grid(np.full((4, 4), 2.0) * [1.0, 1.0, 1.0, 0.5]),
+        make_grid(np.ones((4, 4)) * [1.0, 1.0, 1.0, 0.5]),
+        weight=1.0,
+    )
+    merge.add(
+        make_grid(np.full((4, 4), 5.0), x0=2.0),
+        make_grid(np.ones((4, 4)), x0=2.0),
+        weight=2.0,
+    )
+
+    merge.apply()
+
+    # Each update grid alone, the weighted average where both cover the nodes fully,
+    # and the untapered differences averaged by coverage where one is tapered
+    expected = [2.0, 2.0, (2.0 + 2 * 5.0) / 3, (0.5 * 2.0 + 2 * 5.0) / 2.5, 5.0, 5.0]
+    assert_allclose(base_grid.grid.values, np.tile(expected, (4, 1)), rtol=1e-6)
+
+
+def test_weighted_merge_order():
+    rng = np.random.default_rng(0)
+    grids = []
+    for i in range(3):
+        coverage = rng.random((5, 5)).astype("float32")
+        diff = coverage * rng.normal(size=(5, 5))
+        grids.append(
+            (make_grid(diff, x0=i, y0=i), make_grid(coverage, x0=i, y0=i), i + 1.0)
+        )
+
+    results = []
+    for order in [grids, grids[::-1]]:
+        base_grid = Grid.from_dataarray(make_grid(np.zeros((8, 8))))
+        merge = WeightedMerge(base_grid)
+        for diff_grid, coverage, weight in order:
+            merge.add(diff_grid, coverage, weight)
+        merge.apply()
+        results.append(base_grid.grid.values)
+
+    assert_allclose(results[0], results[1], atol=1e-6)
+
+
+def test_weighted_merge_weight():
+    base_grid = Grid.from_dataarray(make_grid(np.zeros((4, 4))))
+    grid = make_grid(np.ones((4, 4)))
+    with pytest.raises(ValueError):
+        WeightedMerge(base_grid).add(grid, grid, weight=0.0)
@@ -0,0 +1,68 @@
+import pytest
+
+import numpy as np
+import xarray as xr
+from pycascadia.nodata import (
+    nodata_values,
+    nodata_mask,
+    valid_data_mask,
+    all_values_are_nodata,
+)
+
+
+def test_nodata_values():
+    grid = xr.DataArray(np.zeros((2, 2)), dims=("y", "x"))
+    assert nodata_values(grid) == []
+
+    # GeoTiffs record a value per band, which may be missing
+    grid.attrs["nodatavals"] = (-9999.0, None)
+    grid.attrs["_FillValue"] = np.float32(-9999.0)
+    grid.attrs["missing_value"] = np.nan
+    assert nodata_values(grid) == [-9999.0]
+
+    grid.attrs["missing_value"] = 7777
+    assert nodata_values(grid) == [-9999.0, 7777.0]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64", "int16"])
+def test_nodata_mask(dtype):
+    values = np.array([[1, 7777, 2], [9999, 3, 4]], dtype=dtype)
+    expected = np.array([[False, True, False], [True, False, False]])
+
+    np.testing.assert_array_equal(nodata_mask(values, [7777, 9999]), expected)
+    np.testing.assert_array_equal(nodata_mask(values, 9999), expected & (values == 9999))
+    np.testing.assert_array_equal(valid_data_mask(values, [7777, 9999]), ~expected)
+
+    if dtype != "int16":
+        values[0, 0] = np.nan
+        expected[0, 0] = True
+        np.testing.assert_array_equal(nodata_mask(values, [7777, 9999, np.nan]), expected)
+
+
+@pytest.mark.parametrize("chunk_cells", [1, 7, 10 ** 6])
+def test_all_values_are_nodata_chunked(chunk_cells):
+    values = np.full((13, 11), -9999.0)
+    values[5, 7] = np.nan
+    grid = xr.DataArray(values, dims=("y", "x"), attrs={"_FillValue": -9999.0})
+    assert all_values_are_nodata(grid, chunk_cells=chunk_cells)
+
+    # Nodata values given explicitly take the place of those in the attributes
+    assert not all_values_are_nodata(grid, nodatavals=[0.0], chunk_cells=chunk_cells)
+
+    values[12, 10] = 1.0
+    assert not all_values_are_nodata(grid, chunk_cells=chunk_cells)
+
+
+def test_all_values_are_nodata_stops_early():
+    da = pytest.importorskip("dask.array")
+
+    def fail(block):
+        raise AssertionError("Read beyond the first rows containing data")
+
+    # Lazy grid whose rows after the first 10 cannot be read
+    first = np.full((10, 10), np.nan)
+    first[0, 0] = 1.0
+    rest = da.zeros((90, 10), chunks=(10, 10)).map_blocks(fail, dtype=float)
+    grid = xr.DataArray(da.concatenate([da.from_array(first), rest]), dims=("y", "x"))
+
+    assert not all_values_are_nodata(grid, chunk_cells=100)
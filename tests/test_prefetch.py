@@ -0,0 +1,74 @@
+import pytest
+import threading
+import time
+
+from pycascadia.prefetch import Prefetcher
+
+
+class Loader:
+    """Records how many files are held at once, i.e. loaded but not yet released."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = []
+
+    def __call__(self, fname):
+        with self.lock:
+            self.loaded.append(fname)
+        time.sleep(0.01)
+        return fname.upper()
+
+
+def test_prefetch_order():
+    fnames = [f"grid_{i}.nc" for i in range(10)]
+    with Prefetcher(fnames, Loader(), depth=3) as prefetcher:
+        results = list(prefetcher)
+
+    assert results == [(fname, fname.upper()) for fname in fnames]
+
+
+@pytest.mark.parametrize(
+    "depth, memory_budget, max_ahead",
+    [
+        (1, None, 1),
+        (3, None, 3),
+        (3, 250, 1),  # Only one file of 100 bytes fits beside the one in use
+        (3, 50, 0),  # Files larger than the budget are only loaded once nothing is held
+    ],
+)
+def test_prefetch_bounds(depth, memory_budget, max_ahead):
+    fnames = [f"grid_{i}.nc" for i in range(8)]
+    loader = Loader()
+
+    with Prefetcher(
+        fnames, loader, depth=depth, memory_budget=memory_budget, sizes=[100] * 8
+    ) as prefetcher:
+        for i, (fname, _) in enumerate(prefetcher):
+            # Give the background thread time to load as far ahead as it may
+            time.sleep(0.05)
+            with loader.lock:
+                assert len(loader.loaded) - (i + 1) == min(max_ahead, len(fnames) - i - 1)
+
+
+def test_prefetch_error():
+    def load(fname):
+        if fname == "bad.nc":
+            raise RuntimeError("Error: filetype not recognised.")
+        return fname
+
+    with Prefetcher(["good.nc", "bad.nc", "other.nc"], load, depth=2) as prefetcher:
+        results = iter(prefetcher)
+        assert next(results) == ("good.nc", "good.nc")
+        with pytest.raises(RuntimeError):
+            next(results)
+
+
+def test_prefetch_close_early():
+    fnames = [f"grid_{i}.nc" for i in range(100)]
+    loader = Loader()
+    with Prefetcher(fnames, loader, depth=2) as prefetcher:
+        for fname, _ in prefetcher:
+            break
+
+    assert not prefetcher.thread.is_alive()
+    assert len(loader.loaded) <= 4
@@ -0,0 +1,62 @@
+import os
+import csv
+import json
+
+import numpy as np
+
+from pycascadia.profiling import Profiler
+
+
+def test_profiler_stages():
+    profiler = Profiler()
+    profiler.source = "source.nc"
+    with profiler.stage("allocate", cells=10 ** 6) as record:
+        values = np.ones(10 ** 6)
+        record["points"] = int(values.sum())
+    del values
+
+    assert len(profiler.records) == 1
+    record = profiler.records[0]
+    assert record["source"] == "source.nc"
+    assert record["stage"] == "allocate"
+    assert record["cells"] == 10 ** 6
+    assert record["points"] == 10 ** 6
+    assert record["wall_time"] >= 0.0
+    assert record["cpu_time"] >= 0.0
+    # Allocation of the array is traced
+    assert record["peak_memory"] >= 8 * 10 ** 6
+
+
+def test_disabled_profiler():
+    profiler = Profiler(enabled=False)
+    with profiler.stage("allocate", cells=1) as record:
+        record["points"] = 1
+    profiler.extend([{"source": None, "stage": "other", "wall_time": 0.0}])
+
+    assert profiler.records == []
+
+
+def test_profiler_save():
+    profiler = Profiler()
+    for source in ["a.nc", "b.nc"]:
+        profiler.source = source
+        with profiler.stage("load"):
+            pass
+        with profiler.stage("to_xyz") as record:
+            record["points"] = 5
+    profiler.summary()
+
+    json_fname = "./test_data/profile_temp.json"
+    profiler.save(json_fname)
+    with open(json_fname) as fp:
+        assert json.load(fp) == profiler.records
+    os.remove(json_fname)
+
+    csv_fname = "./test_data/profile_temp.csv"
+    profiler.save(csv_fname)
+    with open(csv_fname, newline="") as fp:
+        rows = list(csv.DictReader(fp))
+    os.remove(csv_fname)
+    assert [row["stage"] for row in rows] == ["load", "to_xyz"] * 2
+    assert rows[1]["points"] == "5"
+    assert rows[0]["points"] == ""
@@ -0,0 +1,91 @@
+import pytest
+import os
+import shutil
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pycascadia.grid import Grid
+from pycascadia.loaders import overview_groups, select_overview
+from pycascadia.pyramid import Downsampler, build_pyramid, pyramid_depth
+
+
+def reference_downsample(values):
+    """Downsamples a whole grid at once, with the 1-2-1 filter of Downsampler."""
+    valid = ~np.isnan(values)
+    sums = np.pad(np.where(valid, values, 0.0), 1)
+    weights = np.pad(valid.astype(float), 1)
+    kernel = np.outer([1.0, 2.0, 1.0], [1.0, 2.0, 1.0])
+    ny, nx = values.shape
+    out = np.full(((ny - 1) // 2 + 1, (nx - 1) // 2 + 1), np.nan)
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            window = (slice(2 * j, 2 * j + 3), slice(2 * i, 2 * i + 3))
+            weight = (kernel * weights[window]).sum()
+            if weight > 0:
+                out[j, i] = (kernel * sums[window]).sum() / weight
+    return out
+
+
+@pytest.mark.parametrize("shape", [(17, 23), (16, 22), (1, 5), (3, 1)])
+@pytest.mark.parametrize("strip_rows", [1, 2, 5, 100])
+def test_downsampler(shape, strip_rows):
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=shape).astype("float32")
+    values[rng.random(shape) < 0.3] = np.nan
+    values[:, : shape[1] // 3] = np.nan
+
+    downsampler = Downsampler(shape[1], shape[0])
+    strips = [
+        downsampler.push(values[start : start + strip_rows])
+        for start in range(0, shape[0], strip_rows)
+    ]
+    downsampled = np.concatenate(strips)
+
+    assert downsampled.shape == downsampler.shape
+    assert_allclose(downsampled, reference_downsample(values), rtol=1e-6)
+
+
+def test_pyramid_depth():
+    assert pyramid_depth(1025, 513, min_size=128) == 2
+    assert pyramid_depth(1025, 513, min_size=129) == 2
+    assert pyramid_depth(1025, 513, min_size=130) == 1
+    assert pyramid_depth(100, 100, min_size=256) == 0
+
+
+@pytest.mark.parametrize("ext", ["nc", "zarr"])
+def test_build_pyramid(ext):
+    if ext == "zarr":
+        pytest.importorskip("zarr")
+    base_fname = "./test_data/small_sample.nc"
+    fname = f"./test_data/small_sample_pyramid_temp.{ext}"
+    grid = Grid(base_fname)
+
+    # Strips of a few rows, so each level is written in many parts
+    levels = build_pyramid(grid, fname, levels=3, tile_size=32, chunks=(16, 16))
+    assert levels == 3
+    assert overview_groups(fname) == ["overview_1", "overview_2", "overview_3"]
+
+    # The grid itself is at the root of the file
+    root = Grid(fname)
+    assert_array_equal(root.grid.values, grid.grid.values)
+
+    # Each overview is downsampled from the one before
+    expected = grid.grid.transpose("y", "x").values.astype("float32")
+    for level in range(1, levels + 1):
+        expected = reference_downsample(expected)
+        spacing = grid.spacing * 2 ** level
+        assert select_overview(fname, spacing * 1.5) == f"overview_{level}"
+
+        overview = Grid(fname, spacing=spacing * 1.5)
+        assert overview.spacing == pytest.approx(spacing)
+        assert_array_equal(overview.grid.x, grid.grid.x[:: 2 ** level])
+        assert_allclose(overview.grid.values, expected, rtol=1e-5)
+
+    # Spacings finer than the first overview read the grid itself
+    assert select_overview(fname, grid.spacing * 1.5) is None
+    assert Grid(fname, spacing=grid.spacing).grid.shape == grid.grid.shape
+
+    if ext == "zarr":
+        shutil.rmtree(fname)
+    else:
+        os.remove(fname)
@@ -1,10 +1,34 @@
 import pytest
 import os
+import shutil
+import tracemalloc
+import numpy as np
 import pandas as pd
-from xarray.testing import assert_equal
+import rasterio
+from rasterio.enums import Resampling
+from xarray.testing import assert_equal, assert_allclose
 
-from pycascadia.remove_restore import nearneighbour
-from pycascadia.utility import region_to_str
+from pycascadia.grid import Grid
+from pycascadia import remove_restore
+from pycascadia.remove_restore import (
+    nearneighbour,
+    calc_diff_grid,
+    load_base_grid,
+    load_base_window,
+    remove_restore_tiled,
+    apply_diff_grids,
+    apply_diff_grids_parallel,
+    apply_diff_grid,
+    merge_diff_grids,
+    cached_diff_grid,
+    RemoveRestore,
+)
+from pycascadia import kernels, nodata
+from pycascadia.nodata import nodata_mask
+from pycascadia.cache import DiffCache
+from pycascadia.profiling import Profiler
+from pycascadia.tiling import BYTES_PER_CELL
+from pycascadia.utility import region_to_str, region_to_slices
 from pycascadia.loaders import load_source
 
 
@@ -45,3 +69,519 @@ def test_nearneighbour():
     os.remove(data_xyz_fname)
 
     assert_equal(manual_grid, clib_grid)
+
+
+def create_update_grid(base_fname, fname, region, shift, offset=0.0):
+    """Creates an update grid by cropping and shifting the base grid.
+
+    Its nodes are moved by `offset` in x and y, e.g. off the lattice of the base grid.
+    """
+    update_grid = Grid(base_fname)
+    update_grid.crop(region)
+    update_grid.grid += shift
+    if offset:
+        update_grid.grid = update_grid.grid.assign_coords(
+            x=update_grid.grid.x + offset, y=update_grid.grid.y + offset
+        )
+    update_grid.save_grid(fname)
+
+
+def overlapping_update_regions(base_fname):
+    """Regions of two overlapping update grids and one disjoint from both."""
+    x0, x1, y0, y1 = Grid(base_fname).region
+    xm = (x0 + x1) / 2
+    ym = (y0 + y1) / 2
+    return [
+        [x0, xm, y0, ym],
+        [x0 + 0.01, xm + 0.01, y0 + 0.01, ym + 0.01],
+        [xm + 0.02, x1, ym + 0.02, y1],
+    ]
+
+
+@pytest.fixture
+def update_fnames():
+    """Writes the update grids of overlapping_update_regions, shifted by 5, 10 and 15."""
+    base_fname = "./test_data/small_sample.nc"
+    fnames = []
+    for i, region in enumerate(overlapping_update_regions(base_fname)):
+        fnames.append(f"./test_data/small_sample_update_{i}_temp.nc")
+        create_update_grid(base_fname, fnames[-1], region, 5.0 * (i + 1))
+
+    yield fnames
+
+    for fname in fnames:
+        if os.path.exists(fname):
+            os.remove(fname)
+
+
+@pytest.mark.parametrize("output_ext, jobs", [("nc", 1), ("zarr", 2)])
+def test_remove_restore_tiled(output_ext, jobs):
+    if output_ext == "zarr":
+        pytest.importorskip("zarr")
+    base_fname = "./test_data/small_sample.nc"
+    update_fname = "./test_data/small_sample_update_temp.nc"
+    output_fname = f"./test_data/small_sample_tiled_temp.{output_ext}"
+    window_width = 0.002
+
+    # Create an update grid covering part of the base grid
+    x0, x1, y0, y1 = Grid(base_fname).region
+    create_update_grid(
+        base_fname, update_fname, [x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01], 10.0
+    )
+
+    # Apply remove-restore to the full grid
+    base_grid = load_base_grid(base_fname)
+    diff_grid = calc_diff_grid(
+        base_grid, Grid(update_fname, convert_to_xyz=True), window_width=window_width
+    )
+    apply_diff_grid(base_grid, diff_grid)
+
+    # Apply remove-restore tile by tile, with a budget allowing for ~60x60 node tiles
+    remove_restore_tiled(
+        base_fname,
+        [update_fname],
+        output_fname,
+        memory_budget=60 ** 2 * 64,
+        window_width=window_width,
+        jobs=jobs,
+        output_options={"chunks": (16, 16)},
+    )
+    tiled_grid, _, _ = load_source(output_fname)
+    os.remove(update_fname)
+    if output_ext == "zarr":
+        shutil.rmtree(output_fname)
+    else:
+        os.remove(output_fname)
+
+    assert_allclose(tiled_grid, base_grid.grid)
+
+
+def test_remove_restore_tiled_memory(monkeypatch):
+    base_fname = "./test_data/small_sample.nc"
+    output_fname = "./test_data/small_sample_tiled_memory_temp.nc"
+    window_width = 0.002
+    memory_budget = 60 ** 2 * BYTES_PER_CELL
+
+    # Overlapping update grids, with nodes off the lattice of the base grid as with surveys
+    spacing = Grid(base_fname).spacing
+    update_fnames = []
+    for i, region in enumerate(overlapping_update_regions(base_fname)):
+        update_fnames.append(f"./test_data/small_sample_update_{i}_temp.nc")
+        create_update_grid(
+            base_fname, update_fnames[-1], region, 5.0 * (i + 1), offset=spacing / 3
+        )
+
+    expected_grid = load_base_grid(base_fname)
+    apply_diff_grids(
+        expected_grid, update_fnames, window_width=window_width, backend="native"
+    )
+
+    # Record the size of every window of the base grid loaded
+    loaded_sizes = []
+
+    def recording_load_base_window(*args, **kwargs):
+        base_window = load_base_window(*args, **kwargs)
+        loaded_sizes.append(base_window.grid.size)
+        return base_window
+
+    monkeypatch.setattr(remove_restore, "load_base_window", recording_load_base_window)
+
+    # Tiles near the overlapping update grids are padded by both of their halos
+    remove_restore_tiled(
+        base_fname,
+        update_fnames,
+        output_fname,
+        memory_budget=memory_budget,
+        window_width=window_width,
+        backend="native",
+    )
+    tiled_grid, _, _ = load_source(output_fname)
+    os.remove(output_fname)
+    for fname in update_fnames:
+        os.remove(fname)
+
+    assert max(loaded_sizes) * BYTES_PER_CELL <= memory_budget
+    assert_allclose(tiled_grid, expected_grid.grid)
+
+
+def test_apply_diff_grids_parallel(update_fnames):
+    base_fname = "./test_data/small_sample.nc"
+
+    serial_grid = load_base_grid(base_fname)
+    for fname in update_fnames:
+        diff_grid = calc_diff_grid(serial_grid, Grid(fname, convert_to_xyz=True))
+        if diff_grid is not None:
+            apply_diff_grid(serial_grid, diff_grid)
+
+    parallel_grid = load_base_grid(base_fname)
+    apply_diff_grids_parallel(parallel_grid, update_fnames, jobs=2)
+
+    assert_allclose(parallel_grid.grid, serial_grid.grid)
+
+
+@pytest.mark.parametrize("prefetch, prefetch_memory", [(1, None), (2, None), (2, 1.0)])
+def test_apply_diff_grids_prefetch(update_fnames, prefetch, prefetch_memory):
+    base_fname = "./test_data/small_sample.nc"
+
+    serial_grid = load_base_grid(base_fname)
+    apply_diff_grids(serial_grid, update_fnames, backend="native")
+
+    # A budget of 1 byte only loads an update grid once the previous one is released
+    prefetched_grid = load_base_grid(base_fname)
+    apply_diff_grids(
+        prefetched_grid,
+        update_fnames,
+        backend="native",
+        prefetch=prefetch,
+        prefetch_memory=prefetch_memory,
+    )
+
+    assert_equal(prefetched_grid.grid, serial_grid.grid)
+
+
+def test_apply_diff_grids_prefetch_profiler(update_fnames):
+    # Memory of stages overlapping the prefetch thread cannot be attributed to them
+    base_grid = load_base_grid("./test_data/small_sample.nc")
+    with pytest.raises(ValueError, match="prefetched"):
+        apply_diff_grids(base_grid, update_fnames, profiler=Profiler(), prefetch=1)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_merge_diff_grids(update_fnames, jobs):
+    base_fname = "./test_data/small_sample.nc"
+    x0, x1, y0, y1 = Grid(base_fname).region
+    xm = (x0 + x1) / 2
+    ym = (y0 + y1) / 2
+    window_width = 0.002
+
+    # A single update grid changes the base grid as when applied sequentially
+    serial_grid = load_base_grid(base_fname)
+    apply_diff_grids(
+        serial_grid, update_fnames[2:], window_width=window_width, backend="native"
+    )
+    merged_grid = load_base_grid(base_fname)
+    merge_diff_grids(
+        merged_grid, update_fnames[2:], window_width=window_width, backend="native"
+    )
+    assert_equal(merged_grid.grid, serial_grid.grid)
+
+    # Merging does not depend on the order of update grids
+    weights = [1.0, 2.0, 1.0]
+    merged_grids = []
+    for order in [[0, 1, 2], [2, 1, 0]]:
+        merged_grids.append(load_base_grid(base_fname))
+        merge_diff_grids(
+            merged_grids[-1],
+            [update_fnames[i] for i in order],
+            weights=[weights[i] for i in order],
+            jobs=jobs,
+            window_width=window_width,
+            backend="native",
+        )
+
+    assert_allclose(merged_grids[0].grid, merged_grids[1].grid, atol=1e-4)
+
+    # Where the first two overlap, away from their edges, differences are averaged by weight
+    base_grid = load_base_grid(base_fname)
+    overlap = [x0 + 0.013, xm - 0.003, y0 + 0.013, ym - 0.003]
+    window = region_to_slices(base_grid.grid, overlap)
+    diff = merged_grids[0].grid[window] - base_grid.grid[window]
+    assert float(abs(diff - (5.0 + 2 * 10.0) / 3).max()) < 1e-3
+
+
+def test_load_base_grid_overviews():
+    tif_fname = "./test_data/small_sample.tif"
+    overview_fname = "./test_data/small_sample_overviews_temp.tif"
+    shutil.copy(tif_fname, overview_fname)
+    with rasterio.open(overview_fname, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.average)
+
+    x0, x1, y0, y1 = Grid(tif_fname).region
+    spacing = Grid(tif_fname).spacing
+    region = [x0 + 0.0101, x1 - 0.0203, y0 + 0.0052, y1 - 0.0071]
+
+    # The overview read has a coarser lattice, but is resampled onto the same output lattice
+    full_grid = load_base_grid(tif_fname, region=region, spacing=2.5 * spacing)
+    overview_grid = load_base_grid(overview_fname, region=region, spacing=2.5 * spacing)
+    os.remove(overview_fname)
+
+    assert overview_grid.grid.shape == full_grid.grid.shape
+    np.testing.assert_allclose(overview_grid.grid.x, full_grid.grid.x)
+    np.testing.assert_allclose(overview_grid.grid.y, full_grid.grid.y)
+
+
+def test_calc_diff_grid_footprint():
+    base_fname = "./test_data/small_sample.nc"
+    update_fname = "./test_data/small_sample_update_temp.nc"
+    window_width = 0.002
+
+    x0, x1, y0, y1 = Grid(base_fname).region
+    create_update_grid(
+        base_fname, update_fname, [x0 + 0.01, x0 + 0.02, y0 + 0.01, y0 + 0.02], 10.0
+    )
+    update_grid = Grid(update_fname, convert_to_xyz=True)
+    os.remove(update_fname)
+
+    full_grid = load_base_grid(base_fname)
+    full_diff_grid = calc_diff_grid(
+        full_grid, update_grid, window_width=window_width, region=full_grid.region
+    )
+    apply_diff_grid(full_grid, full_diff_grid)
+
+    cropped_grid = load_base_grid(base_fname)
+    cropped_diff_grid = calc_diff_grid(
+        cropped_grid, update_grid, window_width=window_width
+    )
+    apply_diff_grid(cropped_grid, cropped_diff_grid)
+
+    # Difference grid only covers the update grid and its surroundings
+    assert cropped_diff_grid.size < full_diff_grid.size / 4
+    assert_allclose(cropped_grid.grid, full_grid.grid)
+
+
+@pytest.mark.parametrize("window_width", [None, 0.002])
+def test_calc_diff_grid_backends(window_width):
+    base_fname = "./test_data/small_sample.nc"
+    update_fname = "./test_data/small_sample_update_temp.nc"
+
+    # Update grid at a finer spacing than the base grid, so that blocks hold several points
+    x0, x1, y0, y1 = Grid(base_fname).region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01])
+    update_grid.resample(update_grid.spacing / 3)
+    update_grid.grid += 10.0
+    update_grid.save_grid(update_fname)
+    update_grid = Grid(update_fname, convert_to_xyz=True)
+    os.remove(update_fname)
+
+    base_grid = load_base_grid(base_fname)
+    gmt_diff_grid = calc_diff_grid(
+        base_grid, update_grid, window_width=window_width, backend="gmt"
+    )
+    native_diff_grid = calc_diff_grid(
+        base_grid, update_grid, window_width=window_width, backend="native"
+    )
+
+    assert native_diff_grid.shape == gmt_diff_grid.shape
+    assert_allclose(
+        native_diff_grid, gmt_diff_grid.assign_coords(native_diff_grid.coords), atol=1e-4
+    )
+
+
+@pytest.mark.parametrize("backend", ["gmt", "native"])
+@pytest.mark.parametrize("ratio", [1, 3])
+def test_calc_diff_grid_fast_path(ratio, backend):
+    base_fname = "./test_data/small_sample.nc"
+    update_fname = "./test_data/small_sample_update_temp.nc"
+    window_width = 0.002
+
+    # Update grid aligned with the base grid, at the same or a three times finer spacing
+    x0, x1, y0, y1 = Grid(base_fname).region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01])
+    if ratio > 1:
+        spacing = update_grid.spacing
+        update_grid.resample(spacing / ratio)
+        # Crop to a whole number of base grid nodes, so blocks are centred on update grid nodes
+        ux0, ux1, uy0, uy1 = update_grid.region
+        nx = int((ux1 - ux0) / spacing)
+        ny = int((uy1 - uy0) / spacing)
+        update_grid.crop([ux0, ux0 + nx * spacing, uy0, uy0 + ny * spacing])
+    update_grid.grid += 10.0
+    update_grid.save_grid(update_fname)
+    update_grid = Grid(update_fname)
+    os.remove(update_fname)
+
+    base_grid = load_base_grid(base_fname)
+    point_diff_grid = calc_diff_grid(
+        base_grid,
+        update_grid,
+        window_width=window_width,
+        backend=backend,
+        fast_path=False,
+    )
+    # The update grid is only converted to points when the fast path is not taken
+    assert update_grid.xyz is not None
+    update_grid.xyz = None
+    fast_diff_grid = calc_diff_grid(
+        base_grid, update_grid, window_width=window_width, backend=backend
+    )
+    assert update_grid.xyz is None
+
+    assert_allclose(fast_diff_grid, point_diff_grid)
+
+
+def test_calc_diff_grid_threshold():
+    base_fname = "./test_data/small_sample.nc"
+
+    x0, x1, y0, y1 = Grid(base_fname).region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01])
+    update_grid.grid += 10.0
+
+    base_grid = load_base_grid(base_fname)
+    diff_grid = calc_diff_grid(base_grid, update_grid, backend="native")
+    assert float(diff_grid.max()) == pytest.approx(10.0)
+
+    # Differences below the threshold are not applied
+    assert_equal(
+        calc_diff_grid(base_grid, update_grid, diff_threshold=5.0, backend="native"),
+        diff_grid,
+    )
+    filtered_diff_grid = calc_diff_grid(
+        base_grid, update_grid, diff_threshold=20.0, backend="native"
+    )
+    assert not filtered_diff_grid.values.any()
+
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_calc_diff_grid_nodata_mask(fast_path, monkeypatch):
+    base_fname = "./test_data/small_sample.nc"
+
+    x0, x1, y0, y1 = Grid(base_fname).region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01])
+    update_grid.grid += 10.0
+    update_grid.grid[:5] = np.nan
+    base_grid = load_base_grid(base_fname)
+
+    # Record the size of every array whose nodata is found
+    masked_sizes = []
+
+    def recording_nodata_mask(values, nodatavals=None):
+        masked_sizes.append(np.size(values))
+        return nodata_mask(values, nodatavals)
+
+    monkeypatch.setattr(nodata, "nodata_mask", recording_nodata_mask)
+    diff_grid = calc_diff_grid(
+        base_grid, update_grid, backend="native", fast_path=fast_path
+    )
+
+    # The update grid's nodata is found once, and shared by all the stages which need it
+    assert sorted(masked_sizes) == sorted([update_grid.grid.size, diff_grid.size])
+
+
+@pytest.mark.parametrize("window_width", [None, 0.002])
+def test_calc_diff_grid_peak_memory(window_width, monkeypatch):
+    base_fname = "./test_data/small_sample.nc"
+    # Bytes allocated at once per node of the difference grid, including the block medians
+    # and tracked points, of which there are about as many as nodes
+    max_bytes_per_cell = 170
+
+    # Keep the fixed-size scratch space of nearneighbour small compared to the grids
+    monkeypatch.setattr(kernels, "NEARNEIGHBOUR_CHUNK_SIZE", 2 ** 12)
+
+    x0, x1, y0, y1 = Grid(base_fname).region
+    update_grid = Grid(base_fname)
+    update_grid.crop([x0 + 0.01, x1 - 0.02, y0 + 0.015, y1 - 0.01])
+    update_grid.grid += 10.0
+    update_grid.xyz = update_grid.as_xyz()
+    base_grid = load_base_grid(base_fname)
+
+    # Restart tracing, which a profiler may have left running, so only this call is counted
+    tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        diff_grid = calc_diff_grid(
+            base_grid,
+            update_grid,
+            window_width=window_width,
+            backend="native",
+            fast_path=False,
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert diff_grid.dtype == np.float32
+    assert peak / diff_grid.size < max_bytes_per_cell
+
+
+def test_remove_restore_pipeline(update_fnames, capsys):
+    base_fname = "./test_data/small_sample.nc"
+    window_width = 0.002
+    x0, x1, y0, y1 = Grid(base_fname).region
+    xm = (x0 + x1) / 2
+    ym = (y0 + y1) / 2
+
+    # The two overlapping update grids
+    update_fnames = update_fnames[:2]
+    update_grids = [Grid(fname) for fname in update_fnames]
+
+    expected_grid = load_base_grid(base_fname)
+    apply_diff_grids(
+        expected_grid, update_fnames, window_width=window_width, backend="native"
+    )
+
+    base_grid = Grid(base_fname)
+    initial_values = base_grid.grid.values.copy()
+    capsys.readouterr()
+    pipeline = RemoveRestore(
+        base_grid.grid, window_width=window_width, backend="native"
+    )
+
+    # Update grids from file, applied incrementally
+    for fname in update_fnames:
+        assert pipeline.apply(fname) is not None
+    # Progress is logged rather than printed
+    assert capsys.readouterr().out == ""
+    # Update grids held in memory are used without their files
+    for fname in update_fnames:
+        os.remove(fname)
+    assert_allclose(pipeline.merged(), expected_grid.grid)
+
+    # Each merge starts from the base grid as loaded, which is never modified
+    assert_allclose(pipeline.merge([]), load_base_grid(base_fname).grid)
+    assert (base_grid.grid.values == initial_values).all()
+
+    # Update grids held in memory, as grids or xyz points
+    merged = pipeline.merge([update_grids[0].grid, update_grids[1].as_xyz()])
+    assert_allclose(merged, expected_grid.grid, atol=1e-4)
+
+    region = [x0 + 0.005, xm, y0 + 0.005, ym]
+    slices = region_to_slices(expected_grid.grid, region)
+    merged_region = pipeline.merge(update_grids, region=region)
+    assert merged_region.shape == expected_grid.grid[slices].shape
+    assert_allclose(merged_region, expected_grid.grid[slices], atol=1e-4)
+
+    # Returned grids are copies
+    merged_region[:] = 0.0
+    assert_allclose(pipeline.merged(region), expected_grid.grid[slices], atol=1e-4)
+
+
+def test_cached_diff_grid(update_fnames):
+    base_fname = "./test_data/small_sample.nc"
+    cache_dir = "./test_data/cache_temp"
+
+    # The two overlapping update grids
+    update_fnames = update_fnames[:2]
+    update_regions = overlapping_update_regions(base_fname)
+
+    def run(cache):
+        base_grid = load_base_grid(base_fname)
+        keys = []
+        for fname in update_fnames:
+            _, _, diff_grid, key = cached_diff_grid(base_grid, fname, cache=cache)
+            if key is not None:
+                cache.put(key, diff_grid)
+            keys.append(key)
+            if diff_grid is not None:
+                apply_diff_grid(base_grid, diff_grid)
+        return base_grid, keys
+
+    uncached_grid, _ = run(None)
+    first_grid, first_keys = run(DiffCache(cache_dir))
+    second_grid, second_keys = run(DiffCache(cache_dir))
+
+    # Every difference grid is calculated on the first run and reused on the second
+    assert None not in first_keys
+    assert second_keys == [None, None]
+    assert_allclose(first_grid.grid, uncached_grid.grid)
+    assert_allclose(second_grid.grid, uncached_grid.grid)
+
+    # Changing the first update grid invalidates the second, which overlaps it
+    create_update_grid(base_fname, update_fnames[0], update_regions[0], 7.0)
+    _, third_keys = run(DiffCache(cache_dir))
+    assert None not in third_keys
+
+    shutil.rmtree(cache_dir)
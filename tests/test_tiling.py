@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+
+from pycascadia.tiling import (
+    BYTES_PER_CELL,
+    SourceExtent,
+    source_halo,
+    tile_size_from_memory,
+    plan_tiles,
+    split_tile,
+    overlapping_sources,
+    tile_window,
+    plan_tiles_within_memory,
+)
+
+
+def count_coverage(nx, ny, tiles):
+    """Counts how many tiles cover each node."""
+    covered = np.zeros((ny, nx), dtype=int)
+    for tile in tiles:
+        covered[tile["y"], tile["x"]] += 1
+    return covered
+
+
+def test_plan_tiles():
+    nx, ny, tile_size = 10, 7, 4
+    tiles = plan_tiles(nx, ny, tile_size)
+
+    # Tiles cover every node exactly once
+    assert (count_coverage(nx, ny, tiles) == 1).all()
+    assert len(tiles) == 6
+
+
+def test_split_tile():
+    tile = {"x": slice(4, 14), "y": slice(0, 3)}
+    assert split_tile(tile) == [
+        {"x": slice(4, 9), "y": slice(0, 2)},
+        {"x": slice(9, 14), "y": slice(0, 2)},
+        {"x": slice(4, 9), "y": slice(2, 3)},
+        {"x": slice(9, 14), "y": slice(2, 3)},
+    ]
+
+    # Sides are split at multiples, and no further than a multiple
+    assert split_tile(tile, multiple=4) == [
+        {"x": slice(4, 12), "y": slice(0, 3)},
+        {"x": slice(12, 14), "y": slice(0, 3)},
+    ]
+    assert split_tile({"x": slice(0, 1), "y": slice(0, 1)}) == [
+        {"x": slice(0, 1), "y": slice(0, 1)}
+    ]
+
+
+def test_tile_size_from_memory():
+    assert tile_size_from_memory(64 * 100 ** 2, 10) == 80
+
+    with pytest.raises(ValueError):
+        tile_size_from_memory(64 * 100 ** 2, 50)
+
+
+def test_overlapping_sources():
+    spacing = 1.0
+    halo = source_halo(1.0, spacing)
+    region = [0, 10, 0, 10]
+
+    near = SourceExtent("near.nc", [11, 12, 0, 10], 1.0)
+    far = SourceExtent("far.nc", [100, 110, 0, 10], 1.0)
+    # Only within reach of the region once the halo of "near" is accounted for
+    chained = SourceExtent("chained.nc", [10 + 1.5 * halo, 30, 0, 10], 1.0)
+
+    sources, halos = overlapping_sources(region, [near, far, chained], spacing)
+    assert sources == [near, chained]
+    assert halos == [halo, halo]
+
+
+def test_plan_tiles_within_memory():
+    spacing = 1.0
+    x = np.arange(200.0)
+    y = np.arange(150.0)
+    halo = source_halo(1.0, spacing)
+
+    # Several overlapping update grids pad the tiles near them by the sum of their halos
+    sources = [
+        SourceExtent(f"update_{i}.nc", [20 + i, 60 + i, 30, 70], 1.0) for i in range(4)
+    ]
+    memory_budget = BYTES_PER_CELL * 60 ** 2
+    tile_size = tile_size_from_memory(memory_budget, int(np.ceil(halo)))
+
+    def window_bytes(tile):
+        _, _, window = tile_window(x, y, tile, sources)
+        return BYTES_PER_CELL * (window[1] - window[0] + 1) * (window[3] - window[2] + 1)
+
+    # Sized by a single halo, the windows of tiles near the update grids exceed the budget
+    assert max(map(window_bytes, plan_tiles(len(x), len(y), tile_size))) > memory_budget
+
+    tiles = plan_tiles_within_memory(x, y, tile_size, sources, memory_budget)
+    assert (count_coverage(len(x), len(y), tiles) == 1).all()
+    assert max(map(window_bytes, tiles)) <= memory_budget
+
+    # Split tiles stay aligned with multiples of the given number of nodes
+    tiles = plan_tiles_within_memory(x, y, 32, sources, memory_budget, multiple=8)
+    assert (count_coverage(len(x), len(y), tiles) == 1).all()
+    assert max(map(window_bytes, tiles)) <= memory_budget
+    for tile in tiles:
+        for dim, n in [("x", len(x)), ("y", len(y))]:
+            assert tile[dim].start % 8 == 0
+            assert tile[dim].stop % 8 == 0 or tile[dim].stop == n
+
+    # The window of a single node is padded by all of the halos, which may never fit
+    with pytest.raises(ValueError):
+        plan_tiles_within_memory(x, y, tile_size, sources, BYTES_PER_CELL * 30 ** 2)
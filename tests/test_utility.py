@@ -1,11 +1,19 @@
 import pytest
+import os
 
+import numpy as np
+import pandas as pd
 import xarray as xr
 from pycascadia.utility import (
     is_region_valid,
     all_values_are_nodata,
     read_fnames,
+    read_weighted_fnames,
     delete_variable,
+    xr_to_xyz,
+    filter_nodata,
+    snap_region,
+    region_to_slices,
 )
 
 
@@ -39,6 +47,23 @@ def test_read_fnames():
         assert in_fname == true_fname
 
 
+def test_read_weighted_fnames():
+    fname = "./test_data/weighted_filenames_temp.txt"
+    with open(fname, "w") as fp:
+        fp.write("survey_a.nc 2.5\n\nsurvey b.tif\nsurvey_c.zarr\t0.5\n")
+
+    fnames, weights = read_weighted_fnames(fname)
+    os.remove(fname)
+
+    assert fnames == ["survey_a.nc", "survey b.tif", "survey_c.zarr"]
+    assert weights == [2.5, 1.0, 0.5]
+
+    # Lists without weights are read as by read_fnames
+    fnames, weights = read_weighted_fnames("test_data/filenames.txt")
+    assert fnames == read_fnames("test_data/filenames.txt")
+    assert weights == [1.0] * len(fnames)
+
+
 def test_delete_variable():
     fname = "./test_data/contains_extra_var.nc"
     ds = xr.load_dataset(fname)
@@ -53,3 +78,54 @@ def test_delete_variable():
     # Ensure deleting a missing variable throws
     with pytest.raises(ValueError, match=f"Could not find crs in dataset"):
         delete_variable(ds, "crs")
+
+
+def test_xr_to_xyz():
+    grid = xr.DataArray(
+        np.array([[1.0, 9999.0, 3.0], [np.nan, 5.0, 6.0]], dtype="float32"),
+        coords={"y": [10.0, 11.0], "x": [0.0, 0.5, 1.0]},
+        dims=("y", "x"),
+        name="z",
+    )
+
+    # Reference conversion through pandas
+    expected = grid.to_dataframe().reset_index()[["x", "y", "z"]]
+    expected = expected[expected["z"].notna() & (expected["z"] != 9999.0)]
+    expected = expected.reset_index(drop=True)
+
+    xyz_data = xr_to_xyz(grid, nodatavals=[9999.0])
+
+    pd.testing.assert_frame_equal(xyz_data, expected)
+    assert xyz_data["z"].dtype == np.float32
+
+    # Transposed grids give the same points
+    pd.testing.assert_frame_equal(xr_to_xyz(grid.T, nodatavals=[9999.0]), expected)
+
+
+def test_filter_nodata():
+    xyz_data = pd.DataFrame(
+        {"x": [0.0, 1.0, 2.0, 3.0], "y": [0.0, 0.0, 0.0, 0.0], "z": [1.0, 7777.0, np.nan, 9999.0]}
+    )
+    # Points are filtered in place, replacing nodata with NaN
+    assert filter_nodata(xyz_data, [7777.0, 9999.0]) is None
+    assert list(xyz_data["x"].notna()) == [True, False, True, False]
+
+
+def test_snap_region():
+    region = [0.25, 1.75, -0.5, 2.0]
+    assert snap_region(region, [0.0, 0.0], 0.5) == [0.0, 2.0, -0.5, 2.0]
+
+
+def test_region_to_slices():
+    grid = xr.DataArray(
+        np.zeros((5, 11)),
+        coords={"y": np.arange(5) * 0.5, "x": np.arange(11) * 0.1},
+        dims=("y", "x"),
+    )
+    # Bounds are rounded to the nearest node
+    slices = region_to_slices(grid, [0.12, 0.58, 0.7, 10.0])
+    assert slices == {"x": slice(1, 7), "y": slice(1, 5)}
+
+    # Regions outside the grid select nothing
+    slices = region_to_slices(grid, [5.0, 6.0, 0.0, 1.0])
+    assert grid.isel(slices).size == 0
@@ -0,0 +1,134 @@
+import pytest
+import os
+import shutil
+import numpy as np
+import xarray as xr
+import rasterio
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pycascadia.loaders import load_geotiff_window
+from pycascadia.tiling import plan_tiles
+from pycascadia.writers import open_grid_writer, ZarrGridWriter
+
+
+def make_grid(nx=61, ny=31):
+    x = np.linspace(-10, 10, nx)
+    y = np.linspace(40, 50, ny)
+    xx, yy = np.meshgrid(x, y)
+    values = (-1000 * np.sin(xx / 3) * np.cos(yy / 2)).astype("float32")
+    values[5:8, 10:20] = np.nan
+    return x, y, values
+
+
+def write_grid(fname, x, y, values, tile_size=16, **kwargs):
+    with open_grid_writer(fname, x, y, **kwargs) as writer:
+        for tile in plan_tiles(len(x), len(y), tile_size):
+            writer.write(values[tile["y"], tile["x"]], tile)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "zstd"])
+def test_netcdf_writer(compression):
+    fname = "./test_data/writer_temp.nc"
+    x, y, values = make_grid()
+
+    write_grid(fname, x, y, values, chunks=(8, 8), compression=compression)
+
+    with xr.open_dataarray(fname) as saved:
+        assert saved.encoding["chunksizes"] == (8, 8)
+        if compression is not None:
+            assert saved.encoding[compression] is True
+        assert_array_equal(saved.x, x)
+        assert_array_equal(saved.y, y)
+        assert_array_equal(saved.values, values)
+
+    os.remove(fname)
+
+
+def test_netcdf_writer_int16():
+    fname = "./test_data/writer_int16_temp.nc"
+    x, y, values = make_grid()
+    scale_factor = 0.5
+
+    write_grid(fname, x, y, values, dtype="int16", scale_factor=scale_factor)
+
+    with xr.open_dataarray(fname) as saved:
+        assert saved.encoding["dtype"] == np.int16
+        assert_allclose(saved.values, values, atol=scale_factor / 2)
+        assert np.array_equal(np.isnan(saved.values), np.isnan(values))
+
+    with pytest.raises(ValueError):
+        write_grid(fname, x, y, 1000 * values, dtype="int16", scale_factor=scale_factor)
+
+    os.remove(fname)
+
+
+def test_cog_writer():
+    fname = "./test_data/writer_temp.tif"
+    x, y, values = make_grid(601, 301)
+
+    write_grid(fname, x, y, values, chunks=(256, 256), compression="zlib", tile_size=100)
+
+    with rasterio.open(fname) as src:
+        assert src.profile["tiled"]
+        assert src.profile["blockxsize"] == 256
+        assert src.overviews(1)[0] == 2
+        assert src.compression.name.lower() == "deflate"
+
+    saved = load_geotiff_window(fname)
+    assert_allclose(saved.x, x, atol=1e-9)
+    assert_allclose(saved.y, y)
+    assert_array_equal(saved.values, values)
+
+    # Coarser grids are read from the overview
+    spacing = 2.5 * (x[1] - x[0])
+    overview = load_geotiff_window(fname, spacing=spacing)
+    assert overview.shape == (len(y) // 2, len(x) // 2)
+
+    os.remove(fname)
+
+
+def test_cog_writer_crs():
+    fname = "./test_data/writer_crs_temp.tif"
+    x, y, values = make_grid()
+
+    # Grids without a CRS are written without one
+    write_grid(fname, x, y, values)
+    with rasterio.open(fname) as src:
+        assert src.crs is None
+
+    write_grid(fname, x, y, values, attrs={"crs": "EPSG:32610"})
+    with rasterio.open(fname) as src:
+        assert src.crs.to_epsg() == 32610
+
+    # Options of other formats are rejected rather than ignored
+    with pytest.raises(TypeError, match="scale_factor"):
+        write_grid(fname, x, y, values, scale_factor=0.5)
+
+    os.remove(fname)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int16"])
+def test_zarr_writer(dtype):
+    pytest.importorskip("zarr")
+    fname = "./test_data/writer_temp.zarr"
+    x, y, values = make_grid()
+    scale_factor = 0.5
+
+    writer = open_grid_writer(
+        fname, x, y, chunks=(8, 8), compression="zstd", dtype=dtype, scale_factor=scale_factor
+    )
+    assert isinstance(writer, ZarrGridWriter)
+
+    # Tiles aligned with the chunks may be written through separately opened writers
+    for tile in plan_tiles(len(x), len(y), 16):
+        ZarrGridWriter.open_existing(fname).write(values[tile["y"], tile["x"]], tile)
+
+    with xr.open_dataarray(fname, engine="zarr") as saved:
+        assert saved.encoding["chunks"] == (8, 8)
+        assert saved.encoding["dtype"] == np.dtype(dtype)
+        assert_array_equal(saved.x, x)
+        assert_array_equal(saved.y, y)
+        assert_allclose(saved.values, values, atol=scale_factor / 2 if dtype == "int16" else 0)
+        assert np.array_equal(np.isnan(saved.values), np.isnan(values))
+
+    shutil.rmtree(fname)